@@ -0,0 +1,118 @@
+"""
+Admission control under overload.
+Updates are ranked into classes, most important first:
+admin (any update of an admin), ticket (messages of users: support
+questions and ticket replies), default (other buttons), navigation
+(view-only buttons, see CallbackRouter navigation routes).
+
+Load is the number of updates waiting for a concurrency slot (not behind
+their own user's lock, so one flooding user does not shed others) and the
+event loop lag. Above max_depth or max_lag navigation is shed; above twice the limits
+default buttons are shed too. Admin and ticket updates are never shed,
+admin updates also skip the queue for concurrency slots.
+Shed callback queries get a "busy" toast.
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+
+from telegram import Update
+from telegram.error import TelegramError
+
+from metrics import metrics
+from texts import get_text
+
+logger = logging.getLogger(__name__)
+
+ADMIN = 'admin'
+TICKET = 'ticket'
+DEFAULT = 'default'
+NAVIGATION = 'navigation'
+# Lowest overload level at which class is shed
+_SHED_LEVEL = {NAVIGATION: 1, DEFAULT: 2}
+
+class AdmissionController:
+    def __init__(self, depth: Callable[[], int], max_depth: int = 200, max_lag: float = 0.5,
+                 is_admin: Optional[Callable[[int], bool]] = None,
+                 is_navigation: Optional[Callable[[Optional[str]], bool]] = None,
+                 lang: Callable[[int], str] = lambda user_id: 'ru', lag_interval: float = 0.25):
+        """depth() returns number of updates waiting for processing"""
+        self.depth = depth
+        self.max_depth = max_depth
+        self.max_lag = max_lag
+        self.is_admin = is_admin
+        self.is_navigation = is_navigation
+        self.lang = lang
+        self.lag_interval = lag_interval
+        self.lag = 0.0
+        self.shed: Dict[str, int] = {NAVIGATION: 0, DEFAULT: 0}
+        self._task: Optional[asyncio.Task] = None
+
+    def classify(self, update: object) -> str:
+        if not isinstance(update, Update):
+            return DEFAULT
+        user = update.effective_user
+        if user and self.is_admin and self.is_admin(user.id):
+            return ADMIN
+        if update.callback_query:
+            if self.is_navigation and self.is_navigation(update.callback_query.data):
+                return NAVIGATION
+            return DEFAULT
+        if update.message:
+            return TICKET
+        return DEFAULT
+
+    def is_priority(self, update: object) -> bool:
+        """Admin updates are processed without waiting for a concurrency slot"""
+        return self.classify(update) == ADMIN
+
+    def overload_level(self) -> int:
+        """0 - normal, 1 - over limits, 2 - over twice the limits"""
+        load = max(self.depth() / self.max_depth if self.max_depth else 0.0,
+                   self.lag / self.max_lag if self.max_lag else 0.0)
+        return 2 if load >= 2 else 1 if load >= 1 else 0
+
+    def admit(self, update: object) -> bool:
+        """False if update should be shed"""
+        update_class = self.classify(update)
+        shed_level = _SHED_LEVEL.get(update_class)
+        if shed_level is None or self.overload_level() < shed_level:
+            return True
+        self.shed[update_class] += 1
+        metrics.incr(f'admission.shed.{update_class}')
+        return False
+
+    async def reject(self, update: object):
+        """Tell the user that the bot is busy"""
+        query = getattr(update, 'callback_query', None)
+        if not query:
+            return
+        try:
+            await query.answer(get_text('server_busy', self.lang(query.from_user.id)))
+        except TelegramError as e:
+            logger.warning(f"Failed to answer shed callback: {e}")
+
+    async def _measure_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self.lag = max(0.0, loop.time() - started - self.lag_interval)
+            metrics.set_gauge('admission.loop_lag', self.lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._measure_lag())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {'depth': self.depth(), 'lag': round(self.lag, 3), 'level': self.overload_level(), 'shed': dict(self.shed)}
@@ -0,0 +1,139 @@
+"""
+Retry, backoff and circuit breaking for Bot API calls.
+Used by the outbound dispatcher, so every method gets the same handling:
+- RetryAfter: wait the time Telegram asks for, then retry
+- TimedOut / NetworkError: exponential backoff with jitter
+- repeated transient failures open the circuit, calls fail fast until it cools down
+"""
+
+import asyncio
+import logging
+import random
+import time
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Dict
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(TelegramError):
+    """Raised instead of calling the API while circuit is open"""
+    def __init__(self, retry_in: float):
+        super().__init__(f"Bot API circuit is open, retry in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Get retry_after as seconds (int in older PTB, timedelta in newer)"""
+    value = error.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+def is_transient(error: Exception) -> bool:
+    """Timeouts and network errors are worth retrying, bad requests are not"""
+    return isinstance(error, NetworkError) and not isinstance(error, BadRequest)
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures, half-opens after reset_timeout"""
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self):
+        """Raise CircuitOpenError if calls are not allowed now"""
+        state = self.state
+        if state == 'open':
+            metrics.incr('api.circuit_rejected')
+            raise CircuitOpenError(self.reset_timeout - (time.monotonic() - self.opened_at))
+        if state == 'half_open':
+            # Let a single trial call through
+            if self._trial_running:
+                metrics.incr('api.circuit_rejected')
+                raise CircuitOpenError(1.0)
+            self._trial_running = True
+
+    def record_neutral(self):
+        """Call finished with error that says nothing about API health"""
+        self._trial_running = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("Bot API circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                logger.error(f"Bot API circuit opened after {self.failures} failures")
+                metrics.incr('api.circuit_opened')
+            self.opened_at = time.monotonic()
+
+class RetryPolicy:
+    """Retry wrapper for Bot API calls"""
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 10,
+                 max_retry_after: float = 60, breaker: CircuitBreaker = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.breaker = breaker or CircuitBreaker()
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter exponential backoff"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call(self, callback: Callable[..., Coroutine[Any, Any, Any]], args: Any,
+                   kwargs: Dict[str, Any], endpoint: str, on_retry_after: Callable[[float], None] = None):
+        """Call API method applying retry policy"""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                # Flood control is not an outage: do not count it as failure
+                self.breaker.record_neutral()
+                delay = retry_after_seconds(e)
+                metrics.incr('api.retry_after')
+                attempt += 1
+                if attempt >= self.max_attempts or delay > self.max_retry_after:
+                    raise
+                logger.warning(f"{endpoint}: rate limited, retrying in {delay}s")
+                if on_retry_after:
+                    on_retry_after(delay)
+                await asyncio.sleep(delay)
+                continue
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.record_neutral()
+                    raise
+                self.breaker.record_failure()
+                metrics.incr('api.transient_error')
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    logger.error(f"{endpoint}: giving up after {attempt} attempts: {e}")
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(f"{endpoint}: {e}, retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
@@ -0,0 +1,131 @@
+"""
+Tracked background tasks for long operations (package downloads etc.).
+The callback handler returns immediately; the job runs as asyncio task with:
+- one progress message edited in place, with a cancel button (task_cancel_<id>)
+- per-user de-duplication by kind (second tap does not start a second run)
+- cap on concurrently running tasks, the rest wait in queue
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram.error import TelegramError
+
+from keyboards import task_progress_keyboard
+from metrics import metrics
+from texts import get_text
+
+logger = logging.getLogger(__name__)
+
+# job(progress) where progress(done, total) is awaitable
+Job = Callable[[Callable[[int, int], Awaitable[None]]], Awaitable[None]]
+
+class BackgroundTask:
+    def __init__(self, task_id: int, user_id: int, chat_id: int, kind: str, title: str, lang: str):
+        self.id = task_id
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.kind = kind
+        self.title = title
+        self.lang = lang
+        self.message_id = None
+        self.task: Optional[asyncio.Task] = None
+        self.last_edit = 0.0
+
+class TaskManager:
+    def __init__(self, max_running: int = 4, max_queued: int = 50, progress_interval: float = 2.0):
+        self.max_queued = max_queued
+        self.progress_interval = progress_interval
+        self._semaphore = asyncio.Semaphore(max_running)
+        self._ids = itertools.count(1)
+        self._tasks: Dict[int, BackgroundTask] = {}
+        self._by_user: Dict[Tuple[int, str], int] = {}
+
+    def get_user_task(self, user_id: int, kind: str) -> Optional[BackgroundTask]:
+        task_id = self._by_user.get((user_id, kind))
+        return self._tasks.get(task_id) if task_id else None
+
+    async def start(self, bot, user_id: int, chat_id: int, kind: str, title: str,
+                    job: Job, lang: str = 'ru') -> Optional[BackgroundTask]:
+        """Start job in background. Returns None if user already runs this kind
+        of task or queue is full."""
+        if self.get_user_task(user_id, kind):
+            metrics.incr('tasks.duplicate')
+            return None
+        if len(self._tasks) >= self.max_queued:
+            metrics.incr('tasks.rejected')
+            return None
+
+        task = BackgroundTask(next(self._ids), user_id, chat_id, kind, title, lang)
+        self._tasks[task.id] = task
+        self._by_user[(user_id, kind)] = task.id
+        metrics.set_gauge('tasks.active', len(self._tasks))
+        try:
+            message = await bot.send_message(
+                chat_id=chat_id,
+                text=get_text('task_queued', lang, title=title),
+                reply_markup=task_progress_keyboard(task.id, lang)
+            )
+            task.message_id = message.message_id
+        except TelegramError as e:
+            logger.error(f"Failed to send progress message for task {task.id}: {e}")
+        task.task = asyncio.create_task(self._run(bot, task, job))
+        return task
+
+    def cancel(self, task_id: int, user_id: int) -> bool:
+        """Cancel task of user, return False if there is no such running task"""
+        task = self._tasks.get(task_id)
+        if not task or task.user_id != user_id or not task.task:
+            return False
+        task.task.cancel()
+        return True
+
+    async def _edit(self, bot, task: BackgroundTask, text: str, with_cancel: bool = True):
+        if not task.message_id:
+            return
+        try:
+            await bot.edit_message_text(
+                chat_id=task.chat_id,
+                message_id=task.message_id,
+                text=text,
+                reply_markup=task_progress_keyboard(task.id, task.lang) if with_cancel else None
+            )
+            task.last_edit = time.monotonic()
+        except TelegramError as e:
+            logger.warning(f"Failed to update progress of task {task.id}: {e}")
+
+    async def _run(self, bot, task: BackgroundTask, job: Job):
+        started = time.monotonic()
+        try:
+            async with self._semaphore:
+                metrics.observe('tasks.queue_wait', time.monotonic() - started)
+
+                async def progress(done: int, total: int):
+                    # Throttle edits, always show final state
+                    if done < total and time.monotonic() - task.last_edit < self.progress_interval:
+                        return
+                    await self._edit(bot, task, get_text('task_progress', task.lang,
+                                                         title=task.title, done=done, total=total))
+
+                await self._edit(bot, task, get_text('task_running', task.lang, title=task.title))
+                await job(progress)
+            await self._edit(bot, task, get_text('task_done', task.lang, title=task.title), with_cancel=False)
+            metrics.incr('tasks.done')
+        except asyncio.CancelledError:
+            await self._edit(bot, task, get_text('task_cancelled', task.lang, title=task.title), with_cancel=False)
+            metrics.incr('tasks.cancelled')
+        except Exception as e:
+            logger.error(f"Background task {task.id} ({task.kind}) failed: {e}")
+            await self._edit(bot, task, get_text('task_failed', task.lang, title=task.title), with_cancel=False)
+            metrics.incr('tasks.failed')
+        finally:
+            self._tasks.pop(task.id, None)
+            if self._by_user.get((task.user_id, task.kind)) == task.id:
+                del self._by_user[(task.user_id, task.kind)]
+            metrics.set_gauge('tasks.active', len(self._tasks))
+            metrics.observe(f'tasks.{task.kind}', time.monotonic() - started)
+
+task_manager = TaskManager()
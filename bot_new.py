@@ -1,3 +1,4 @@
+import html
 import logging
 import math
 import signal
@@ -5,22 +6,48 @@ import sys
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, MessageHandler,
-    ContextTypes, filters
+    TypeHandler, ContextTypes, filters
 )
 from telegram.error import TelegramError, Conflict
 import asyncio
 from datetime import datetime, timedelta
+from urllib.parse import urlparse
 # from aiohttp import web  # Not needed anymore - using built-in http.server
 import threading
 import time
+from typing import List
 # Import our modules
-from config import BOT_TOKEN, ADMIN_CHAT_IDS, MODE, WEBHOOK_URL
-from models import create_tables, get_session, InstructionType, TicketStatus, MessageRole, FileType
-from services.models_service import ModelsService
+from config import (
+    BOT_TOKEN, ADMIN_CHAT_IDS, MODE, WEBHOOK_URL, SEARCH_RESULTS_LIMIT, PACKAGE_MODE,
+    RATE_LIMIT_BACKEND, RATE_LIMIT_URL, UPDATE_CONCURRENCY, UPDATE_QUEUE_SIZE, PORT, WEBHOOK_SECRET, METRICS_TOKEN,
+    UPDATE_DEDUP_WINDOW, UPDATE_DEDUP_PERSIST, STATE_BACKEND, STATE_URL, STATE_TTL,
+    FLOOD_RATE, FLOOD_BURST, ADMISSION_MAX_DEPTH, ADMISSION_MAX_LAG, HANDLER_TIMEOUT, SLOW_HANDLER_TIMEOUT
+)
+from models import get_session, InstructionType, TicketStatus, MessageRole, FileType
+from services.models_service import ModelsService, normalize_code
 from services.files_service import FilesService
 from services.support_service import SupportService
 from services.instructions_service import InstructionsService
 from services.recipes_service import RecipesService
+from services.tags_service import TagsService
+from services.catalog_service import CatalogService
+from services.outbox_service import OutboxService
+from migrate import run_migrations
+from search_cache import search_cache, search_tokens, normalize_query
+from metrics import metrics
+from outbound import OutboundDispatcher
+from rate_limit_backends import create_bucket_backend
+from update_processor import PerUserUpdateProcessor
+from webhook_server import WebhookServer
+from update_dedup import UpdateDeduplicator
+from callback_router import CallbackRouter, HandlerTimeout
+from state_store import StateStore, UserState, create_state_backend
+from flood_control import Debouncer, FloodControl
+from admission import AdmissionController
+from notifications import notify_admins
+from outbox import outbox_sender
+from packages import send_package, send_package_zip
+from background_tasks import task_manager
 from keyboards import *
 from texts import get_text
 # Setup logging
@@ -29,45 +56,17 @@ logging.basicConfig(
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
-# User states for conversation flows
-user_states = {}
+# User states for conversation flows (persisted, see state_store)
+user_states = StateStore(create_state_backend(STATE_BACKEND, STATE_URL), ttl=STATE_TTL)
 # Debounce tracking for rapid button clicks
-debounce_tracker = {}
-class UserState:
-    def __init__(self, state: str, data: dict = None):
-        self.state = state
-        self.data = data or {}
-
-def is_debounced(user_id: int, callback_data: str, debounce_time: float = 0.5) -> bool:
-    """Check if callback is debounced (too recent)"""
-    current_time = time.time()
-    key = f"{user_id}_{callback_data}"
-    
-    if key in debounce_tracker:
-        if current_time - debounce_tracker[key] < debounce_time:
-            return True
-    
-    debounce_tracker[key] = current_time
-    return False
-
+debouncer = Debouncer(window=0.5)
 async def safe_send_message(bot, chat_id: int, text: str, **kwargs):
-    """Send message with RetryAfter handling"""
+    """Send message, logging failures (retries are done by the outbound dispatcher)"""
     try:
         await bot.send_message(chat_id=chat_id, text=text, **kwargs)
     except TelegramError as e:
-        if "RetryAfter" in str(e):
-            retry_after = getattr(e, 'retry_after', 1)
-            logger.warning(f"Rate limited, waiting {retry_after + 0.3} seconds")
-            await asyncio.sleep(retry_after + 0.3)
-            # Retry once
-            try:
-                await bot.send_message(chat_id=chat_id, text=text, **kwargs)
-            except TelegramError as retry_error:
-                logger.error(f"Failed to send message after retry: {retry_error}")
-                raise retry_error
-        else:
-            logger.error(f"Failed to send message: {e}")
-            raise e
+        logger.error(f"Failed to send message to {chat_id}: {e}")
+        raise
 # Global variables for graceful shutdown
 shutdown_event = threading.Event()
 application_instance = None
@@ -210,233 +209,30 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
     
     # Check for debounce (rapid repeated clicks)
-    if is_debounced(user.id, data):
+    if debouncer.is_repeat(user.id, data):
         logger.info(f"Debounced callback from user {user.id}: {data}")
         return
     
     try:
         logger.info(f"Button callback from user {user.id}: {data}")
-        # Main menu
-        if data == 'main_menu':
-            await query.edit_message_text(
-
-                get_text('main_menu', lang),
-                reply_markup=main_menu_keyboard(lang)
-            )
-        # Models
-        elif data == 'choose_model':
-            await handle_choose_model(query, lang)
-        elif data == 'models_list':
-            await handle_models_list(query, lang)
-        elif data.startswith('models_page_'):
-            page = int(data.split('_')[2])
-            await handle_models_page(query, page, lang)
-        elif data.startswith('model_'):
-            model_id = int(data.split('_')[1])
-            logger.info(f"Model button clicked: callback_data='{data}', model_id={model_id}")
-            await handle_model_selected(query, model_id, lang)
-        # Instructions
-        elif data == 'instructions':
-            await handle_instructions(query, lang)
-        elif data.startswith('instructions_'):
-            model_id = int(data.split('_')[1])
-            await handle_model_instructions(query, model_id, lang)
-        elif data.startswith('instruction_'):
-            instruction_id = int(data.split('_')[1])
-            await handle_instruction_selected(query, context, instruction_id, lang)
-        elif data.startswith('package_'):
-            model_id = int(data.split('_')[1])
-            await handle_download_package(query, context, model_id, lang)
-        # Recipes
-        elif data == 'recipes':
-            await handle_recipes(query, lang)
-        elif data.startswith('recipes_'):
-            model_id = int(data.split('_')[1])
-            await handle_model_recipes(query, model_id, lang)
-        elif data.startswith('recipe_'):
-            recipe_id = int(data.split('_')[1])
-            await handle_recipe_selected(query, context, recipe_id, lang)
-        elif data.startswith('recipes_package_'):
-            model_id = int(data.split('_')[2])
-            await handle_download_recipes_package(query, context, model_id, lang)
-        # Support
-        elif data == 'support':
-            await handle_support(query, lang)
-        elif data.startswith('support_model_'):
-            model_id = int(data.split('_')[2])
-            await handle_support_model(query, model_id, lang)
-        elif data == 'my_tickets':
-            await handle_my_tickets(query, lang)
-        elif data.startswith('ticket_'):
-            ticket_id = int(data.split('_')[1])
-            await handle_ticket_details(query, ticket_id, lang)
-        elif data.startswith('user_ticket_message_'):
-            ticket_id = int(data.split('_')[3])
-            await handle_user_ticket_message(query, ticket_id, lang)
-        elif data.startswith('user_ticket_close_'):
-            ticket_id = int(data.split('_')[3])
-            await handle_user_ticket_close(query, ticket_id, lang)
-        # Search
-        elif data == 'search_model':
-            await handle_search_model(query, lang)
-        # Admin
-        elif data == 'admin':
-            await handle_admin_menu(query, lang)
-        elif data == 'admin_models':
-            await handle_admin_models(query, lang)
-        elif data == 'admin_instructions':
-            await handle_admin_instructions(query, lang)
-        elif data == 'admin_recipes':
-            await handle_admin_recipes(query, lang)
-        elif data == 'admin_tickets':
-            await handle_admin_tickets(query, lang)
-        elif data == 'admin_settings':
-            await handle_admin_settings(query, lang)
-        # Admin - Models
-        elif data == 'admin_add_model':
-            await handle_admin_add_model(query, lang)
-        elif data == 'admin_edit_model':
-            await handle_admin_edit_model(query, lang)
-        elif data.startswith('admin_edit_model_'):
-            model_id = int(data.split('_')[3])
-            await handle_admin_edit_model_by_id(query, model_id, lang)
-        elif data == 'admin_delete_model':
-            await handle_admin_delete_model(query, lang)
-        elif data.startswith('admin_delete_model_'):
-            model_id = int(data.split('_')[3])
-            await handle_admin_delete_model_by_id(query, model_id, lang)
-        elif data.startswith('confirm_delete_model_'):
-            model_id = int(data.split('_')[3])
-            await handle_confirm_delete_model(query, model_id, lang)
-        # Admin - Instructions
-        elif data == 'admin_add_instruction':
-            await handle_admin_add_instruction(query, lang)
-        elif data == 'admin_list_instructions':
-            await handle_admin_list_instructions(query, lang)
-        elif data.startswith('admin_instruction_'):
-            instruction_id = int(data.split('_')[2])
-            await handle_admin_instruction_management(query, instruction_id, lang)
-        elif data.startswith('bind_instruction_'):
-            instruction_id = int(data.split('_')[2])
-            await handle_bind_instruction_to_models(query, instruction_id, lang)
-        elif data.startswith('unbind_instruction_'):
-            instruction_id = int(data.split('_')[2])
-            await handle_unbind_instruction_from_models(query, instruction_id, lang)
-        elif data.startswith('select_model_'):
-            parts = data.split('_')
-            model_id = int(parts[2])
-            instruction_id = int(parts[3])
-            action = parts[4]
-            await handle_model_selection_for_instruction(query, model_id, instruction_id, action, lang)
-        elif data.startswith('confirm_bind_instruction_'):
-            instruction_id = int(data.split('_')[3])
-            await handle_confirm_bind_instruction(query, instruction_id, lang)
-        elif data.startswith('confirm_unbind_instruction_'):
-            instruction_id = int(data.split('_')[3])
-            await handle_confirm_unbind_instruction(query, instruction_id, lang)
-        # Admin - Recipes
-        elif data == 'admin_add_recipe':
-            await handle_admin_add_recipe(query, lang)
-        elif data == 'admin_list_recipes':
-            await handle_admin_list_recipes(query, lang)
-        elif data.startswith('admin_recipe_'):
-            recipe_id = int(data.split('_')[2])
-            await handle_admin_recipe_management(query, recipe_id, lang)
-        elif data.startswith('bind_recipe_'):
-            recipe_id = int(data.split('_')[2])
-            await handle_bind_recipe_to_models(query, recipe_id, lang)
-        elif data.startswith('unbind_recipe_'):
-            recipe_id = int(data.split('_')[2])
-            await handle_unbind_recipe_from_models(query, recipe_id, lang)
-        elif data.startswith('confirm_bind_recipe_'):
-            recipe_id = int(data.split('_')[3])
-            await handle_confirm_bind_recipe(query, recipe_id, lang)
-        elif data.startswith('confirm_unbind_recipe_'):
-            recipe_id = int(data.split('_')[3])
-            await handle_confirm_unbind_recipe(query, recipe_id, lang)
-        elif data.startswith('model_selection_recipe_'):
-            parts = data.split('_')
-            model_id = int(parts[3])
-            recipe_id = int(parts[4])
-            action = parts[5]
-            await handle_model_selection_for_recipe(query, model_id, recipe_id, action, lang)
-        # New instruction creation flow
-        elif data.startswith('bind_model_'):
-            parts = data.split('_')
-            model_id = int(parts[2])
-            await handle_bind_model_to_new_instruction(query, model_id, lang)
-        elif data.startswith('unbind_model_'):
-            parts = data.split('_')
-            model_id = int(parts[2])
-            await handle_unbind_model_from_new_instruction(query, model_id, lang)
-        elif data == 'confirm_create_instruction':
-            await handle_confirm_create_instruction(query, lang)
-        elif data == 'save_instruction':
-            await handle_save_instruction(query, lang)
-        # New recipe creation flow
-        elif data.startswith('bind_recipe_model_'):
-            parts = data.split('_')
-            model_id = int(parts[3])
-            await handle_bind_recipe_model_to_new_recipe(query, model_id, lang)
-        elif data.startswith('unbind_recipe_model_'):
-            parts = data.split('_')
-            model_id = int(parts[3])
-            await handle_unbind_recipe_model_from_new_recipe(query, model_id, lang)
-        elif data == 'confirm_create_recipe':
-            await handle_confirm_create_recipe(query, lang)
-        elif data == 'save_recipe':
-            await handle_save_recipe(query, lang)
-        elif data == 'continue_master':
-            await handle_continue_master(query, lang)
-        elif data == 'exit_master':
-            await handle_exit_master(query, lang)
-        # Admin - Tickets
-        elif data == 'admin_open_tickets':
-            await handle_admin_open_tickets(query, lang)
-        elif data == 'admin_ticket_stats':
-            await handle_admin_ticket_stats(query, lang)
-        elif data.startswith('admin_ticket_'):
-            ticket_id = int(data.split('_')[2])
-            await handle_admin_ticket_view(query, ticket_id, lang)
-        elif data.startswith('admin_reply_ticket_'):
-            ticket_id = int(data.split('_')[3])
-            await handle_admin_reply_ticket(query, ticket_id, lang)
-        elif data.startswith('admin_ticket_in_progress_'):
-            ticket_id = int(data.split('_')[3])
-            await handle_admin_ticket_in_progress(query, ticket_id, lang)
-        elif data.startswith('admin_ticket_close_'):
-            ticket_id = int(data.split('_')[3])
-            await handle_admin_ticket_close(query, ticket_id, lang)
-        # Instruction/Recipe type selection
-        elif data.startswith('type_'):
-            instruction_type = data.split('_')[1]
-            await handle_instruction_type_selection(query, instruction_type, lang)
-        # Confirmation dialogs
-        elif data.startswith('confirm_'):
-            action = data.split('_', 1)[1]
-            await handle_confirmation(query, action, lang)
-        elif data.startswith('cancel_'):
-            action = data.split('_', 1)[1]
-            await handle_cancellation(query, action, lang)
-        # Back step
-        elif data == 'back_step':
-            await handle_back_step(query, lang)
-        # Cancel
-        elif data == 'cancel':
-            # Clear user state
-            if query.from_user.id in user_states:
-                del user_states[query.from_user.id]
-            # Return to appropriate menu based on user type
-            if is_admin(query.from_user.id):
+        if not await callback_router.dispatch(data, query, context, lang):
+            logger.info(f"No route for callback data: {data}")
+    except HandlerTimeout as e:
+        logger.warning(f"{e} (user {user.id})")
+        try:
+            # Repeating a changing action could apply it twice: offer Retry for views only
+            if e.navigation:
                 await query.edit_message_text(
-                    get_text('admin_menu', lang),
-                    reply_markup=admin_menu_keyboard(lang)
+                    get_text('request_timeout', lang),
+                    reply_markup=retry_keyboard(data, lang)
                 )
             else:
                 await query.edit_message_text(
-                    get_text('main_menu', lang),
+                    get_text('request_timeout_check', lang),
                     reply_markup=main_menu_keyboard(lang)
                 )
+        except TelegramError as edit_error:
+            logger.error(f"Failed to show timeout message to {user.id}: {edit_error}")
     except Exception as e:
         logger.error(f"Error in button_callback: {e}")
         logger.error(f"User ID: {user.id}")
@@ -513,6 +309,118 @@ async def handle_models_page(query, page: int, lang: str):
         )
     finally:
 
+        db.close()
+async def handle_catalog_root(query, lang: str):
+    """Handle catalog tree root"""
+    db = get_session()
+    try:
+
+        catalog_service = CatalogService(db)
+        categories = catalog_service.get_children(None)
+        if not categories:
+            # No tree yet - fall back to the flat list
+            await handle_choose_model(query, lang)
+            return
+        await query.edit_message_text(
+            get_text('catalog_root', lang),
+            reply_markup=catalog_keyboard(None, categories, [], 0, 0, lang)
+        )
+    finally:
+
+        db.close()
+async def handle_catalog_node(query, category_id: int, page: int, lang: str):
+    """Handle catalog tree node: subcategories and models attached to it"""
+    db = get_session()
+    try:
+
+        catalog_service = CatalogService(db)
+        category = catalog_service.get_category_by_id(category_id)
+        if not category:
+            await handle_catalog_root(query, lang)
+            return
+        children = catalog_service.get_children(category_id)
+        total_count = catalog_service.get_category_models_count(category_id)
+        total_pages = math.ceil(total_count / 10)
+        if page >= total_pages and total_pages > 0:
+            page = total_pages - 1
+        models = catalog_service.get_category_models(category_id, page=max(page, 0), limit=10)
+        breadcrumbs = " / ".join(c.name for c in catalog_service.get_breadcrumbs(category))
+        await query.edit_message_text(
+            get_text('catalog_node', lang, path=breadcrumbs),
+            reply_markup=catalog_keyboard(category, children, models, max(page, 0), total_pages, lang)
+        )
+    finally:
+
+        db.close()
+async def handle_catalog_subtree(query, category_id: int, page: int, lang: str):
+    """Handle all models of a catalog subtree"""
+    db = get_session()
+    try:
+
+        catalog_service = CatalogService(db)
+        category = catalog_service.get_category_by_id(category_id)
+        if not category:
+            await handle_catalog_root(query, lang)
+            return
+        total_count = catalog_service.get_subtree_models_count(category)
+        total_pages = math.ceil(total_count / 10)
+        if page >= total_pages and total_pages > 0:
+            page = total_pages - 1
+        models = catalog_service.get_subtree_models(category, page=max(page, 0), limit=10)
+        breadcrumbs = " / ".join(c.name for c in catalog_service.get_breadcrumbs(category))
+        await query.edit_message_text(
+            get_text('catalog_subtree', lang, path=breadcrumbs, count=total_count),
+            reply_markup=catalog_subtree_keyboard(models, category, max(page, 0), total_pages, lang)
+        )
+    finally:
+
+        db.close()
+async def handle_tags(query, page: int, lang: str):
+    """Handle tag facets list"""
+    db = get_session()
+    try:
+
+        tags_service = TagsService(db)
+        total_count = tags_service.get_tags_count()
+        total_pages = math.ceil(total_count / 10)
+        if page >= total_pages and total_pages > 0:
+            page = total_pages - 1
+        tags = tags_service.get_tags_with_counts(page=max(page, 0), limit=10)
+        if not tags:
+            await query.edit_message_text(
+                get_text('no_tags', lang),
+                reply_markup=main_menu_keyboard(lang)
+            )
+            return
+        await query.edit_message_text(
+            get_text('tags_list', lang),
+            reply_markup=tags_keyboard(tags, max(page, 0), total_pages, lang)
+        )
+    finally:
+
+        db.close()
+async def handle_tag_models(query, tag_id: int, page: int, lang: str):
+    """Handle models page within a tag"""
+    db = get_session()
+    try:
+
+        tags_service = TagsService(db)
+        tag = tags_service.get_tag_by_id(tag_id)
+        if not tag:
+            await handle_tags(query, 0, lang)
+            return
+        total_count = tags_service.get_models_by_tag_count(tag_id)
+        total_pages = math.ceil(total_count / 10)
+        if page >= total_pages and total_pages > 0:
+            page = total_pages - 1
+        models = tags_service.get_models_by_tag(tag_id, page=max(page, 0), limit=10)
+        await query.edit_message_text(
+            get_text('tag_models', lang, tag=html.escape(tag.name), count=total_count),
+            reply_markup=tag_models_keyboard(models, tag_id, max(page, 0), total_pages, lang),
+            parse_mode='HTML'
+        )
+    finally:
+
         db.close()
 async def handle_model_selected(query, model_id: int, lang: str):
     """Handle model selection"""
@@ -538,35 +446,59 @@ async def handle_model_selected(query, model_id: int, lang: str):
                 reply_markup=main_menu_keyboard(lang)
             )
             return
-        description = model.description or ""
-        tags = f"\n{get_text('model_tags', lang, tags=model.tags)}" if model.tags else ""
-        # Get instructions for this model
-        instructions_service = InstructionsService(db)
-        instructions = instructions_service.get_instructions_by_model_id(model_id)
-        # Build instructions text
-        instructions_text = ""
-        if instructions:
-            instructions_text = "\n\n📄 Доступные инструкции:\n"
-            for i, instruction in enumerate(instructions, 1):
-                if instruction.type == InstructionType.PDF:
-                    icon = "📎"
-                elif instruction.type == InstructionType.VIDEO:
-                    icon = "🎬"
-                elif instruction.type == InstructionType.LINK:
-                    icon = "🔗"
-                else:
-                    icon = "📄"
-                instructions_text += f"{i}. {icon} {instruction.title}\n"
-        else:
-            instructions_text = "\n\n📄 Инструкции: Пока не добавлены"
         await query.edit_message_text(
-
-            get_text('model_selected', lang, name=model.name, description=description) + tags + instructions_text,
+            build_model_card_text(db, model, lang),
             reply_markup=model_options_keyboard(model_id, lang),
             parse_mode='HTML'
         )
     finally:
 
+        db.close()
+def build_model_card_text(db, model, lang: str) -> str:
+    """Build model card text with the list of available instructions"""
+    description = model.description or ""
+    tags = f"\n{get_text('model_tags', lang, tags=model.tags)}" if model.tags else ""
+    # Get instructions for this model
+    instructions_service = InstructionsService(db)
+    instructions = instructions_service.get_instructions_by_model_id(model.id)
+    # Build instructions text
+    instructions_text = ""
+    if instructions:
+        instructions_text = "\n\n📄 Доступные инструкции:\n"
+        for i, instruction in enumerate(instructions, 1):
+            if instruction.type == InstructionType.PDF:
+                icon = "📎"
+            elif instruction.type == InstructionType.VIDEO:
+                icon = "🎬"
+            elif instruction.type == InstructionType.LINK:
+                icon = "🔗"
+            else:
+                icon = "📄"
+            instructions_text += f"{i}. {icon} {instruction.title}\n"
+    else:
+        instructions_text = "\n\n📄 Инструкции: Пока не добавлены"
+    return get_text('model_selected', lang, name=model.name, description=description) + tags + instructions_text
+async def reply_with_model_by_code(update: Update, lang: str) -> bool:
+    """Open model card if the message is a known marketplace article/SKU.
+    Returns True if the code was recognized."""
+    if not update.message or not update.message.text or not normalize_code(update.message.text):
+        return False
+    db = get_session()
+    try:
+
+        models_service = ModelsService(db)
+        model = models_service.get_model_by_code(update.message.text)
+        if not model:
+            return False
+        logger.info(f"Code '{update.message.text}' matched model ID={model.id}")
+        await update.message.reply_text(
+            build_model_card_text(db, model, lang),
+            reply_markup=model_options_keyboard(model.id, lang),
+            parse_mode='HTML'
+        )
+        return True
+    finally:
+
         db.close()
 # ==================== INSTRUCTION HANDLERS ====================
 async def handle_instructions(query, lang: str):
@@ -673,6 +605,39 @@ async def handle_instruction_selected(query, context: ContextTypes.DEFAULT_TYPE,
     finally:
 
         db.close()
+async def start_package_task(query, context: ContextTypes.DEFAULT_TYPE, model_id: int, model_name: str,
+                             kind: str, lang: str):
+    """Run package sending (kind: 'instructions' or 'recipes') as background task"""
+    chat_id = query.message.chat.id
+    bot = context.bot
+
+    async def job(progress):
+        # Own session: the handler's one is closed when the callback returns
+        db = get_session()
+        try:
+            model = ModelsService(db).get_model_by_id(model_id)
+            if kind == 'recipes':
+                items = RecipesService(db).get_recipes_by_model_id(model_id)
+            else:
+                items = model.instructions
+            # One cached ZIP file or albums of up to 10 files
+            if PACKAGE_MODE == 'zip':
+                await send_package_zip(bot, chat_id, db, model, kind, items, progress)
+            else:
+                await send_package(bot, chat_id, items, progress)
+        finally:
+            db.close()
+
+    title_key = 'recipes_package_title' if kind == 'recipes' else 'package_title'
+    task_kind = f'{kind}_package'
+    if task_manager.get_user_task(query.from_user.id, task_kind):
+        await query.answer(get_text('task_already_running', lang), show_alert=True)
+        return
+    task = await task_manager.start(bot, query.from_user.id, chat_id, task_kind,
+                                    get_text(title_key, lang, name=model_name), job, lang)
+    if not task:
+        await query.answer(get_text('task_busy', lang), show_alert=True)
+
 async def handle_download_package(query, context: ContextTypes.DEFAULT_TYPE, model_id: int, lang: str):
     """Handle download package"""
     db = get_session()
@@ -683,45 +648,15 @@ async def handle_download_package(query, context: ContextTypes.DEFAULT_TYPE, mod
         if not model or not model.instructions:
             await query.answer("Нет инструкций для скачивания.", show_alert=True)
             return
-        
-            # Send all instructions with rate limiting
-        for i, instruction in enumerate(model.instructions):
-            try:
-                if instruction.tg_file_id:
-                    if instruction.type == InstructionType.PDF:
-                        await context.bot.send_document(
-                            chat_id=query.message.chat.id,
-                            document=instruction.tg_file_id,
-                            caption=instruction.title
-                    )
-                    elif instruction.type == InstructionType.VIDEO:
-                        await context.bot.send_video(
-                            chat_id=query.message.chat.id,
-                            video=instruction.tg_file_id,
-                            caption=instruction.title
-                        )
-                    else:
-                        await context.bot.send_document(
-                            chat_id=query.message.chat.id,
-                            document=instruction.tg_file_id,
-                            caption=instruction.title
-                        )
-                elif instruction.url:
-                    await safe_send_message(
-                        context.bot,
-                        chat_id=query.message.chat.id,
-                        text=f"🔗 {instruction.title}\n{instruction.url}"
-                    )
-                # Add small delay between sends to avoid rate limiting
-                if i < len(model.instructions) - 1:  # Don't delay after last item
-                    await asyncio.sleep(0.3)
-            except Exception as e:
-                logger.error(f"Error sending instruction {instruction.id}: {e}")
-                # Continue with next instruction
-                continue
-        await query.answer(get_text('package_sent', lang))
+        model_name = model.name
     finally:
         db.close()
+    await start_package_task(query, context, model_id, model_name, 'instructions', lang)
+
+async def handle_task_cancel(query, task_id: int, lang: str):
+    """Handle cancel button of background task progress message"""
+    if not task_manager.cancel(task_id, query.from_user.id):
+        await query.answer(get_text('task_not_found', lang), show_alert=True)
 # ==================== SUPPORT HANDLERS ====================
 async def handle_support(query, lang: str):
     """Handle support button"""
@@ -894,6 +829,26 @@ async def handle_search_model(query, lang: str):
         reply_markup=cancel_keyboard(lang)
     )
 
+async def handle_search_page(query, token: str, page: int, lang: str):
+    """Handle search results pagination using stored result token"""
+    entry = search_tokens.get(token)
+    if not entry:
+        user_id = query.from_user.id
+        user_states[user_id] = UserState('search_waiting')
+        await query.edit_message_text(
+            get_text('search_expired', lang),
+            reply_markup=cancel_keyboard(lang)
+        )
+        return
+    query_text, refs = entry
+    total_pages = math.ceil(len(refs) / 10)
+    page = max(0, min(page, total_pages - 1))
+    await query.edit_message_text(
+        get_text('search_results', lang, query=query_text),
+        reply_markup=models_keyboard(refs[page * 10:(page + 1) * 10], page, total_pages, lang,
+                                     page_prefix=f'search_page_{token}_')
+    )
+
 async def handle_user_ticket_message(query, ticket_id: int, lang: str):
     """Handle user wants to add message to ticket"""
     user_id = query.from_user.id
@@ -942,7 +897,10 @@ async def handle_user_ticket_close(query, ticket_id: int, lang: str):
             return
 
             # Close ticket
-        support_service.update_ticket_status(ticket_id, TicketStatus.CLOSED)
+        support_service.update_ticket_status(ticket_id, TicketStatus.CLOSED, commit=False)
+        OutboxService(db).enqueue_ticket_event(ticket_id, f"🔴 Пользователь закрыл обращение T-{ticket_id}", forum_only=True)
+        db.commit()
+        outbox_sender.wake()
         await query.edit_message_text(
             f"✅ Обращение T-{ticket_id} закрыто.\n\nСпасибо за обращение!",
             reply_markup=InlineKeyboardMarkup([[
@@ -1025,6 +983,17 @@ async def handle_admin_settings(query, lang: str):
         reply_markup=admin_menu_keyboard(lang)
     )
 
+async def handle_admin_metrics(query, lang: str):
+    """Handle admin metrics view"""
+    if not is_admin(query.from_user.id):
+        await query.edit_message_text(get_text('access_denied', lang))
+        return
+    
+    await query.edit_message_text(
+        f"📈 Метрики бота:\n\n{metrics.format_text()}"[:4000],
+        reply_markup=admin_menu_keyboard(lang)
+    )
+
 async def handle_admin_ticket_view(query, ticket_id: int, lang: str):
     """Handle admin view specific ticket"""
     if not is_admin(query.from_user.id):
@@ -1120,21 +1089,21 @@ async def handle_admin_ticket_in_progress(query, ticket_id: int, lang: str):
             await query.answer("Нельзя изменить статус закрытого тикета!", show_alert=True)
             return
 
-            # Update ticket status
-
-
-            ticket = support_service.update_ticket_status(ticket_id, TicketStatus.IN_PROGRESS)
+        # Status change and user notice are committed together, outbox sender delivers it
+        ticket = support_service.update_ticket_status(ticket_id, TicketStatus.IN_PROGRESS, commit=False)
         if ticket:
-            # Notify user about status change
-            try:
-                await safe_send_message(
-                    query.bot,
-                    chat_id=ticket.user_id,
-                    text=f"🟡 Ваше обращение T-{ticket_id} взято в работу.\n\nМы работаем над решением вашего вопроса."
-                )
-            except TelegramError as e:
-
-                logger.error(f"Failed to notify user {ticket.user_id} about status change: {e}")
+            outbox_service = OutboxService(db)
+            outbox_service.enqueue_message(
+                ticket.user_id,
+                f"🟡 Ваше обращение T-{ticket_id} взято в работу.\n\nМы работаем над решением вашего вопроса."
+            )
+            outbox_service.enqueue_ticket_event(
+                ticket_id,
+                f"🟡 Тикет T-{ticket_id} взят в работу администратором @{query.from_user.username or query.from_user.id}",
+                forum_only=True
+            )
+            db.commit()
+            outbox_sender.wake()
             
             await query.edit_message_text(
                 f"✅ Тикет T-{ticket_id} переведен в статус 'В работе'.",
@@ -1178,23 +1147,23 @@ async def handle_admin_ticket_close(query, ticket_id: int, lang: str):
             await query.answer("Тикет уже закрыт!", show_alert=True)
             return
 
-            # Close the ticket
-
-
-            old_status = ticket.status.value
-        ticket = support_service.update_ticket_status(ticket_id, TicketStatus.CLOSED)
+        # Close ticket and queue notifications in one transaction
+        old_status = ticket.status.value
+        ticket = support_service.update_ticket_status(ticket_id, TicketStatus.CLOSED, commit=False)
         logger.info(f"Ticket {ticket_id} status changed: {old_status} → CLOSED")
         if ticket:
-            # Notify user about ticket closure
-            try:
-                await safe_send_message(
-                    query.bot,
-                    chat_id=ticket.user_id,
-                    text=f"🔴 Ваше обращение T-{ticket_id} закрыто.\n\nСпасибо за обращение!"
-                )
-            except TelegramError as e:
-
-                logger.error(f"Failed to notify user {ticket.user_id} about ticket closure: {e}")
+            outbox_service = OutboxService(db)
+            outbox_service.enqueue_message(
+                ticket.user_id,
+                f"🔴 Ваше обращение T-{ticket_id} закрыто.\n\nСпасибо за обращение!"
+            )
+            outbox_service.enqueue_ticket_event(
+                ticket_id,
+                f"🔴 Тикет T-{ticket_id} закрыт администратором @{query.from_user.username or query.from_user.id}",
+                forum_only=True
+            )
+            db.commit()
+            outbox_sender.wake()
             
             await query.edit_message_text(
                 f"✅ Тикет T-{ticket_id} закрыт.",
@@ -1640,7 +1609,37 @@ async def handle_instruction_type_selection(query, instruction_type: str, lang:
 
         await query.answer("Неизвестное состояние", show_alert=True)
 # ==================== MESSAGE HANDLERS ====================
+# File steps of admin wizards wait for Telegram uploads
+SLOW_MESSAGE_STATES = {'ADD_INSTR_FILE_WAIT', 'ADD_RECIPE_FILE_WAIT'}
+# States whose handlers commit (tickets, replies, new models): no time budget,
+# a cancel after the commit would keep the state and let the user repeat it
+MUTATING_MESSAGE_STATES = {'support_waiting', 'support_model_waiting', 'support_ticket_message',
+                           'admin_reply_ticket', 'admin_add_model_category'}
+
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle messages within time budget; on timeout the state is kept so the user can resend.
+    The budget cancels at an await only, it does not bound blocking database calls."""
+    user = update.effective_user
+    state = user_states.get(user.id)
+    state_name = state.state if state else 'none'
+    if state_name in MUTATING_MESSAGE_STATES:
+        timeout = None
+    else:
+        timeout = SLOW_HANDLER_TIMEOUT if state_name in SLOW_MESSAGE_STATES else HANDLER_TIMEOUT
+    started = time.monotonic()
+    try:
+        await asyncio.wait_for(dispatch_message(update, context), timeout)
+    except asyncio.TimeoutError:
+        metrics.incr(f'message.timeout.{state_name}')
+        logger.warning(f"Message handler of user {user.id} in state {state_name} timed out after {timeout}s")
+        try:
+            await update.effective_message.reply_text(get_text('request_timeout', get_user_lang(user.id)))
+        except TelegramError as e:
+            logger.error(f"Failed to send timeout message to {user.id}: {e}")
+    finally:
+        metrics.observe(f'message.{state_name}', time.monotonic() - started)
+
+async def dispatch_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages"""
     user = update.effective_user
     lang = get_user_lang(user.id)
@@ -1660,6 +1659,10 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await handle_admin_add_model_description(update, context, lang)
             elif state.state == 'admin_add_model_tags':
                 await handle_admin_add_model_tags(update, context, lang)
+            elif state.state == 'admin_add_model_codes':
+                await handle_admin_add_model_codes(update, context, lang)
+            elif state.state == 'admin_add_model_category':
+                await handle_admin_add_model_category(update, context, lang)
             elif state.state == 'ADD_INSTR_TITLE':
                 logger.info(f"Processing ADD_INSTR_TITLE for user {user.id}")
                 await handle_admin_add_instruction_title(update, context, lang)
@@ -1733,6 +1736,8 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             user_states[user.id] = UserState('ADD_INSTR_TITLE')
             await handle_admin_add_instruction_title(update, context, lang)
             return
+        elif await reply_with_model_by_code(update, lang):
+            return
         else:
             await update.message.reply_text(
                 "Пожалуйста, используйте меню для навигации.",
@@ -1783,18 +1788,16 @@ async def handle_support_message(update: Update, context: ContextTypes.DEFAULT_T
         support_service.add_message_to_ticket(
             ticket_id=ticket.id,
             from_role=MessageRole.USER,
-            text=update.message.text
+            text=update.message.text,
+            commit=False
         )
         # Send to admins
         admin_text = f"❗️ Новое обращение T-{ticket.id}\n"
         admin_text += f"👤 От: @{user.username or 'нет username'} (ID: {user.id})\n"
         admin_text += f"📝 Текст: {update.message.text}"
-        for admin_id in ADMIN_CHAT_IDS:
-            try:
-                await safe_send_message(context.bot, chat_id=admin_id, text=admin_text)
-            except TelegramError as e:
-        
-                logger.error(f"Failed to send message to admin {admin_id}: {e}")
+        OutboxService(db).enqueue_ticket_event(ticket.id, admin_text)
+        db.commit()
+        outbox_sender.wake()
         await update.message.reply_text(
             get_text('support_sent', lang, ticket_id=ticket.id),
             reply_markup=main_menu_keyboard(lang)
@@ -1826,19 +1829,17 @@ async def handle_support_model_message(update: Update, context: ContextTypes.DEF
         support_service.add_message_to_ticket(
             ticket_id=ticket.id,
             from_role=MessageRole.USER,
-            text=f"Вопрос по модели {model_name}:\n\n{update.message.text}"
+            text=f"Вопрос по модели {model_name}:\n\n{update.message.text}",
+            commit=False
         )
         # Send to admins
         admin_text = f"❗️ Новое обращение T-{ticket.id}\n"
         admin_text += f"👤 От: @{user.username or 'нет username'} (ID: {user.id})\n"
         admin_text += f"📦 Модель: {model_name}\n"
         admin_text += f"📝 Текст: {update.message.text}"
-        for admin_id in ADMIN_CHAT_IDS:
-            try:
-                await safe_send_message(context.bot, chat_id=admin_id, text=admin_text)
-            except TelegramError as e:
-        
-                logger.error(f"Failed to send message to admin {admin_id}: {e}")
+        OutboxService(db).enqueue_ticket_event(ticket.id, admin_text)
+        db.commit()
+        outbox_sender.wake()
         await update.message.reply_text(
             get_text('support_sent', lang, ticket_id=ticket.id),
             reply_markup=main_menu_keyboard(lang)
@@ -1877,19 +1878,17 @@ async def handle_support_ticket_message(update: Update, context: ContextTypes.DE
         support_service.add_message_to_ticket(
             ticket_id=ticket_id,
             from_role=MessageRole.USER,
-            text=update.message.text
+            text=update.message.text,
+            commit=False
         )
         
         # Send notification to admins
         admin_text = f"❗️ Новое сообщение в обращении T-{ticket_id}\n"
         admin_text += f"👤 От: @{user.username or 'нет username'} (ID: {user.id})\n"
         admin_text += f"📝 Текст: {update.message.text}"
-        for admin_id in ADMIN_CHAT_IDS:
-            try:
-                await safe_send_message(context.bot, chat_id=admin_id, text=admin_text)
-            except TelegramError as e:
-
-                logger.error(f"Failed to send message to admin {admin_id}: {e}")
+        OutboxService(db).enqueue_ticket_event(ticket_id, admin_text)
+        db.commit()
+        outbox_sender.wake()
         
         await update.message.reply_text(
             "✅ Сообщение отправлено в поддержку.",
@@ -1905,13 +1904,23 @@ async def handle_search_message(update: Update, context: ContextTypes.DEFAULT_TY
     """Handle search message"""
     user = update.effective_user
     query_text = update.message.text
+    # Pasted article/SKU jumps straight to the model card
+    if await reply_with_model_by_code(update, lang):
+        if user.id in user_states:
+            del user_states[user.id]
+        return
     db = get_session()
     try:
 
         models_service = ModelsService(db)
-        models = models_service.search_models(query_text, page=0, limit=10)
-        total_count = models_service.get_search_models_count(query_text)
-        total_pages = math.ceil(total_count / 10)
+        # Cache key and database query are the same text, so cached results always match the query
+        normalized = normalize_query(query_text)
+        refs = search_cache.get_or_load(
+            normalized,
+            lambda: models_service.search_model_refs(normalized, limit=SEARCH_RESULTS_LIMIT)
+        )
+        models = refs[:10]
+        total_pages = math.ceil(len(refs) / 10)
         if not models:
             await update.message.reply_text(
                 get_text('no_search_results', lang),
@@ -1919,9 +1928,11 @@ async def handle_search_message(update: Update, context: ContextTypes.DEFAULT_TY
             )
             return
         
+        # Paging goes through a server-side token, so the query is not re-run
+        token = search_tokens.create(query_text, refs) if total_pages > 1 else ''
         await update.message.reply_text(
             get_text('search_results', lang, query=query_text),
-            reply_markup=models_keyboard(models, 0, total_pages, lang)
+            reply_markup=models_keyboard(models, 0, total_pages, lang, page_prefix=f'search_page_{token}_')
         )
     finally:
 
@@ -1965,19 +1976,55 @@ async def handle_admin_add_model_tags(update: Update, context: ContextTypes.DEFA
     user_id = update.effective_user.id
     state = user_states[user_id]
     tags = update.message.text if update.message.text != '/skip' else None
+    user_states[user_id] = UserState('admin_add_model_codes', {
+        'name': state.data['name'],
+        'description': state.data['description'],
+        'tags': tags
+    })
+    await update.message.reply_text(
+        get_text('model_codes_prompt', lang),
+        reply_markup=cancel_keyboard(lang)
+    )
+async def handle_admin_add_model_codes(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str):
+    """Handle admin add model marketplace codes (articles/SKUs)"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(get_text('access_denied', lang))
+        return
+    user_id = update.effective_user.id
+    state = user_states[user_id]
+    codes = update.message.text.split(',') if update.message.text and update.message.text != '/skip' else []
+    state.data['codes'] = codes
+    user_states[user_id] = UserState('admin_add_model_category', state.data)
+    await update.message.reply_text(
+        get_text('model_category_prompt', lang),
+        reply_markup=cancel_keyboard(lang)
+    )
+async def handle_admin_add_model_category(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str):
+    """Handle admin add model catalog category (path like 'Category / Brand')"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(get_text('access_denied', lang))
+        return
+    user_id = update.effective_user.id
+    state = user_states[user_id]
+    category_path = update.message.text.split('/') if update.message.text and update.message.text != '/skip' else []
     db = get_session()
     try:
 
         models_service = ModelsService(db)
+        catalog_service = CatalogService(db)
         # Debug logging
-        logger.info(f"Creating model: name='{state.data['name']}', description='{state.data['description']}', tags='{tags}'")
+        logger.info(f"Creating model: name='{state.data['name']}', description='{state.data['description']}', tags='{state.data['tags']}'")
         model = models_service.create_model(
             name=state.data['name'],
             description=state.data['description'],
-            tags=tags
+            tags=state.data['tags']
         )
+        added_codes = models_service.add_model_codes(model.id, state.data.get('codes', []))
+        category = catalog_service.get_or_create_path(category_path)
+        if category:
+            catalog_service.set_model_category(model.id, category.id)
         # Debug logging
-        logger.info(f"Model created successfully: ID={model.id}, name='{model.name}'")
+        logger.info(f"Model created successfully: ID={model.id}, name='{model.name}', codes={[c.code for c in added_codes]}, category={category.path if category else None}")
         await update.message.reply_text(
             get_text('model_created', lang, name=model.name),
             reply_markup=admin_models_keyboard(lang)
@@ -2388,31 +2435,22 @@ async def handle_admin_reply_ticket_message(update: Update, context: ContextType
             )
             return
 
-            # Add admin message to ticket
+        # Ticket message and reply to user are committed together, outbox sender delivers it
         support_service.add_message_to_ticket(
             ticket_id=ticket_id,
             from_role=MessageRole.ADMIN,
-            text=update.message.text
+            text=update.message.text,
+            commit=False
         )
+        OutboxService(db).enqueue_message(
+            ticket.user_id,
+            f"👨‍💼 <b>Ответ от поддержки (T-{ticket_id}):</b>\n\n{html.escape(update.message.text)}",
+            parse_mode='HTML'
+        )
+        db.commit()
+        outbox_sender.wake()
         
-        # Send message to user
-        try:
-            await safe_send_message(
-
-                context.bot,
-                chat_id=ticket.user_id,
-                text=f"👨‍💼 <b>Ответ от поддержки (T-{ticket_id}):</b>\n\n{update.message.text}"
-            )
-        except TelegramError as e:
-
-            logger.error(f"Failed to send message to user {ticket.user_id}: {e}")
-            await update.message.reply_text(
-                "✅ Ответ добавлен в тикет, но не удалось отправить пользователю.",
-                reply_markup=admin_ticket_management_keyboard(ticket_id, lang)
-            )
-            return
-
-            await update.message.reply_text(
+        await update.message.reply_text(
             f"✅ Ответ отправлен клиенту (T-{ticket_id}).",
             reply_markup=admin_ticket_management_keyboard(ticket_id, lang)
         )
@@ -2429,56 +2467,6 @@ async def handle_admin_reply_ticket_message(update: Update, context: ContextType
         if user.id in user_states:
             del user_states[user.id]
 
-async def handle_model_selection_for_recipe(query, model_id: int, recipe_id: int, action: str, lang: str):
-    """Handle model selection for recipe binding/unbinding"""
-    if not is_admin(query.from_user.id):
-        await query.edit_message_text(get_text('access_denied', lang))
-        return
-    user_id = query.from_user.id
-    # Initialize or get user state for model selection
-    if user_id not in user_states:
-        user_states[user_id] = UserState('model_selection', {
-            'recipe_id': recipe_id,
-            'action': action,
-            'selected_models': []
-        })
-    state = user_states[user_id]
-    selected_models = state.data.get('selected_models', [])
-    # Toggle model selection
-    if model_id in selected_models:
-        selected_models.remove(model_id)
-    else:
-        selected_models.append(model_id)
-    state.data['selected_models'] = selected_models
-    user_states[user_id] = state
-    # Update keyboard
-    db = get_session()
-    try:
-
-        models_service = ModelsService(db)
-        recipes_service = RecipesService(db)
-        
-        if action == 'bind_recipe':
-            models = models_service.get_models(page=0, limit=50)
-            bound_models = recipes_service.get_recipe_models(recipe_id)
-            bound_model_ids = [model.id for model in bound_models]
-        else:  # unbind_recipe
-            bound_models = recipes_service.get_recipe_models(recipe_id)
-            models = bound_models
-            bound_model_ids = []
-        
-        await query.edit_message_reply_markup(
-            reply_markup=models_selection_keyboard(models, recipe_id, action, bound_model_ids, lang)
-        )
-        await query.answer(f"Выбрано моделей: {len(selected_models)}")
-    except Exception as e:
-
-        logger.error(f"Error in handle_model_selection_for_recipe: {e}")
-        await query.answer("Ошибка при обновлении выбора.", show_alert=True)
-    finally:
-
-        db.close()
-
 async def handle_bind_model_to_new_instruction(query, model_id: int, lang: str):
     """Handle binding model to new instruction"""
     if not is_admin(query.from_user.id):
@@ -2832,12 +2820,11 @@ async def handle_bind_instruction_to_models(query, instruction_id: int, lang: st
             )
             return
 
-            # Get already bound models
-        bound_model_ids = [model.id for model in instruction.models]
         await query.edit_message_text(
 
             get_text('select_models_to_bind', lang, title=instruction.title),
-            reply_markup=models_selection_keyboard(models, instruction_id, 'bind', bound_model_ids, lang)
+            reply_markup=models_selection_keyboard(models, instruction_id, PICK_BIND, [], lang,
+                                                   bound_models=[model.id for model in instruction.models])
         )
     finally:
 
@@ -2867,67 +2854,58 @@ async def handle_unbind_instruction_from_models(query, instruction_id: int, lang
             )
             return
 
-            await query.edit_message_text(
-
-
-                get_text('select_models_to_unbind', lang, title=instruction.title),
-            reply_markup=models_selection_keyboard(bound_models, instruction_id, 'unbind', [], lang)
+        await query.edit_message_text(
+            get_text('select_models_to_unbind', lang, title=instruction.title),
+            reply_markup=models_selection_keyboard(bound_models, instruction_id, PICK_UNBIND, [], lang)
         )
     finally:
 
         db.close()
-async def handle_model_selection_for_instruction(query, model_id: int, instruction_id: int, action: str, lang: str):
-    """Handle model selection for instruction binding/unbinding"""
+async def handle_model_picker_toggle(query, kind: int, action: int, target_id: int, model_id: int,
+                                    selected: List[int], lang: str):
+    """Toggle model in picker; selection is carried by the buttons, not by user_states"""
     if not is_admin(query.from_user.id):
         await query.edit_message_text(get_text('access_denied', lang))
         return
-    user_id = query.from_user.id
-    # Initialize or get user state for model selection
-    if user_id not in user_states:
-        user_states[user_id] = UserState('model_selection', {
-            'instruction_id': instruction_id,
-            'action': action,
-            'selected_models': []
-        })
-    state = user_states[user_id]
-    selected_models = state.data.get('selected_models', [])
-    # Toggle model selection
-    if model_id in selected_models:
-        selected_models.remove(model_id)
-    else:
+    selected_models = [mid for mid in selected if mid != model_id]
+    if model_id not in selected:
         selected_models.append(model_id)
-    state.data['selected_models'] = selected_models
-    user_states[user_id] = state
     # Update keyboard
     db = get_session()
     try:
-        if action == 'bind':
-            models_service = ModelsService(db)
-            models = models_service.get_models(page=0, limit=100)
-        else:  # unbind
-            instructions_service = InstructionsService(db)
-            instruction = instructions_service.get_instruction_by_id(instruction_id)
-            models = instruction.models if instruction else []
+        if kind == PICK_INSTRUCTION:
+            instruction = InstructionsService(db).get_instruction_by_id(target_id)
+            bound_models = instruction.models if instruction else []
+        else:
+            bound_models = RecipesService(db).get_recipe_models(target_id)
+        if action == PICK_BIND:
+            models = ModelsService(db).get_models(page=0, limit=100 if kind == PICK_INSTRUCTION else 50)
+            bound_ids = [model.id for model in bound_models]
+        else:
+            models, bound_ids = bound_models, []
         await query.edit_message_reply_markup(
-            reply_markup=models_selection_keyboard(models, instruction_id, action, selected_models, lang)
+            reply_markup=models_selection_keyboard(models, target_id, action, selected_models, lang, kind=kind,
+                                                   bound_models=bound_ids)
         )
     finally:
 
         db.close()
-async def handle_confirm_bind_instruction(query, instruction_id: int, lang: str):
+async def handle_model_picker_confirm(query, kind: int, action: int, target_id: int, selected: List[int], lang: str):
+    """Apply picker selection"""
+    if kind == PICK_INSTRUCTION:
+        if action == PICK_BIND:
+            await handle_confirm_bind_instruction(query, target_id, selected, lang)
+        else:
+            await handle_confirm_unbind_instruction(query, target_id, selected, lang)
+    elif action == PICK_BIND:
+        await handle_confirm_bind_recipe(query, target_id, selected, lang)
+    else:
+        await handle_confirm_unbind_recipe(query, target_id, selected, lang)
+async def handle_confirm_bind_instruction(query, instruction_id: int, selected_models: List[int], lang: str):
     """Handle confirmation of instruction binding"""
     if not is_admin(query.from_user.id):
         await query.edit_message_text(get_text('access_denied', lang))
         return
-    user_id = query.from_user.id
-    if user_id not in user_states or user_states[user_id].state != 'model_selection':
-        await query.edit_message_text(
-            "Сессия истекла. Попробуйте снова.",
-            reply_markup=admin_instructions_keyboard(lang)
-        )
-        return
-    state = user_states[user_id]
-    selected_models = state.data.get('selected_models', [])
     if not selected_models:
         await query.answer("Выберите хотя бы одну модель.", show_alert=True)
         return
@@ -2950,22 +2928,11 @@ async def handle_confirm_bind_instruction(query, instruction_id: int, lang: str)
     finally:
 
         db.close()
-        if user_id in user_states:
-            del user_states[user_id]
-async def handle_confirm_unbind_instruction(query, instruction_id: int, lang: str):
+async def handle_confirm_unbind_instruction(query, instruction_id: int, selected_models: List[int], lang: str):
     """Handle confirmation of instruction unbinding"""
     if not is_admin(query.from_user.id):
         await query.edit_message_text(get_text('access_denied', lang))
         return
-    user_id = query.from_user.id
-    if user_id not in user_states or user_states[user_id].state != 'model_selection':
-        await query.edit_message_text(
-            "Сессия истекла. Попробуйте снова.",
-            reply_markup=admin_instructions_keyboard(lang)
-        )
-        return
-    state = user_states[user_id]
-    selected_models = state.data.get('selected_models', [])
     if not selected_models:
         await query.answer("Выберите хотя бы одну модель.", show_alert=True)
         return
@@ -2988,8 +2955,6 @@ async def handle_confirm_unbind_instruction(query, instruction_id: int, lang: st
     finally:
 
         db.close()
-        if user_id in user_states:
-            del user_states[user_id]
 async def handle_admin_edit_model_by_id(query, model_id: int, lang: str):
     """Handle admin edit model by ID"""
     if not is_admin(query.from_user.id):
@@ -3082,51 +3047,7 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.error(f"Exception while handling an update: {error}")
     # Send error to admins (but not for conflicts)
     error_text = f"🚨 Ошибка в боте:\n\n{str(error)}"
-    for admin_id in ADMIN_CHAT_IDS:
-        try:
-            await safe_send_message(context.bot, chat_id=admin_id, text=error_text)
-        except:
-            pass
-# ==================== HEALTHCHECK SERVER ====================
-# async def healthcheck_handler(request):  # Not needed anymore - using built-in http.server
-#     """Simple healthcheck endpoint"""
-#     return web.Response(text="OK", status=200)
-def start_healthcheck_server():
-    """Start simple HTTP server for healthcheck"""
-    try:
-        from http.server import HTTPServer, BaseHTTPRequestHandler
-        import socketserver
-        
-        class HealthCheckHandler(BaseHTTPRequestHandler):
-            def do_GET(self):
-                if self.path in ['/health', '/']:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/plain')
-                    self.end_headers()
-                    self.wfile.write(b'OK')
-                else:
-                    self.send_response(404)
-                    self.end_headers()
-            
-            def log_message(self, format, *args):
-                # Suppress default logging
-                pass
-        
-        server = HTTPServer(('0.0.0.0', 8080), HealthCheckHandler)
-        logger.info("Healthcheck server started on port 8080")
-        
-        # Keep server running until shutdown
-        try:
-            while not shutdown_event.is_set():
-                server.handle_request()
-        except KeyboardInterrupt:
-            logger.info("Healthcheck server stopping...")
-        finally:
-            server.server_close()
-            logger.info("Healthcheck server stopped")
-    except Exception as e:
-        logger.error(f"Healthcheck server error: {e}")
-
+    notify_admins(context.bot, error_text)
 # ==================== RECIPE HANDLERS (STUBS) ====================
 async def handle_admin_add_recipe(query, lang: str):
     """Handle admin add recipe"""
@@ -3255,15 +3176,10 @@ async def handle_bind_recipe_to_models(query, recipe_id: int, lang: str):
             )
             return
 
-            # Get currently bound models
-        bound_models = recipes_service.get_recipe_models(recipe_id)
-        bound_model_ids = [model.id for model in bound_models]
-        
         await query.edit_message_text(
-
-        
             get_text('select_models_to_bind_recipe', lang, title=recipe.title),
-            reply_markup=models_selection_keyboard(models, recipe_id, 'bind_recipe', bound_model_ids, lang)
+            reply_markup=models_selection_keyboard(models, recipe_id, PICK_BIND, [], lang, kind=PICK_RECIPE,
+                                                   bound_models=[model.id for model in recipe.models])
         )
     except Exception as e:
 
@@ -3304,11 +3220,9 @@ async def handle_unbind_recipe_from_models(query, recipe_id: int, lang: str):
             )
             return
 
-            await query.edit_message_text(
-
-
-                get_text('select_models_to_unbind_recipe', lang, title=recipe.title),
-            reply_markup=models_selection_keyboard(bound_models, recipe_id, 'unbind_recipe', [], lang)
+        await query.edit_message_text(
+            get_text('select_models_to_unbind_recipe', lang, title=recipe.title),
+            reply_markup=models_selection_keyboard(bound_models, recipe_id, PICK_UNBIND, [], lang, kind=PICK_RECIPE)
         )
     except Exception as e:
 
@@ -3321,7 +3235,7 @@ async def handle_unbind_recipe_from_models(query, recipe_id: int, lang: str):
 
         db.close()
 
-async def handle_confirm_bind_recipe(query, recipe_id: int, lang: str):
+async def handle_confirm_bind_recipe(query, recipe_id: int, selected_models: List[int], lang: str):
     """Handle confirm bind recipe"""
     if not is_admin(query.from_user.id):
         await query.edit_message_text(get_text('access_denied', lang))
@@ -3332,18 +3246,6 @@ async def handle_confirm_bind_recipe(query, recipe_id: int, lang: str):
 
         recipes_service = RecipesService(db)
         
-        # Get selected models from user state
-        user_id = query.from_user.id
-        if user_id not in user_states:
-            await query.edit_message_text(
-                "Сессия истекла. Попробуйте снова.",
-                reply_markup=admin_recipes_keyboard(lang)
-            )
-            return
-        
-        state = user_states[user_id]
-        selected_models = state.data.get('selected_models', [])
-        
         if not selected_models:
             await query.edit_message_text(
                 "Не выбрано ни одной модели.",
@@ -3366,9 +3268,6 @@ async def handle_confirm_bind_recipe(query, recipe_id: int, lang: str):
                 "Ошибка при привязке рецепта к моделям.",
                 reply_markup=recipe_management_keyboard(recipe_id, lang)
             )
-        
-        # Clear user state
-        del user_states[user_id]
     except Exception as e:
 
         logger.error(f"Error in handle_confirm_bind_recipe: {e}")
@@ -3380,7 +3279,7 @@ async def handle_confirm_bind_recipe(query, recipe_id: int, lang: str):
 
         db.close()
 
-async def handle_confirm_unbind_recipe(query, recipe_id: int, lang: str):
+async def handle_confirm_unbind_recipe(query, recipe_id: int, selected_models: List[int], lang: str):
     """Handle confirm unbind recipe"""
     if not is_admin(query.from_user.id):
         await query.edit_message_text(get_text('access_denied', lang))
@@ -3391,18 +3290,6 @@ async def handle_confirm_unbind_recipe(query, recipe_id: int, lang: str):
 
         recipes_service = RecipesService(db)
         
-        # Get selected models from user state
-        user_id = query.from_user.id
-        if user_id not in user_states:
-            await query.edit_message_text(
-                "Сессия истекла. Попробуйте снова.",
-                reply_markup=admin_recipes_keyboard(lang)
-            )
-            return
-        
-        state = user_states[user_id]
-        selected_models = state.data.get('selected_models', [])
-        
         if not selected_models:
             await query.edit_message_text(
                 "Не выбрано ни одной модели.",
@@ -3425,9 +3312,6 @@ async def handle_confirm_unbind_recipe(query, recipe_id: int, lang: str):
                 "Ошибка при отвязке рецепта от моделей.",
                 reply_markup=recipe_management_keyboard(recipe_id, lang)
             )
-        
-        # Clear user state
-        del user_states[user_id]
     except Exception as e:
 
         logger.error(f"Error in handle_confirm_unbind_recipe: {e}")
@@ -3595,62 +3479,20 @@ async def handle_download_recipes_package(query, context, model_id: int, lang: s
             await query.answer("Модель не найдена!", show_alert=True)
             return
 
-            # Get all recipes for this model
         recipes = recipes_service.get_recipes_by_model_id(model_id)
         if not recipes:
             await query.answer("Нет рецептов для скачивания.", show_alert=True)
             return
-
-            # Send all recipes with rate limiting
-        for i, recipe in enumerate(recipes):
-            try:
-
-                if recipe.tg_file_id:
-                    if recipe.type.value == 'pdf':
-                        await context.bot.send_document(
-
-                            chat_id=query.message.chat.id,
-                            document=recipe.tg_file_id,
-                            caption=recipe.title
-                        )
-                    elif recipe.type.value == 'video':
-                        await context.bot.send_video(
-
-                            chat_id=query.message.chat.id,
-                            video=recipe.tg_file_id,
-                            caption=recipe.title
-                        )
-                    else:
-                        await context.bot.send_document(
-
-                            chat_id=query.message.chat.id,
-                            document=recipe.tg_file_id,
-                            caption=recipe.title
-                        )
-                elif recipe.url:
-                    await safe_send_message(
-
-                        context.bot,
-                        chat_id=query.message.chat.id,
-                        text=f"🔗 {recipe.title}\n{recipe.url}"
-                    )
-                # Add small delay between sends to avoid rate limiting
-                if i < len(recipes) - 1:  # Don't delay after last item
-                    await asyncio.sleep(0.3)
-            except Exception as e:
-
-                logger.error(f"Error sending recipe {recipe.id}: {e}")
-                # Continue with next recipe
-                continue
-        
-        await query.answer(get_text('recipes_package_sent', lang))
+        model_name = model.name
     except Exception as e:
 
         logger.error(f"Error in handle_download_recipes_package: {e}")
         await query.answer("Ошибка при скачивании рецептов.", show_alert=True)
+        return
     finally:
 
         db.close()
+    await start_package_task(query, context, model_id, model_name, 'recipes', lang)
 
 async def handle_bind_recipe_model_to_new_recipe(query, model_id: int, lang: str):
     """Handle binding model to new recipe"""
@@ -3832,33 +3674,279 @@ async def handle_save_recipe(query, lang: str):
         db.close()
 
 # ==================== MAIN FUNCTION ====================
+# ==================== CALLBACK ROUTES ====================
+async def handle_main_menu(query, lang: str):
+    await query.edit_message_text(
+        get_text('main_menu', lang),
+        reply_markup=main_menu_keyboard(lang)
+    )
+
+async def handle_cancel(query, lang: str):
+    # Clear user state
+    if query.from_user.id in user_states:
+        del user_states[query.from_user.id]
+    # Return to appropriate menu based on user type
+    if is_admin(query.from_user.id):
+        await query.edit_message_text(
+            get_text('admin_menu', lang),
+            reply_markup=admin_menu_keyboard(lang)
+        )
+    else:
+        await query.edit_message_text(
+            get_text('main_menu', lang),
+            reply_markup=main_menu_keyboard(lang)
+        )
+
+def register_callback_routes(router: CallbackRouter):
+    """callback_data -> handler table. Handlers are called as (query, context, lang, **params).
+    navigation=True marks view-only routes: a newer click on the same message supersedes them."""
+    # Main menu
+    router.add('main_menu', lambda q, c, lang: handle_main_menu(q, lang), navigation=True)
+    router.add('cancel', lambda q, c, lang: handle_cancel(q, lang))
+    router.add('back_step', lambda q, c, lang: handle_back_step(q, lang))
+    # Models
+    router.add('choose_model', lambda q, c, lang: handle_choose_model(q, lang), navigation=True)
+    router.add('models_list', lambda q, c, lang: handle_models_list(q, lang), navigation=True)
+    router.add('models_page_{page:int}', lambda q, c, lang, page: handle_models_page(q, page, lang), navigation=True)
+    router.add('catalog', lambda q, c, lang: handle_catalog_root(q, lang), navigation=True)
+    router.add('catalog_{category_id:int}_{page:int}',
+               lambda q, c, lang, category_id, page: handle_catalog_node(q, category_id, page, lang), navigation=True)
+    router.add('catalog_all_{category_id:int}_{page:int}',
+               lambda q, c, lang, category_id, page: handle_catalog_subtree(q, category_id, page, lang), navigation=True)
+    router.add('tags', lambda q, c, lang: handle_tags(q, 0, lang), navigation=True)
+    router.add('tags_page_{page:int}', lambda q, c, lang, page: handle_tags(q, page, lang), navigation=True)
+    router.add('tag_{tag_id:int}_{page:int}', lambda q, c, lang, tag_id, page: handle_tag_models(q, tag_id, page, lang), navigation=True)
+    router.add('model_{model_id:int}', lambda q, c, lang, model_id: handle_model_selected(q, model_id, lang), navigation=True)
+    # Instructions
+    router.add('instructions', lambda q, c, lang: handle_instructions(q, lang), navigation=True)
+    router.add('instructions_{model_id:int}', lambda q, c, lang, model_id: handle_model_instructions(q, model_id, lang), navigation=True)
+    router.add('instruction_{instruction_id:int}',
+               lambda q, c, lang, instruction_id: handle_instruction_selected(q, c, instruction_id, lang),
+               timeout=SLOW_HANDLER_TIMEOUT)
+    router.add('package_{model_id:int}', lambda q, c, lang, model_id: handle_download_package(q, c, model_id, lang))
+    router.add('task_cancel_{task_id:int}', lambda q, c, lang, task_id: handle_task_cancel(q, task_id, lang))
+    # Recipes
+    router.add('recipes', lambda q, c, lang: handle_recipes(q, lang), navigation=True)
+    router.add('recipes_{model_id:int}', lambda q, c, lang, model_id: handle_model_recipes(q, model_id, lang), navigation=True)
+    router.add('recipes_package_{model_id:int}',
+               lambda q, c, lang, model_id: handle_download_recipes_package(q, c, model_id, lang))
+    router.add('recipe_{recipe_id:int}', lambda q, c, lang, recipe_id: handle_recipe_selected(q, c, recipe_id, lang),
+               timeout=SLOW_HANDLER_TIMEOUT)
+    # Support
+    router.add('support', lambda q, c, lang: handle_support(q, lang))
+    router.add('support_model_{model_id:int}', lambda q, c, lang, model_id: handle_support_model(q, model_id, lang))
+    router.add('my_tickets', lambda q, c, lang: handle_my_tickets(q, lang), navigation=True)
+    router.add('ticket_{ticket_id:int}', lambda q, c, lang, ticket_id: handle_ticket_details(q, ticket_id, lang))
+    router.add('user_ticket_message_{ticket_id:int}',
+               lambda q, c, lang, ticket_id: handle_user_ticket_message(q, ticket_id, lang))
+    router.add('user_ticket_close_{ticket_id:int}',
+               lambda q, c, lang, ticket_id: handle_user_ticket_close(q, ticket_id, lang))
+    # Search
+    router.add('search_model', lambda q, c, lang: handle_search_model(q, lang))
+    router.add('search_page_{token}_{page:int}', lambda q, c, lang, token, page: handle_search_page(q, token, page, lang), navigation=True)
+    # Admin
+    router.add('admin', lambda q, c, lang: handle_admin_menu(q, lang))
+    router.add('admin_models', lambda q, c, lang: handle_admin_models(q, lang))
+    router.add('admin_instructions', lambda q, c, lang: handle_admin_instructions(q, lang))
+    router.add('admin_recipes', lambda q, c, lang: handle_admin_recipes(q, lang))
+    router.add('admin_tickets', lambda q, c, lang: handle_admin_tickets(q, lang))
+    router.add('admin_settings', lambda q, c, lang: handle_admin_settings(q, lang))
+    router.add('admin_metrics', lambda q, c, lang: handle_admin_metrics(q, lang))
+    # Admin - Models
+    router.add('admin_add_model', lambda q, c, lang: handle_admin_add_model(q, lang))
+    router.add('admin_edit_model', lambda q, c, lang: handle_admin_edit_model(q, lang))
+    router.add('admin_edit_model_{model_id:int}', lambda q, c, lang, model_id: handle_admin_edit_model_by_id(q, model_id, lang))
+    router.add('admin_delete_model', lambda q, c, lang: handle_admin_delete_model(q, lang))
+    router.add('admin_delete_model_{model_id:int}',
+               lambda q, c, lang, model_id: handle_admin_delete_model_by_id(q, model_id, lang))
+    router.add('confirm_delete_model_{model_id:int}',
+               lambda q, c, lang, model_id: handle_confirm_delete_model(q, model_id, lang))
+    # Admin - Instructions
+    router.add('admin_add_instruction', lambda q, c, lang: handle_admin_add_instruction(q, lang))
+    router.add('admin_list_instructions', lambda q, c, lang: handle_admin_list_instructions(q, lang))
+    router.add('admin_instruction_{instruction_id:int}',
+               lambda q, c, lang, instruction_id: handle_admin_instruction_management(q, instruction_id, lang))
+    router.add('bind_instruction_{instruction_id:int}',
+               lambda q, c, lang, instruction_id: handle_bind_instruction_to_models(q, instruction_id, lang))
+    router.add('unbind_instruction_{instruction_id:int}',
+               lambda q, c, lang, instruction_id: handle_unbind_instruction_from_models(q, instruction_id, lang))
+    # Admin - Recipes
+    router.add('admin_add_recipe', lambda q, c, lang: handle_admin_add_recipe(q, lang))
+    router.add('admin_list_recipes', lambda q, c, lang: handle_admin_list_recipes(q, lang))
+    router.add('admin_recipe_{recipe_id:int}',
+               lambda q, c, lang, recipe_id: handle_admin_recipe_management(q, recipe_id, lang))
+    router.add('bind_recipe_{recipe_id:int}', lambda q, c, lang, recipe_id: handle_bind_recipe_to_models(q, recipe_id, lang))
+    router.add('unbind_recipe_{recipe_id:int}',
+               lambda q, c, lang, recipe_id: handle_unbind_recipe_from_models(q, recipe_id, lang))
+    # Model pickers (compact callback data)
+    router.add_compact('pick_model', lambda q, c, lang, kind, action, target_id, model_id, selected:
+                       handle_model_picker_toggle(q, kind, action, target_id, model_id, selected, lang))
+    router.add_compact('pick_confirm', lambda q, c, lang, kind, action, target_id, selected:
+                       handle_model_picker_confirm(q, kind, action, target_id, selected, lang))
+    # New instruction creation flow
+    router.add('bind_model_{model_id:int}',
+               lambda q, c, lang, model_id: handle_bind_model_to_new_instruction(q, model_id, lang))
+    router.add('unbind_model_{model_id:int}',
+               lambda q, c, lang, model_id: handle_unbind_model_from_new_instruction(q, model_id, lang))
+    router.add('confirm_create_instruction', lambda q, c, lang: handle_confirm_create_instruction(q, lang))
+    router.add('save_instruction', lambda q, c, lang: handle_save_instruction(q, lang))
+    # New recipe creation flow
+    router.add('bind_recipe_model_{model_id:int}',
+               lambda q, c, lang, model_id: handle_bind_recipe_model_to_new_recipe(q, model_id, lang))
+    router.add('unbind_recipe_model_{model_id:int}',
+               lambda q, c, lang, model_id: handle_unbind_recipe_model_from_new_recipe(q, model_id, lang))
+    router.add('confirm_create_recipe', lambda q, c, lang: handle_confirm_create_recipe(q, lang))
+    router.add('save_recipe', lambda q, c, lang: handle_save_recipe(q, lang))
+    router.add('continue_master', lambda q, c, lang: handle_continue_master(q, lang))
+    router.add('exit_master', lambda q, c, lang: handle_exit_master(q, lang))
+    # Admin - Tickets
+    router.add('admin_open_tickets', lambda q, c, lang: handle_admin_open_tickets(q, lang))
+    router.add('admin_ticket_stats', lambda q, c, lang: handle_admin_ticket_stats(q, lang))
+    router.add('admin_ticket_{ticket_id:int}', lambda q, c, lang, ticket_id: handle_admin_ticket_view(q, ticket_id, lang))
+    router.add('admin_reply_ticket_{ticket_id:int}',
+               lambda q, c, lang, ticket_id: handle_admin_reply_ticket(q, ticket_id, lang))
+    router.add('admin_ticket_in_progress_{ticket_id:int}',
+               lambda q, c, lang, ticket_id: handle_admin_ticket_in_progress(q, ticket_id, lang))
+    router.add('admin_ticket_close_{ticket_id:int}',
+               lambda q, c, lang, ticket_id: handle_admin_ticket_close(q, ticket_id, lang))
+    # Instruction/Recipe type selection
+    router.add('type_{instruction_type}',
+               lambda q, c, lang, instruction_type: handle_instruction_type_selection(q, instruction_type, lang))
+    # Confirmation dialogs
+    router.add('confirm_{action:rest}', lambda q, c, lang, action: handle_confirmation(q, action, lang))
+    router.add('cancel_{action:rest}', lambda q, c, lang, action: handle_cancellation(q, action, lang))
+
+callback_router = CallbackRouter(default_timeout=HANDLER_TIMEOUT)
+register_callback_routes(callback_router)
+
+def navigation_key(update: object):
+    """Coalescing key of navigation clicks: newest click on a message wins"""
+    query = update.callback_query if isinstance(update, Update) else None
+    if not query or not query.message or not callback_router.is_navigation(query.data):
+        return None
+    # Coalescing runs before de-duplication: a redelivered click must not cancel
+    # its own original, it is dropped by update_dedup instead
+    if update_dedup.seen(update.update_id):
+        return None
+    return (query.message.chat.id, query.message.message_id)
+
+http_server = None
+admission = None
+update_dedup = UpdateDeduplicator(window=UPDATE_DEDUP_WINDOW, persist=UPDATE_DEDUP_PERSIST)
+flood_control = FloodControl(rate=FLOOD_RATE, burst=FLOOD_BURST, exempt=is_admin, lang=get_user_lang)
+
+def is_webhook_mode() -> bool:
+    return MODE == 'WEBHOOK' and bool(WEBHOOK_URL)
+
+async def post_init(application: Application):
+    """Start background workers once the event loop is running"""
+    global http_server
+    outbox_sender.start(application.bot)
+    admission.start()
+    metrics.register_provider('admission', admission.stats)
+    user_states.start()
+    metrics.register_provider('user_states', user_states.stats)
+    metrics.register_provider('flood_control', flood_control.stats)
+    metrics.register_provider('debounce', debouncer.stats)
+    metrics.register_provider('update_dedup', update_dedup.stats)
+    update_dedup.start()
+    if not is_webhook_mode():
+        # Polling: same server answers /health and /metrics only
+        http_server = WebhookServer(application, PORT, webhook_path=None, metrics_token=METRICS_TOKEN)
+        await http_server.start()
+
+async def post_shutdown(application: Application):
+    """Stop background workers"""
+    await outbox_sender.stop()
+    await user_states.stop()
+    await update_dedup.stop()
+    await admission.stop()
+    if http_server:
+        await http_server.stop()
+
+async def run_webhook_server(application: Application):
+    """Run bot behind own HTTP server: webhook, /health and /metrics on PORT"""
+    global http_server
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    http_server = WebhookServer(
+        application, PORT,
+        webhook_path=urlparse(WEBHOOK_URL).path or '/',
+        secret_token=WEBHOOK_SECRET,
+        metrics_token=METRICS_TOKEN
+    )
+    await application.initialize()
+    try:
+        await application.post_init(application)
+        await http_server.start()
+        await application.start()
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+        logger.info("✅ Webhook set, waiting for updates...")
+        await stop_event.wait()
+    finally:
+        logger.info("Stopping webhook server...")
+        if application.running:
+            await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+
 def main():
     """Main function"""
-    global application_instance
+    global application_instance, admission
     logger.info("🚀 Starting bot with conflict prevention...")
     # Set up signal handlers for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     # Create database tables
     logger.info("📊 Creating database tables...")
-    create_tables()
+    run_migrations()
     logger.info("✅ Database tables created")
-    # Start healthcheck server in background
-    logger.info("🏥 Starting healthcheck server...")
-    healthcheck_thread = threading.Thread(target=start_healthcheck_server, daemon=True)
-    healthcheck_thread.start()
-    logger.info("✅ Healthcheck server started")
     # Create application with better error handling
     logger.info("🤖 Creating bot application...")
-    application = Application.builder().token(BOT_TOKEN).build()
+    update_processor = PerUserUpdateProcessor(UPDATE_CONCURRENCY, coalesce_key=navigation_key)
+    update_queue = asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)
+    # Under overload navigation clicks are shed first, admin and ticket updates never
+    admission = AdmissionController(
+        depth=lambda: update_processor.slot_waiting + update_queue.qsize(),
+        max_depth=ADMISSION_MAX_DEPTH, max_lag=ADMISSION_MAX_LAG,
+        is_admin=is_admin, is_navigation=callback_router.is_navigation, lang=get_user_lang
+    )
+    update_processor.admission = admission
+    # All sends and edits go through the outbound dispatcher (Telegram rate limits)
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .rate_limiter(OutboundDispatcher(backend=create_bucket_backend(RATE_LIMIT_BACKEND, RATE_LIMIT_URL)))
+        .concurrent_updates(update_processor)
+        .update_queue(update_queue)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     application_instance = application
     logger.info("✅ Bot application created")
     # Add handlers
+    # Redelivered updates (same update_id) are dropped before any handler
+    application.add_handler(TypeHandler(Update, update_dedup.check_update), group=-1)
+    # Users sending too fast are stopped before any state or database work
+    application.add_handler(TypeHandler(Update, flood_control.check_update), group=-3)
+    # Conversation state of the user is loaded before handlers run
+    application.add_handler(TypeHandler(Update, user_states.prefetch_update), group=-2)
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("models", models_command))
     application.add_handler(CommandHandler("my_tickets", my_tickets_command))
     application.add_handler(CommandHandler("admin", admin_command))
     application.add_handler(CallbackQueryHandler(button_callback))
+    # Routes whose parameters could capture a longer route's data (longest prefix wins)
+    for shorter, longer in callback_router.overlaps():
+        logger.info(f"Callback route '{shorter}' overlaps '{longer}'")
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
     application.add_handler(MessageHandler(filters.Document.ALL, message_handler))
     application.add_handler(MessageHandler(filters.PHOTO, message_handler))
@@ -3868,13 +3956,9 @@ def main():
     logger.info("🚀 Starting main bot application...")
     try:
     
-        if MODE == 'WEBHOOK' and WEBHOOK_URL:
+        if is_webhook_mode():
             logger.info("🌐 Starting bot in webhook mode...")
-            application.run_webhook(
-                listen="0.0.0.0",
-                port=8443,
-                webhook_url=WEBHOOK_URL
-            )
+            asyncio.run(run_webhook_server(application))
         else:
             logger.info("📡 Starting bot in polling mode...")
             # Add a small delay to avoid immediate conflicts
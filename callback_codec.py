@@ -0,0 +1,182 @@
+"""
+Compact versioned encoding of callback_data.
+Format: '~' + base64url(version, route id, fields) without padding.
+Field types of a route are fixed at registration:
+- uint: varint
+- str: varint length + utf-8 bytes
+- ids: set of positive ints, delta-encoded varints or a bitmap from the
+  smallest id, whichever is shorter
+Telegram limits callback_data to 64 bytes, so encode() raises ValueError
+when the result does not fit. decode() never raises: foreign, truncated or
+other-version data gives None.
+"""
+
+import base64
+import binascii
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREFIX = '~'
+VERSION = 1
+MAX_CALLBACK_DATA = 64
+
+_IDS_DELTA = 0
+_IDS_BITMAP = 1
+
+def _write_varint(out: bytearray, value: int):
+    if value < 0:
+        raise ValueError(f"Negative value {value} can not be encoded")
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+def _read_varint(raw: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        if pos >= len(raw) or shift > 63:
+            raise ValueError("Truncated varint")
+        byte = raw[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+def _encode_ids(out: bytearray, ids: Iterable[int]):
+    ordered = sorted(set(ids))
+    delta = bytearray([_IDS_DELTA])
+    _write_varint(delta, len(ordered))
+    previous = 0
+    for value in ordered:
+        _write_varint(delta, value - previous)
+        previous = value
+    if not ordered:
+        out.extend(delta)
+        return
+    bitmap = bytearray([_IDS_BITMAP])
+    _write_varint(bitmap, ordered[0])
+    bits = bytearray((ordered[-1] - ordered[0]) // 8 + 1)
+    for value in ordered:
+        offset = value - ordered[0]
+        bits[offset // 8] |= 1 << (offset % 8)
+    _write_varint(bitmap, len(bits))
+    bitmap.extend(bits)
+    out.extend(delta if len(delta) <= len(bitmap) else bitmap)
+
+def _read_ids(raw: bytes, pos: int) -> Tuple[List[int], int]:
+    if pos >= len(raw):
+        raise ValueError("Truncated id set")
+    tag = raw[pos]
+    pos += 1
+    if tag == _IDS_DELTA:
+        count, pos = _read_varint(raw, pos)
+        ids, previous = [], 0
+        for _ in range(count):
+            delta, pos = _read_varint(raw, pos)
+            previous += delta
+            ids.append(previous)
+        return ids, pos
+    if tag == _IDS_BITMAP:
+        base, pos = _read_varint(raw, pos)
+        size, pos = _read_varint(raw, pos)
+        bits = raw[pos:pos + size]
+        if len(bits) != size:
+            raise ValueError("Truncated bitmap")
+        ids = [base + index * 8 + bit for index, byte in enumerate(bits) for bit in range(8) if byte >> bit & 1]
+        return ids, pos + size
+    raise ValueError(f"Unknown id set tag {tag}")
+
+class CallbackCodec:
+    FIELD_TYPES = ('uint', 'str', 'ids')
+
+    def __init__(self):
+        self._by_id: Dict[int, Tuple[str, Sequence[Tuple[str, str]]]] = {}
+        self._by_name: Dict[str, int] = {}
+
+    def register(self, route_id: int, name: str, fields: Sequence[Tuple[str, str]]):
+        """Register route with fields [(name, type)]. Route ids must never be reused
+        for other meaning while old buttons may still exist in chats."""
+        if route_id in self._by_id or name in self._by_name:
+            raise ValueError(f"Compact route {route_id} '{name}' already registered")
+        for field, kind in fields:
+            if kind not in self.FIELD_TYPES:
+                raise ValueError(f"Unknown field type '{kind}' of {name}.{field}")
+        self._by_id[route_id] = (name, tuple(fields))
+        self._by_name[name] = route_id
+
+    @staticmethod
+    def is_encoded(data: Optional[str]) -> bool:
+        return bool(data) and data.startswith(PREFIX)
+
+    def encode(self, name: str, **values) -> str:
+        route_id = self._by_name[name]
+        out = bytearray([VERSION])
+        _write_varint(out, route_id)
+        for field, kind in self._by_id[route_id][1]:
+            value = values[field]
+            if kind == 'uint':
+                _write_varint(out, int(value))
+            elif kind == 'str':
+                raw = str(value).encode('utf-8')
+                _write_varint(out, len(raw))
+                out.extend(raw)
+            else:
+                _encode_ids(out, value)
+        data = PREFIX + base64.urlsafe_b64encode(bytes(out)).decode('ascii').rstrip('=')
+        if len(data) > MAX_CALLBACK_DATA:
+            raise ValueError(f"Callback data for '{name}' is {len(data)} bytes, limit {MAX_CALLBACK_DATA}")
+        return data
+
+    def fits(self, name: str, **values) -> bool:
+        try:
+            self.encode(name, **values)
+        except ValueError:
+            return False
+        return True
+
+    def decode(self, data: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(route name, fields) or None if data is not valid for this codec"""
+        if not self.is_encoded(data) or len(data) > MAX_CALLBACK_DATA:
+            return None
+        body = data[len(PREFIX):]
+        try:
+            raw = base64.urlsafe_b64decode(body + '=' * (-len(body) % 4))
+            if not raw or raw[0] != VERSION:
+                return None
+            route_id, pos = _read_varint(raw, 1)
+            route = self._by_id.get(route_id)
+            if route is None:
+                return None
+            name, fields = route
+            values = {}
+            for field, kind in fields:
+                if kind == 'uint':
+                    values[field], pos = _read_varint(raw, pos)
+                elif kind == 'str':
+                    size, pos = _read_varint(raw, pos)
+                    if pos + size > len(raw):
+                        return None
+                    values[field] = raw[pos:pos + size].decode('utf-8')
+                    pos += size
+                else:
+                    values[field], pos = _read_ids(raw, pos)
+            if pos != len(raw):
+                return None
+            return name, values
+        except (ValueError, binascii.Error, UnicodeDecodeError) as e:
+            logger.debug(f"Invalid compact callback data {data!r}: {e}")
+            return None
+
+callback_codec = CallbackCodec()
+# Route ids are part of the wire format, append only
+callback_codec.register(1, 'pick_model', [('kind', 'uint'), ('action', 'uint'), ('target_id', 'uint'),
+                                          ('model_id', 'uint'), ('selected', 'ids')])
+callback_codec.register(2, 'pick_confirm', [('kind', 'uint'), ('action', 'uint'), ('target_id', 'uint'),
+                                            ('selected', 'ids')])
@@ -0,0 +1,205 @@
+"""
+Table-driven router for callback_data.
+Routes are registered with patterns like 'admin_ticket_close_{ticket_id:int}':
+literal prefix followed by '_'-separated typed parameters
+(int, str = one segment, rest = remainder of the string).
+
+Dispatch: exact map for routes without parameters, otherwise longest literal
+prefix from a character trie (falls back to shorter prefixes if parameters
+do not parse). Registration order does not matter, so a route can no longer
+hide another one registered later.
+Compact callback data ('~...', see callback_codec) is decoded first and
+dispatched by route name to handlers registered with add_compact().
+Routes added with navigation=True only render a view, so the update
+processor may drop or cancel them when a newer click on the same message
+arrives (latest wins).
+Handlers run with a time budget: the route timeout, or the router default
+for navigation routes. Other routes change data and get no default budget,
+as cancelling them after a commit would lose the reply and invite a repeat.
+On timeout the handler is cancelled, so its try/finally blocks (DB session
+close) run, and HandlerTimeout carrying the route is raised to the caller.
+Cancellation happens at an await only: the budget does not bound blocking
+work such as synchronous database calls.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from callback_codec import CallbackCodec, callback_codec
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_PARAM_RE = re.compile(r'\{(\w+)(?::(int|str|rest))?\}')
+_CONVERTERS = {'int': int, 'str': str, 'rest': str}
+
+class HandlerTimeout(Exception):
+    """Handler did not finish within its time budget"""
+    def __init__(self, route: 'Route', timeout: float):
+        super().__init__(f"Handler of '{route.pattern}' timed out after {timeout}s")
+        self.route = route
+        self.pattern = route.pattern
+        self.timeout = timeout
+
+    @property
+    def navigation(self) -> bool:
+        """Timed out handler only renders a view, so it is safe to repeat"""
+        return self.route.navigation
+
+class Route:
+    def __init__(self, pattern: str, handler: Callable[..., Awaitable[Any]], navigation: bool = False,
+                 timeout: Optional[float] = None):
+        self.pattern = pattern
+        self.handler = handler
+        self.navigation = navigation
+        self.timeout = timeout
+        first = pattern.find('{')
+        self.prefix = pattern if first < 0 else pattern[:first]
+        self.params: List[Tuple[str, str]] = []
+        if first >= 0:
+            spec = pattern[first:]
+            matches = list(_PARAM_RE.finditer(spec))
+            if '_'.join(match.group(0) for match in matches) != spec:
+                raise ValueError(f"Bad route pattern '{pattern}': parameters must be '_'-separated")
+            for index, match in enumerate(matches):
+                kind = match.group(2) or 'str'
+                if kind == 'rest' and index != len(matches) - 1:
+                    raise ValueError(f"Bad route pattern '{pattern}': rest parameter must be last")
+                self.params.append((match.group(1), kind))
+
+    def parse(self, remainder: str) -> Optional[Dict[str, Any]]:
+        """Parse parameters from data after prefix, None if it does not fit"""
+        if not self.params:
+            return {} if remainder == '' else None
+        if self.params[-1][1] == 'rest':
+            parts = remainder.split('_', len(self.params) - 1)
+        else:
+            parts = remainder.split('_')
+        if len(parts) != len(self.params) or any(part == '' for part in parts):
+            return None
+        try:
+            return {name: _CONVERTERS[kind](part) for (name, kind), part in zip(self.params, parts)}
+        except ValueError:
+            return None
+
+    def __repr__(self):
+        return f"<Route '{self.pattern}'>"
+
+class _TrieNode:
+    __slots__ = ('children', 'routes')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.routes: List[Route] = []
+
+class CallbackRouter:
+    def __init__(self, codec: CallbackCodec = callback_codec, default_timeout: Optional[float] = None):
+        self.codec = codec
+        self.default_timeout = default_timeout
+        self._compact: Dict[str, Route] = {}
+        self._exact: Dict[str, Route] = {}
+        self._root = _TrieNode()
+        self._routes: List[Route] = []
+
+    def add(self, pattern: str, handler: Callable[..., Awaitable[Any]], navigation: bool = False,
+            timeout: Optional[float] = None) -> Route:
+        """Register handler(query, context, lang, **params) for pattern"""
+        route = Route(pattern, handler, navigation, timeout)
+        if not route.params:
+            if pattern in self._exact:
+                raise ValueError(f"Duplicate route '{pattern}'")
+            self._exact[pattern] = route
+        else:
+            node = self._root
+            for char in route.prefix:
+                node = node.children.setdefault(char, _TrieNode())
+            for other in node.routes:
+                if len(other.params) == len(route.params):
+                    raise ValueError(f"Route '{pattern}' conflicts with '{other.pattern}'")
+            node.routes.append(route)
+        self._routes.append(route)
+        return route
+
+    def add_compact(self, name: str, handler: Callable[..., Awaitable[Any]],
+                    timeout: Optional[float] = None) -> Route:
+        """Register handler(query, context, lang, **fields) for compact route name"""
+        if name in self._compact:
+            raise ValueError(f"Duplicate compact route '{name}'")
+        route = self._compact[name] = Route(name, handler, timeout=timeout)
+        return route
+
+    def match(self, data: str) -> Tuple[Optional[Route], Dict[str, Any]]:
+        """Find route and parameters for callback data"""
+        if self.codec and self.codec.is_encoded(data):
+            decoded = self.codec.decode(data)
+            if decoded is None:
+                metrics.incr('callback.invalid')
+                return None, {}
+            name, fields = decoded
+            return self._compact.get(name), fields
+        route = self._exact.get(data)
+        if route:
+            return route, {}
+        # Collect nodes along the path, then try longest prefix first
+        candidates = []
+        node = self._root
+        for index, char in enumerate(data):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.routes:
+                candidates.append((index + 1, node.routes))
+        for length, routes in reversed(candidates):
+            for route in routes:
+                params = route.parse(data[length:])
+                if params is not None:
+                    return route, params
+        return None, {}
+
+    def is_navigation(self, data: Optional[str]) -> bool:
+        """True if data is routed to a view-only handler"""
+        if not data:
+            return False
+        route, _ = self.match(data)
+        return bool(route and route.navigation)
+
+    async def dispatch(self, data: str, *args) -> bool:
+        """Call matching handler with args + params, return False if no route matched.
+        Raises HandlerTimeout if handler exceeds its time budget."""
+        route, params = self.match(data)
+        if not route:
+            metrics.incr('callback.unmatched')
+            return False
+        timeout = route.timeout or (self.default_timeout if route.navigation else None)
+        started = time.monotonic()
+        try:
+            if timeout:
+                await asyncio.wait_for(route.handler(*args, **params), timeout)
+            else:
+                await route.handler(*args, **params)
+        except asyncio.TimeoutError:
+            metrics.incr(f'callback.timeout.{route.pattern}')
+            raise HandlerTimeout(route, timeout)
+        finally:
+            metrics.observe(f'callback.{route.pattern}', time.monotonic() - started)
+        return True
+
+    def overlaps(self) -> List[Tuple[str, str]]:
+        """Pairs (shorter, longer) where the shorter route's parameters could also
+        capture data of the longer route. Longest prefix wins, listed for review."""
+        result = []
+        routes = sorted(self._routes, key=lambda route: len(route.prefix))
+        for i, short in enumerate(routes):
+            if not short.params:
+                continue
+            for long in routes[i + 1:]:
+                # Exact routes always win, only prefix routes can be shadowed
+                if not long.params or long.prefix == short.prefix or not long.prefix.startswith(short.prefix):
+                    continue
+                next_segment = long.prefix[len(short.prefix):].split('_')[0]
+                if short.params[0][1] != 'int' or next_segment.isdigit():
+                    result.append((short.pattern, long.pattern))
+        return result
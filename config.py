@@ -9,6 +9,11 @@ ADMIN_CHAT_IDS = [int(x.strip()) for x in os.getenv('ADMIN_CHAT_IDS', '').split(
 DB_URL = os.getenv('DB_URL', 'sqlite:///data.db')
 MODE = os.getenv('MODE', 'POLLING')
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Checked against X-Telegram-Bot-Api-Secret-Token
+PORT = int(os.getenv('PORT', '8080'))  # Webhook, /health and /metrics
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # Required to read /metrics (Bearer token or ?token=)
+# Optional staff forum supergroup: ticket events go to one topic per ticket instead of each admin
+STAFF_FORUM_CHAT_ID = int(os.getenv('STAFF_FORUM_CHAT_ID')) if os.getenv('STAFF_FORUM_CHAT_ID') else None
 
 # Validation
 if not BOT_TOKEN:
@@ -17,7 +22,46 @@ if not BOT_TOKEN:
 if not ADMIN_CHAT_IDS:
     raise ValueError("ADMIN_CHAT_IDS is required in .env file")
 
+# All replicas must register and check the same secret, so it can not be generated per process
+if MODE == 'WEBHOOK' and WEBHOOK_URL and not WEBHOOK_SECRET:
+    raise ValueError("WEBHOOK_SECRET is required in .env file for webhook mode")
+
 # Bot settings
 PAGINATION_LIMIT = 10
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
 TICKET_CLEANUP_DAYS = 90
+PACKAGE_MODE = os.getenv('PACKAGE_MODE', 'album')  # album: media groups, zip: one cached archive
+
+# Outbound rate limit state: local, sqlite (RATE_LIMIT_URL = file path) or redis (RATE_LIMIT_URL = redis://...)
+# Use a shared backend when several replicas run with the same BOT_TOKEN
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'local')
+RATE_LIMIT_URL = os.getenv('RATE_LIMIT_URL')
+
+# Per-user flood control: sustained updates per second and burst size (admins are exempt)
+FLOOD_RATE = float(os.getenv('FLOOD_RATE', '1'))
+FLOOD_BURST = int(os.getenv('FLOOD_BURST', '8'))
+
+# Conversation states (admin wizards etc.): memory, sqlite (STATE_URL = file path) or redis (STATE_URL = redis://...)
+# Use sqlite or redis to keep states over restarts and share them between workers
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')
+STATE_URL = os.getenv('STATE_URL')
+STATE_TTL = int(os.getenv('STATE_TTL', '86400'))  # seconds since last change
+
+# Max updates processed at once (updates of one user are always sequential)
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))  # Webhook answers 503 when full
+# Load shedding: above this many waiting updates or this event loop lag (seconds) navigation clicks are shed
+ADMISSION_MAX_DEPTH = int(os.getenv('ADMISSION_MAX_DEPTH', '200'))
+ADMISSION_MAX_LAG = float(os.getenv('ADMISSION_MAX_LAG', '0.5'))
+UPDATE_DEDUP_WINDOW = int(os.getenv('UPDATE_DEDUP_WINDOW', '3600'))  # seconds update_id is remembered
+UPDATE_DEDUP_PERSIST = os.getenv('UPDATE_DEDUP_PERSIST', 'false').lower() == 'true'
+
+# Time budget of one button or message handler, seconds (file steps of admin wizards get SLOW_HANDLER_TIMEOUT)
+HANDLER_TIMEOUT = float(os.getenv('HANDLER_TIMEOUT', '20'))
+SLOW_HANDLER_TIMEOUT = float(os.getenv('SLOW_HANDLER_TIMEOUT', '60'))
+
+# Search cache
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '256'))
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '300'))  # seconds
+SEARCH_TOKEN_TTL = int(os.getenv('SEARCH_TOKEN_TTL', '900'))  # seconds, paging through search results
+SEARCH_RESULTS_LIMIT = 500  # Max results kept per search query
@@ -0,0 +1,100 @@
+"""
+Bounded debounce and per-user flood control.
+- Debouncer: drops exact repeats of (user, callback_data) within a window.
+  Keys live in two time buckets that are rotated every window, so old keys
+  are dropped wholesale and memory is capped by max_entries.
+- FloodControl: token bucket per user in a bounded LRU. Registered as
+  TypeHandler before all other handlers, so throttled updates never reach
+  the database. Throttled callback queries get a short toast.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from metrics import metrics
+from texts import get_text
+
+logger = logging.getLogger(__name__)
+
+class Debouncer:
+    def __init__(self, window: float = 0.5, max_entries: int = 20000):
+        self.window = window
+        self.max_entries = max_entries
+        self._current: Dict[Hashable, float] = {}
+        self._previous: Dict[Hashable, float] = {}
+        self._rotated_at = time.monotonic()
+
+    def _rotate(self, now: float):
+        if now - self._rotated_at < self.window:
+            return
+        # Everything older than two windows is gone at once
+        self._previous = self._current if now - self._rotated_at < 2 * self.window else {}
+        self._current = {}
+        self._rotated_at = now
+
+    def is_repeat(self, user_id: int, data: str) -> bool:
+        """True if the same data came from user less than window ago"""
+        now = time.monotonic()
+        self._rotate(now)
+        key = (user_id, data)
+        seen_at = self._current.get(key, self._previous.get(key))
+        if seen_at is not None and now - seen_at < self.window:
+            return True
+        if len(self._current) < self.max_entries:
+            self._current[key] = now
+        else:
+            metrics.incr('debounce.full')
+        return False
+
+    def stats(self) -> dict:
+        return {'entries': len(self._current) + len(self._previous), 'max_entries': self.max_entries}
+
+class FloodControl:
+    def __init__(self, rate: float = 1.0, burst: float = 8, max_users: int = 10000,
+                 exempt: Optional[Callable[[int], bool]] = None, lang: Callable[[int], str] = lambda user_id: 'ru'):
+        """rate: sustained updates per second per user, burst: bucket size"""
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.exempt = exempt
+        self.lang = lang
+        self._buckets = OrderedDict()  # user_id -> (tokens, updated)
+        self.throttled = 0
+
+    def allow(self, user_id: int) -> bool:
+        """Take one token of user, False if the user sends too fast"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[user_id] = (tokens, now)
+        # Least recently active users first; a forgotten user starts with a full bucket
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return allowed
+
+    async def check_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """TypeHandler callback: stop updates of users over their rate"""
+        user = update.effective_user
+        if not user or (self.exempt and self.exempt(user.id)) or self.allow(user.id):
+            return
+        self.throttled += 1
+        metrics.incr('flood.throttled')
+        if update.callback_query:
+            try:
+                await update.callback_query.answer(get_text('too_many_requests', self.lang(user.id)))
+            except TelegramError as e:
+                logger.warning(f"Failed to answer throttled callback of {user.id}: {e}")
+        logger.info(f"Throttled update {update.update_id} from user {user.id}")
+        raise ApplicationHandlerStop
+
+    def stats(self) -> dict:
+        return {'users': len(self._buckets), 'max_users': self.max_users, 'throttled': self.throttled}
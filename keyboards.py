@@ -1,6 +1,7 @@
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
-from models import Model, Instruction, Ticket, TicketStatus, InstructionType
+from models import Model, Instruction, Ticket, TicketStatus, InstructionType, Category
 from texts import get_text
+from callback_codec import callback_codec
 from typing import List, Optional
 import math
 
@@ -17,8 +18,8 @@ def main_menu_keyboard(lang: str = 'ru') -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(buttons)
 
 def models_keyboard(models: List[Model], page: int = 0, total_pages: int = 1, 
-                   lang: str = 'ru') -> InlineKeyboardMarkup:
-    """Models list keyboard with pagination"""
+                   lang: str = 'ru', page_prefix: str = 'models_page_') -> InlineKeyboardMarkup:
+    """Models list keyboard with pagination (page_prefix + page number in arrows)"""
     buttons = []
     
     # Add models
@@ -32,15 +33,148 @@ def models_keyboard(models: List[Model], page: int = 0, total_pages: int = 1,
     if total_pages > 1:
         nav_buttons = []
         if page > 0:
-            nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f'models_page_{page-1}'))
+            nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f'{page_prefix}{page-1}'))
         nav_buttons.append(InlineKeyboardButton(f"{page+1}/{total_pages}", callback_data='current_page'))
         if page < total_pages - 1:
-            nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f'models_page_{page+1}'))
+            nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f'{page_prefix}{page+1}'))
         buttons.append(nav_buttons)
     
     # Add search and back buttons
     buttons.append([
         InlineKeyboardButton(get_text('search_model', lang), callback_data='search_model'),
+        InlineKeyboardButton(get_text('browse_tags', lang), callback_data='tags')
+    ])
+    buttons.append([
+        InlineKeyboardButton(get_text('browse_catalog', lang), callback_data='catalog'),
+        InlineKeyboardButton(get_text('back_to_menu', lang), callback_data='main_menu')
+    ])
+    
+    return InlineKeyboardMarkup(buttons)
+
+def catalog_keyboard(category: Optional[Category], children: List[Category], models: List[Model],
+                     page: int = 0, total_pages: int = 1, lang: str = 'ru') -> InlineKeyboardMarkup:
+    """Catalog tree node keyboard: subcategories, then models attached to the node"""
+    buttons = []
+    
+    for child in children:
+        buttons.append([InlineKeyboardButton(
+            f"📁 {child.name}",
+            callback_data=f'catalog_{child.id}_0'
+        )])
+    
+    for model in models:
+        buttons.append([InlineKeyboardButton(
+            model.name, 
+            callback_data=f'model_{model.id}'
+        )])
+    
+    if category:
+        # Add pagination
+        if total_pages > 1:
+            nav_buttons = []
+            if page > 0:
+                nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f'catalog_{category.id}_{page-1}'))
+            nav_buttons.append(InlineKeyboardButton(f"{page+1}/{total_pages}", callback_data='current_page'))
+            if page < total_pages - 1:
+                nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f'catalog_{category.id}_{page+1}'))
+            buttons.append(nav_buttons)
+        if children:
+            buttons.append([InlineKeyboardButton(
+                get_text('catalog_all_models', lang),
+                callback_data=f'catalog_all_{category.id}_0'
+            )])
+        back = f'catalog_{category.parent_id}_0' if category.parent_id else 'catalog'
+        buttons.append([
+            InlineKeyboardButton(get_text('back', lang), callback_data=back),
+            InlineKeyboardButton(get_text('back_to_menu', lang), callback_data='main_menu')
+        ])
+    else:
+        buttons.append([
+            InlineKeyboardButton(get_text('back_to_models', lang), callback_data='choose_model'),
+            InlineKeyboardButton(get_text('back_to_menu', lang), callback_data='main_menu')
+        ])
+    
+    return InlineKeyboardMarkup(buttons)
+
+def catalog_subtree_keyboard(models: List[Model], category: Category, page: int = 0, 
+                             total_pages: int = 1, lang: str = 'ru') -> InlineKeyboardMarkup:
+    """All models of a catalog subtree keyboard with pagination"""
+    buttons = []
+    
+    for model in models:
+        buttons.append([InlineKeyboardButton(
+            model.name, 
+            callback_data=f'model_{model.id}'
+        )])
+    
+    # Add pagination
+    if total_pages > 1:
+        nav_buttons = []
+        if page > 0:
+            nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f'catalog_all_{category.id}_{page-1}'))
+        nav_buttons.append(InlineKeyboardButton(f"{page+1}/{total_pages}", callback_data='current_page'))
+        if page < total_pages - 1:
+            nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f'catalog_all_{category.id}_{page+1}'))
+        buttons.append(nav_buttons)
+    
+    buttons.append([
+        InlineKeyboardButton(get_text('back', lang), callback_data=f'catalog_{category.id}_0'),
+        InlineKeyboardButton(get_text('back_to_menu', lang), callback_data='main_menu')
+    ])
+    
+    return InlineKeyboardMarkup(buttons)
+
+def tags_keyboard(tags: List, page: int = 0, total_pages: int = 1, 
+                  lang: str = 'ru') -> InlineKeyboardMarkup:
+    """Tag facets keyboard: (tag, models count) pairs with pagination"""
+    buttons = []
+    
+    for tag, count in tags:
+        buttons.append([InlineKeyboardButton(
+            f"🏷️ {tag.name} ({count})",
+            callback_data=f'tag_{tag.id}_0'
+        )])
+    
+    # Add pagination
+    if total_pages > 1:
+        nav_buttons = []
+        if page > 0:
+            nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f'tags_page_{page-1}'))
+        nav_buttons.append(InlineKeyboardButton(f"{page+1}/{total_pages}", callback_data='current_page'))
+        if page < total_pages - 1:
+            nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f'tags_page_{page+1}'))
+        buttons.append(nav_buttons)
+    
+    buttons.append([
+        InlineKeyboardButton(get_text('back_to_models', lang), callback_data='choose_model'),
+        InlineKeyboardButton(get_text('back_to_menu', lang), callback_data='main_menu')
+    ])
+    
+    return InlineKeyboardMarkup(buttons)
+
+def tag_models_keyboard(models: List[Model], tag_id: int, page: int = 0, total_pages: int = 1, 
+                        lang: str = 'ru') -> InlineKeyboardMarkup:
+    """Models with a tag keyboard with pagination"""
+    buttons = []
+    
+    for model in models:
+        buttons.append([InlineKeyboardButton(
+            model.name, 
+            callback_data=f'model_{model.id}'
+        )])
+    
+    # Add pagination
+    if total_pages > 1:
+        nav_buttons = []
+        if page > 0:
+            nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f'tag_{tag_id}_{page-1}'))
+        nav_buttons.append(InlineKeyboardButton(f"{page+1}/{total_pages}", callback_data='current_page'))
+        if page < total_pages - 1:
+            nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f'tag_{tag_id}_{page+1}'))
+        buttons.append(nav_buttons)
+    
+    buttons.append([
+        InlineKeyboardButton(get_text('back', lang), callback_data='tags'),
         InlineKeyboardButton(get_text('back_to_menu', lang), callback_data='main_menu')
     ])
     
@@ -180,6 +314,7 @@ def admin_menu_keyboard(lang: str = 'ru') -> InlineKeyboardMarkup:
         [InlineKeyboardButton(get_text('admin_recipes', lang), callback_data='admin_recipes')],
         [InlineKeyboardButton(get_text('admin_tickets', lang), callback_data='admin_tickets')],
         [InlineKeyboardButton(get_text('admin_settings', lang), callback_data='admin_settings')],
+        [InlineKeyboardButton(get_text('admin_metrics', lang), callback_data='admin_metrics')],
         [InlineKeyboardButton(get_text('back_to_menu', lang), callback_data='main_menu')]
     ]
     return InlineKeyboardMarkup(buttons)
@@ -299,6 +434,19 @@ def cancel_keyboard(lang: str = 'ru') -> InlineKeyboardMarkup:
     buttons = [[InlineKeyboardButton(get_text('cancel', lang), callback_data='cancel')]]
     return InlineKeyboardMarkup(buttons)
 
+def task_progress_keyboard(task_id: int, lang: str = 'ru') -> InlineKeyboardMarkup:
+    """Cancel button for background task progress message"""
+    buttons = [[InlineKeyboardButton(get_text('task_cancel', lang), callback_data=f'task_cancel_{task_id}')]]
+    return InlineKeyboardMarkup(buttons)
+
+def retry_keyboard(callback_data: str, lang: str = 'ru') -> InlineKeyboardMarkup:
+    """Repeat the timed out button, or go to main menu"""
+    buttons = [
+        [InlineKeyboardButton(get_text('retry', lang), callback_data=callback_data)],
+        [InlineKeyboardButton(get_text('to_main_menu', lang), callback_data='main_menu')]
+    ]
+    return InlineKeyboardMarkup(buttons)
+
 def back_cancel_keyboard(lang: str = 'ru') -> InlineKeyboardMarkup:
     """Back and cancel keyboard"""
     buttons = [
@@ -406,33 +554,50 @@ def model_recipes_keyboard(recipes: List, model_id: int, lang: str = 'ru') -> In
     
     return InlineKeyboardMarkup(buttons)
 
-def models_selection_keyboard(models: List[Model], instruction_id: int, action: str, 
-                             selected_models: List[int] = None, lang: str = 'ru') -> InlineKeyboardMarkup:
-    """Models selection keyboard for binding/unbinding instructions"""
-    if selected_models is None:
-        selected_models = []
+# Model picker: selection state travels in compact callback data (callback_codec)
+PICK_INSTRUCTION, PICK_RECIPE = 0, 1
+PICK_BIND, PICK_UNBIND = 0, 1
+
+def models_selection_keyboard(models: List[Model], target_id: int, action: int,
+                              selected_models: List[int] = None, lang: str = 'ru',
+                              kind: int = PICK_INSTRUCTION, bound_models: List[int] = None) -> InlineKeyboardMarkup:
+    """Models selection keyboard for binding/unbinding instructions and recipes.
+    bound_models are shown as already bound and can not be picked again."""
+    selected = sorted(set(selected_models or []))
+    bound = set(bound_models or [])
+    state = {'kind': kind, 'action': action, 'target_id': target_id}
     
     buttons = []
     
     for model in models:
+        if model.id in bound:
+            # Bound models stay out of the selection, so it fits into callback data
+            buttons.append([InlineKeyboardButton(f"🔗 {model.name}", callback_data='current_page')])
+            continue
         # Check if model is selected
-        is_selected = model.id in selected_models
+        is_selected = model.id in selected
         prefix = "✅" if is_selected else "⬜"
-        
-        buttons.append([InlineKeyboardButton(
-            f"{prefix} {model.name}",
-            callback_data=f'select_model_{model.id}_{instruction_id}_{action}'
-        )])
+        # Button carries current selection, handler toggles model_id
+        if is_selected or callback_codec.fits('pick_model', model_id=model.id, selected=selected + [model.id], **state):
+            callback_data = callback_codec.encode('pick_model', model_id=model.id, selected=selected, **state)
+        else:
+            # Selection no longer fits into callback data
+            callback_data = 'current_page'
+        buttons.append([InlineKeyboardButton(f"{prefix} {model.name}", callback_data=callback_data)])
     
     # Add action buttons
-    if selected_models:
-        action_text = get_text('bind_instruction_to_models', lang) if action == 'bind' else get_text('unbind_from_models', lang)
+    if selected:
+        if kind == PICK_RECIPE:
+            action_text = get_text('bind_recipe_to_models' if action == PICK_BIND else 'unbind_recipe_from_models', lang)
+        else:
+            action_text = get_text('bind_instruction_to_models' if action == PICK_BIND else 'unbind_from_models', lang)
         buttons.append([InlineKeyboardButton(
-            f"{action_text} ({len(selected_models)})",
-            callback_data=f'confirm_{action}_instruction_{instruction_id}'
+            f"{action_text} ({len(selected)})",
+            callback_data=callback_codec.encode('pick_confirm', selected=selected, **state)
         )])
     
-    buttons.append([InlineKeyboardButton(get_text('cancel', lang), callback_data='admin_list_instructions')])
+    cancel_data = 'admin_list_recipes' if kind == PICK_RECIPE else 'admin_list_instructions'
+    buttons.append([InlineKeyboardButton(get_text('cancel', lang), callback_data=cancel_data)])
     return InlineKeyboardMarkup(buttons)
 
 def new_instruction_models_keyboard(models: List[Model], selected_models: List[int] = None, 
@@ -0,0 +1,76 @@
+"""
+In-process metrics registry: counters, gauges and timings.
+Components may also register providers that report their own stats.
+"""
+
+import threading
+from typing import Callable, Dict
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, list] = {}  # name -> [count, total, max]
+        self._providers: Dict[str, Callable[[], dict]] = {}
+    
+    def incr(self, name: str, value: float = 1):
+        """Increase counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+    
+    def set_gauge(self, name: str, value: float):
+        """Set gauge to current value"""
+        with self._lock:
+            self._gauges[name] = value
+    
+    def observe(self, name: str, seconds: float):
+        """Record duration"""
+        with self._lock:
+            timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+    
+    def register_provider(self, name: str, provider: Callable[[], dict]):
+        """Register callable returning a dict of stats to include in snapshots"""
+        self._providers[name] = provider
+    
+    def snapshot(self) -> dict:
+        """Get copy of all metrics"""
+        with self._lock:
+            data = {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'timings': {
+                    name: {'count': count, 'avg': total / count if count else 0.0, 'max': max_value}
+                    for name, (count, total, max_value) in self._timings.items()
+                }
+            }
+        for name, provider in self._providers.items():
+            try:
+                data[name] = provider()
+            except Exception as e:
+                data[name] = {'error': str(e)}
+        return data
+    
+    def format_text(self) -> str:
+        """Format snapshot as plain text for admins"""
+        snapshot = self.snapshot()
+        lines = []
+        for section, values in snapshot.items():
+            if not values:
+                continue
+            lines.append(f"[{section}]")
+            for name in sorted(values):
+                value = values[name]
+                if isinstance(value, dict):
+                    value = ", ".join(
+                        f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in value.items()
+                    )
+                elif isinstance(value, float):
+                    value = f"{value:.3f}"
+                lines.append(f"{name}: {value}")
+        return "\n".join(lines) or "Нет данных"
+
+metrics = Metrics()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Database migration script
+Creates missing tables and backfills data for new schema features.
+Safe to run multiple times.
+"""
+
+from sqlalchemy import inspect, text
+from models import Base, create_tables, get_engine, get_session, Model
+from services.tags_service import TagsService
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def add_missing_columns(engine) -> int:
+    """Add columns that exist in models but not in the database.
+    create_all() creates new tables but never alters existing ones."""
+    inspector = inspect(engine)
+    added = 0
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                for index in table.indexes:
+                    if [c.name for c in index.columns] == [column.name]:
+                        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {index.name} ON {table.name} ({column.name})'))
+                logger.info(f"Added column {table.name}.{column.name}")
+                added += 1
+    return added
+
+def migrate_model_tags(db) -> int:
+    """Parse legacy CSV Model.tags into the normalized tags table"""
+    tags_service = TagsService(db)
+    migrated = 0
+    models = db.query(Model).filter(Model.tags.isnot(None), Model.tags != '').all()
+    for model in models:
+        if model.tag_items:
+            continue
+        tags_service.set_model_tags(model, model.tags, commit=False)
+        migrated += 1
+    db.commit()
+    if migrated:
+        logger.info(f"Migrated CSV tags for {migrated} models")
+    return migrated
+
+def run_migrations():
+    """Run all migrations"""
+    logger.info("Creating missing database tables...")
+    create_tables()
+    add_missing_columns(get_engine())
+    
+    db = get_session()
+    try:
+        migrate_model_tags(db)
+    except Exception as e:
+        logger.error(f"Error running migrations: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    run_migrations()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Table, Enum
+from sqlalchemy import create_engine, Column, Integer, BigInteger, Boolean, String, Text, DateTime, ForeignKey, Table, Enum, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -26,6 +26,11 @@ class FileType(enum.Enum):
     VOICE = "voice"
     VIDEO = "video"
 
+class OutboxStatus(enum.Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    DEAD = "dead"
+
 # Many-to-many relationship between models and instructions
 model_instruction = Table(
     'model_instruction',
@@ -35,6 +40,17 @@ model_instruction = Table(
     Column('instruction_id', Integer, ForeignKey('instructions.id'))
 )
 
+# Many-to-many relationship between models and tags (inverted index: tag -> models)
+model_tag = Table(
+    'model_tag',
+    Base.metadata,
+    Column('id', Integer, primary_key=True),
+    Column('model_id', Integer, ForeignKey('models.id'), nullable=False),
+    Column('tag_id', Integer, ForeignKey('tags.id'), nullable=False),
+    Index('ix_model_tag_tag_model', 'tag_id', 'model_id', unique=True),
+    Index('ix_model_tag_model', 'model_id')
+)
+
 # Many-to-many relationship between models and recipes
 model_recipe = Table(
     'model_recipe',
@@ -50,17 +66,79 @@ class Model(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(255), unique=True, nullable=False)
     description = Column(Text)
-    tags = Column(String(500))  # CSV format
+    tags = Column(String(500))  # CSV format, kept in sync with tag_items
+    category_id = Column(Integer, ForeignKey('categories.id'), nullable=True, index=True)
+    # Cached Telegram file_id of uploaded ZIP packages, reset when bindings change
+    instructions_zip_file_id = Column(String(255), nullable=True)
+    recipes_zip_file_id = Column(String(255), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     instructions = relationship("Instruction", secondary=model_instruction, back_populates="models")
     recipes = relationship("Recipe", secondary=model_recipe, back_populates="models")
+    codes = relationship("ModelCode", back_populates="model", cascade="all, delete-orphan")
+    tag_items = relationship("Tag", secondary=model_tag, back_populates="models")
+    category = relationship("Category", back_populates="models")
     
     def __repr__(self):
         return f"<Model(id={self.id}, name='{self.name}')>"
 
+class ModelCode(Base):
+    """Marketplace article number / SKU of a model (Ozon and others)"""
+    __tablename__ = 'model_codes'
+    
+    id = Column(Integer, primary_key=True)
+    model_id = Column(Integer, ForeignKey('models.id'), nullable=False, index=True)
+    code = Column(String(64), nullable=False)  # Normalized, see normalize_code()
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    model = relationship("Model", back_populates="codes")
+    
+    __table_args__ = (
+        Index('ix_model_codes_code', 'code', unique=True),
+    )
+    
+    def __repr__(self):
+        return f"<ModelCode(id={self.id}, model_id={self.model_id}, code='{self.code}')>"
+
+class Category(Base):
+    """Catalog tree node (category or brand) stored as a materialized path"""
+    __tablename__ = 'categories'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=False)
+    parent_id = Column(Integer, ForeignKey('categories.id'), nullable=True, index=True)
+    path = Column(String(255), nullable=False, default='/')  # '/1/4/' - ids from root to this node
+    depth = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    parent = relationship("Category", remote_side=[id])
+    models = relationship("Model", back_populates="category")
+    
+    __table_args__ = (
+        Index('ix_categories_path', 'path'),
+        Index('ix_categories_parent_name', 'parent_id', 'name', unique=True),
+    )
+    
+    def __repr__(self):
+        return f"<Category(id={self.id}, name='{self.name}', path='{self.path}')>"
+
+class Tag(Base):
+    __tablename__ = 'tags'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), unique=True, nullable=False, index=True)  # Lower case
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    models = relationship("Model", secondary=model_tag, back_populates="tag_items")
+    
+    def __repr__(self):
+        return f"<Tag(id={self.id}, name='{self.name}')>"
+
 class Instruction(Base):
     __tablename__ = 'instructions'
     
@@ -108,6 +186,7 @@ class Ticket(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     closed_at = Column(DateTime, nullable=True)
+    thread_id = Column(Integer, nullable=True)  # Topic in staff forum (STAFF_FORUM_CHAT_ID)
     
     # Relationships
     messages = relationship("TicketMessage", back_populates="ticket", cascade="all, delete-orphan")
@@ -132,6 +211,40 @@ class TicketMessage(Base):
     def __repr__(self):
         return f"<TicketMessage(id={self.id}, ticket_id={self.ticket_id}, from_role='{self.from_role.value}')>"
 
+class OutboxMessage(Base):
+    """Notification waiting for delivery, written in the same transaction as the change it reports"""
+    __tablename__ = 'outbox_messages'
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=True)  # Direct message to user/admin
+    ticket_id = Column(Integer, nullable=True)  # Ticket event: posted to staff forum topic when chat_id is empty
+    forum_only = Column(Boolean, default=False)  # Ticket event not sent to admins when forum posting fails
+    text = Column(Text, nullable=False)
+    parse_mode = Column(String(16))
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(String(500))
+    # Sender replica delivering the message; an expired lease can be claimed by another one
+    claimed_by = Column(String(64), nullable=True)
+    lease_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    def __repr__(self):
+        return f"<OutboxMessage(id={self.id}, status='{self.status.value}', attempts={self.attempts})>"
+
+class ProcessedUpdate(Base):
+    """Telegram update_id already handled (persistent part of update de-duplication)"""
+    __tablename__ = 'processed_updates'
+    
+    update_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
 # Database setup
 def get_engine():
     from config import DB_URL
@@ -0,0 +1,98 @@
+"""
+Admin notifications.
+Fan-out runs as background task, so the user reply does not wait for admin
+deliveries; sends go concurrently through the outbound dispatcher, which
+keeps them within Telegram limits.
+
+Ticket events: if STAFF_FORUM_CHAT_ID is set, each event is posted once into
+the staff forum supergroup, in a topic created per ticket (Ticket.thread_id).
+Without a forum the outbox queues one message per admin instead.
+"""
+
+import asyncio
+import logging
+import time
+import weakref
+from typing import Iterable, Optional
+
+from telegram.error import TelegramError
+
+from config import ADMIN_CHAT_IDS, STAFF_FORUM_CHAT_ID
+from metrics import metrics
+from models import get_session
+from services.support_service import SupportService
+
+logger = logging.getLogger(__name__)
+
+# Keep references so tasks are not garbage collected before they finish
+_background_tasks = set()
+# One lock per ticket so concurrent events do not create two topics
+_topic_locks = weakref.WeakValueDictionary()
+
+async def _send_to_admin(bot, admin_id: int, text: str, kwargs: dict) -> bool:
+    try:
+        await bot.send_message(chat_id=admin_id, text=text, **kwargs)
+        metrics.incr('notifications.delivered')
+        return True
+    except TelegramError as e:
+        logger.error(f"Failed to send message to admin {admin_id}: {e}")
+        metrics.incr('notifications.failed')
+        return False
+
+async def send_to_admins(bot, text: str, admin_ids: Optional[Iterable[int]] = None, **kwargs) -> int:
+    """Send text to all admins concurrently, return number of successful deliveries"""
+    admin_ids = list(ADMIN_CHAT_IDS if admin_ids is None else admin_ids)
+    started = time.monotonic()
+    results = await asyncio.gather(*(_send_to_admin(bot, admin_id, text, kwargs) for admin_id in admin_ids))
+    metrics.observe('notifications.fanout', time.monotonic() - started)
+    return sum(results)
+
+def _schedule(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def notify_admins(bot, text: str, admin_ids: Optional[Iterable[int]] = None, **kwargs) -> asyncio.Task:
+    """Schedule admin notification without waiting for it"""
+    return _schedule(send_to_admins(bot, text, admin_ids, **kwargs))
+
+async def get_ticket_thread(bot, ticket_id: int, topic_name: str = None) -> Optional[int]:
+    """Get forum topic of ticket, creating it on first event"""
+    lock = _topic_locks.get(ticket_id)
+    if lock is None:
+        lock = _topic_locks[ticket_id] = asyncio.Lock()
+    async with lock:
+        db = get_session()
+        try:
+            support_service = SupportService(db)
+            ticket = support_service.get_ticket_by_id(ticket_id)
+            if not ticket:
+                return None
+            if ticket.thread_id:
+                return ticket.thread_id
+            name = topic_name or f"T-{ticket_id} @{ticket.username or ticket.user_id}"
+            topic = await bot.create_forum_topic(chat_id=STAFF_FORUM_CHAT_ID, name=name[:128])
+            support_service.set_ticket_thread(ticket_id, topic.message_thread_id)
+            metrics.incr('notifications.topic_created')
+            return topic.message_thread_id
+        finally:
+            db.close()
+
+async def send_ticket_event(bot, ticket_id: int, text: str, forum_only: bool = False, **kwargs) -> int:
+    """Post ticket event into its forum topic (or to admins), return number of deliveries"""
+    if STAFF_FORUM_CHAT_ID:
+        try:
+            thread_id = await get_ticket_thread(bot, ticket_id)
+            if thread_id:
+                await bot.send_message(chat_id=STAFF_FORUM_CHAT_ID, message_thread_id=thread_id,
+                                       text=text, **kwargs)
+                metrics.incr('notifications.delivered')
+                return 1
+        except TelegramError as e:
+            logger.error(f"Failed to post ticket {ticket_id} event to staff forum: {e}")
+            metrics.incr('notifications.failed')
+    if forum_only:
+        # Status updates are made by admins themselves, only the forum history needs them
+        return 0
+    return await send_to_admins(bot, text, **kwargs)
@@ -0,0 +1,167 @@
+"""
+Outbound dispatcher for all Bot API requests.
+Plugged into the application as rate limiter: every send/edit made through
+context.bot passes process_request, so pacing lives in one place.
+
+- global token bucket (Telegram allows ~30 messages per second)
+- per-chat token bucket (~1 message per second, 20 per minute in groups)
+- per-chat FIFO lock: order inside a chat is kept, different chats run in parallel
+- interactive requests take global tokens before bulk ones
+  (pass rate_limit_args=BULK for package downloads, broadcasts etc.)
+- retries and circuit breaking via api_policy.RetryPolicy
+- bucket state in a pluggable backend (rate_limit_backends), so several
+  replicas can share one budget
+- redundant message edits are skipped by view_cache
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, Optional
+
+from telegram.ext import BaseRateLimiter
+
+from api_policy import RetryPolicy
+from rate_limit_backends import BucketBackend, LocalBucketBackend
+from view_cache import VIEW_ENDPOINTS, ViewCache, view_cache as default_view_cache
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BULK = {'priority': 'bulk'}
+
+class _ChatSlot:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+class OutboundDispatcher(BaseRateLimiter):
+    """Rate limiter enforcing global and per-chat Telegram limits"""
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 group_rate_per_minute: float = 20, max_idle_chats: int = 1000,
+                 policy: RetryPolicy = None, backend: BucketBackend = None,
+                 view_cache: ViewCache = default_view_cache):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate_per_minute = group_rate_per_minute
+        self.max_idle_chats = max_idle_chats
+        self._chats: Dict[Any, _ChatSlot] = {}
+        self._interactive_waiting = 0
+        self._pending = 0
+        self._paused_until = 0.0
+        self.policy = policy or RetryPolicy()
+        self.backend = backend or LocalBucketBackend()
+        self.view_cache = view_cache
+
+    async def initialize(self) -> None:
+        logger.info("Outbound dispatcher initialized")
+
+    async def shutdown(self) -> None:
+        self._chats.clear()
+        await self.backend.close()
+
+    def _chat_limits(self, chat_id) -> tuple:
+        """(rate per second, capacity) for chat bucket"""
+        if isinstance(chat_id, int) and chat_id < 0:
+            # Groups and channels: 20 messages per minute
+            return self.group_rate_per_minute / 60, self.group_rate_per_minute
+        return self.chat_rate, self.chat_burst
+
+    async def _take(self, key: str, rate: float, capacity: float, min_sleep: float = 0.0):
+        """Wait until a token is taken from backend bucket"""
+        while True:
+            wait = await self.backend.take(key, rate, capacity)
+            if wait <= 0:
+                return
+            await asyncio.sleep(max(wait, min_sleep))
+
+    def _get_slot(self, chat_id) -> _ChatSlot:
+        slot = self._chats.get(chat_id)
+        if slot is None:
+            if len(self._chats) >= self.max_idle_chats:
+                self._sweep()
+            slot = self._chats[chat_id] = _ChatSlot()
+        return slot
+
+    def _sweep(self):
+        """Forget chats with no pending requests"""
+        for chat_id in [c for c, s in self._chats.items() if not s.pending]:
+            del self._chats[chat_id]
+
+    def _pause(self, delay: float):
+        """Hold all chats after flood wait from Telegram"""
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    async def _wait_pause(self):
+        while self._paused_until > time.monotonic():
+            await asyncio.sleep(self._paused_until - time.monotonic())
+
+    async def _take_global(self, priority: str):
+        await self._wait_pause()
+        if priority == INTERACTIVE:
+            self._interactive_waiting += 1
+            try:
+                await self._take('global', self.global_rate, self.global_rate)
+            finally:
+                self._interactive_waiting -= 1
+        else:
+            # Bulk requests yield to any waiting interactive request, checked before
+            # every attempt so a bulk request never takes the token an interactive one waits for
+            while True:
+                if self._interactive_waiting:
+                    await asyncio.sleep(0.05)
+                    continue
+                wait = await self.backend.take('global', self.global_rate, self.global_rate)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(max(wait, 0.05))
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[dict],
+    ):
+        if self.view_cache is not None and endpoint in VIEW_ENDPOINTS:
+            return await self.view_cache.handle(
+                endpoint, args, data,
+                lambda send_endpoint, send_args: self._dispatch(
+                    callback, send_args, kwargs, send_endpoint, send_args[1] if len(send_args) == 2 else data,
+                    rate_limit_args
+                )
+            )
+        return await self._dispatch(callback, args, kwargs, endpoint, data, rate_limit_args)
+
+    async def _dispatch(self, callback, args, kwargs, endpoint: str, data: Dict[str, Any],
+                        rate_limit_args: Optional[dict]):
+        """Apply rate limits and retry policy to one API call"""
+        if endpoint == 'getUpdates':
+            # Polling has its own retry loop in the updater
+            return await callback(*args, **kwargs)
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # answerCallbackQuery, inline edits etc.: not limited per chat
+            return await self.policy.call(callback, args, kwargs, endpoint, self._pause)
+
+        priority = (rate_limit_args or {}).get('priority', INTERACTIVE)
+        slot = self._get_slot(chat_id)
+        slot.pending += 1
+        self._pending += 1
+        metrics.set_gauge('outbound.queue_depth', self._pending)
+        started = time.monotonic()
+        try:
+            async with slot.lock:
+                await self._take(f'chat:{chat_id}', *self._chat_limits(chat_id))
+                await self._take_global(priority)
+                metrics.observe(f'outbound.wait.{priority}', time.monotonic() - started)
+                metrics.incr(f'outbound.{endpoint}')
+                return await self.policy.call(callback, args, kwargs, endpoint, self._pause)
+        finally:
+            slot.pending -= 1
+            self._pending -= 1
+            metrics.set_gauge('outbound.queue_depth', self._pending)
@@ -0,0 +1,152 @@
+"""
+Background sender draining the outbox table.
+Handlers commit OutboxMessage rows with their ticket changes and call wake();
+this task delivers them with retries and exponential backoff. Messages that
+can never be delivered (bot blocked, bad request) or run out of attempts are
+kept as dead letters.
+Messages of one chat are delivered in order; different chats in parallel.
+Each batch is claimed with a lease first, so several replicas can run the
+sender without delivering a message twice.
+"""
+
+import asyncio
+import logging
+import os
+import secrets
+import socket
+from collections import OrderedDict
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from api_policy import retry_after_seconds
+from metrics import metrics
+from models import get_session
+from notifications import send_ticket_event
+from services.outbox_service import OutboxService
+
+logger = logging.getLogger(__name__)
+
+DEFERRED = 'deferred'
+
+class OutboxSender:
+    def __init__(self, poll_interval: float = 5, batch_size: int = 50,
+                 max_attempts: int = 8, base_delay: float = 5, max_delay: float = 3600,
+                 lease: float = 300):
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"[-64:]
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._wake = asyncio.Event()
+        self._task = None
+        self._bot = None
+
+    def start(self, bot):
+        """Start background draining loop"""
+        self._bot = bot
+        self._task = asyncio.create_task(self._run())
+        metrics.register_provider('outbox', self.stats)
+        logger.info("Outbox sender started")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Deliver newly committed messages now instead of on next poll"""
+        self._wake.set()
+
+    def stats(self) -> dict:
+        db = get_session()
+        try:
+            return OutboxService(db).get_status_counts()
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            try:
+                delivered = await self.drain()
+            except Exception as e:
+                logger.error(f"Outbox drain failed: {e}")
+                delivered = 0
+            if delivered >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def drain(self) -> int:
+        """Deliver one batch of due messages, return number processed"""
+        db = get_session()
+        try:
+            outbox_service = OutboxService(db)
+            messages = outbox_service.claim_due_messages(self.owner, self.lease, self.batch_size)
+            if not messages:
+                return 0
+            by_chat = OrderedDict()
+            for message in messages:
+                key = ('chat', message.chat_id) if message.chat_id else ('ticket', message.ticket_id)
+                by_chat.setdefault(key, []).append(message)
+            results = await asyncio.gather(*(self._deliver_chat(items) for items in by_chat.values()))
+            for items, outcomes in zip(by_chat.values(), results):
+                for message, (error, retry_in) in zip(items, outcomes):
+                    if error is DEFERRED:
+                        outbox_service.defer(message, retry_in)
+                    elif error is None:
+                        outbox_service.mark_sent(message)
+                        metrics.incr('outbox.sent')
+                    else:
+                        outbox_service.mark_failed(message, error, retry_in)
+                        metrics.incr('outbox.dead' if retry_in is None else 'outbox.retry')
+            return len(messages)
+        finally:
+            db.close()
+
+    async def _deliver_chat(self, messages: list) -> list:
+        """Deliver messages of one chat in order; after a failure the rest wait for next round"""
+        outcomes = []
+        blocked_for = None
+        for message in messages:
+            if blocked_for is not None:
+                # Keep order: do not overtake message that will be retried
+                outcomes.append((DEFERRED, blocked_for))
+                continue
+            error, retry_in = await self._deliver(message)
+            outcomes.append((error, retry_in))
+            if error is not None and retry_in is not None:
+                blocked_for = retry_in
+        return outcomes
+
+    async def _deliver(self, message) -> tuple:
+        """Send one message, return (error, retry_in); error None on success"""
+        try:
+            if message.chat_id:
+                await self._bot.send_message(chat_id=message.chat_id, text=message.text,
+                                             parse_mode=message.parse_mode)
+            else:
+                delivered = await send_ticket_event(self._bot, message.ticket_id, message.text,
+                                                    forum_only=bool(message.forum_only))
+                if not delivered:
+                    raise TelegramError("ticket event was not delivered to anyone")
+            return None, None
+        except (Forbidden, BadRequest) as e:
+            # Retrying will not help
+            return str(e), None
+        except Exception as e:
+            if message.attempts + 1 >= self.max_attempts:
+                return str(e), None
+            if isinstance(e, RetryAfter):
+                return str(e), retry_after_seconds(e)
+            return str(e), min(self.max_delay, self.base_delay * 2 ** message.attempts)
+
+outbox_sender = OutboxSender()
@@ -0,0 +1,205 @@
+"""
+Sending instruction and recipe packages.
+Files are sent as media groups (albums) of up to 10 items, grouped by media
+kind since Telegram does not mix documents with videos in one album.
+Link items are collapsed into a single text message.
+
+ZIP mode (PACKAGE_MODE=zip): all files of a model are packed into one archive,
+uploaded once and its file_id is cached on the model, so next requests cost a
+single send_document. Cache is reset by services when bindings change.
+"""
+
+import asyncio
+import io
+import logging
+import os
+import re
+import zipfile
+from typing import Awaitable, Callable, List, Optional
+
+from telegram import InputFile, InputMediaDocument, InputMediaVideo
+from telegram.error import BadRequest, TelegramError
+
+from metrics import metrics
+from models import InstructionType, Model
+from outbound import BULK
+
+logger = logging.getLogger(__name__)
+
+MEDIA_GROUP_LIMIT = 10  # Telegram max items in album
+CAPTION_LIMIT = 1024
+DOWNLOAD_LIMIT = 20 * 1024 * 1024  # Bot API getFile limit
+UPLOAD_LIMIT = 50 * 1024 * 1024  # Bot API sendDocument limit
+
+# progress(done, total), see background_tasks
+Progress = Optional[Callable[[int, int], Awaitable[None]]]
+
+# One build per model and kind at a time
+_zip_locks = {}
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+async def _send_single(bot, chat_id: int, item, kind: str):
+    if kind == 'video':
+        await bot.send_video(chat_id=chat_id, video=item.tg_file_id,
+                             caption=item.title[:CAPTION_LIMIT], rate_limit_args=BULK)
+    else:
+        await bot.send_document(chat_id=chat_id, document=item.tg_file_id,
+                                caption=item.title[:CAPTION_LIMIT], rate_limit_args=BULK)
+
+async def _send_group(bot, chat_id: int, items: list, kind: str) -> int:
+    """Send items of one kind as album, return number of items sent"""
+    if len(items) == 1:
+        await _send_single(bot, chat_id, items[0], kind)
+        return 1
+    media_class = InputMediaVideo if kind == 'video' else InputMediaDocument
+    media = [media_class(media=item.tg_file_id, caption=item.title[:CAPTION_LIMIT]) for item in items]
+    try:
+        await bot.send_media_group(chat_id=chat_id, media=media, rate_limit_args=BULK)
+        metrics.incr('packages.album')
+        return len(items)
+    except BadRequest as e:
+        # One broken file_id fails whole album: fall back to single sends
+        logger.warning(f"Album of {len(items)} {kind} items failed ({e}), sending one by one")
+        sent = 0
+        for item in items:
+            try:
+                await _send_single(bot, chat_id, item, kind)
+                sent += 1
+            except TelegramError as item_error:
+                logger.error(f"Error sending package item {item.id}: {item_error}")
+        return sent
+
+async def send_package(bot, chat_id: int, items: List, progress: Progress = None) -> int:
+    """Send instructions/recipes (objects with title, type, tg_file_id, url) as albums.
+    Returns number of items delivered."""
+    groups = {'document': [], 'video': []}
+    links = []
+    for item in items:
+        if item.tg_file_id:
+            kind = 'video' if item.type == InstructionType.VIDEO else 'document'
+            groups[kind].append(item)
+        elif item.url:
+            links.append(item)
+
+    sent = done = 0
+    total = len(items)
+    for kind, kind_items in groups.items():
+        for chunk in _chunks(kind_items, MEDIA_GROUP_LIMIT):
+            try:
+                sent += await _send_group(bot, chat_id, chunk, kind)
+            except TelegramError as e:
+                logger.error(f"Error sending package {kind} group: {e}")
+            done += len(chunk)
+            if progress:
+                await progress(done, total)
+
+    if links:
+        # One message for all links, split only to stay under message length limit
+        parts, current = [], ""
+        for item in links:
+            block = f"🔗 {item.title}\n{item.url}"
+            if current and len(current) + len(block) + 2 > 4000:
+                parts.append(current)
+                current = block
+            else:
+                current = f"{current}\n\n{block}" if current else block
+        parts.append(current)
+        try:
+            for part in parts:
+                await bot.send_message(chat_id=chat_id, text=part, rate_limit_args=BULK)
+            sent += len(links)
+        except TelegramError as e:
+            logger.error(f"Error sending package links: {e}")
+        if progress:
+            await progress(total, total)
+    metrics.incr('packages.items', sent)
+    return sent
+
+def _safe_filename(title: str) -> str:
+    name = re.sub(r'[\\/:*?"<>|\s]+', '_', title).strip('._')
+    return name[:80] or 'file'
+
+def _build_zip(files: List[tuple], links: List[str]) -> io.BytesIO:
+    """Build archive in memory (runs in worker thread)"""
+    buffer = io.BytesIO()
+    used_names = set()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files:
+            base, ext = os.path.splitext(name)
+            unique_name, counter = name, 1
+            while unique_name in used_names:
+                counter += 1
+                unique_name = f"{base}_{counter}{ext}"
+            used_names.add(unique_name)
+            archive.writestr(unique_name, bytes(data))
+        if links:
+            archive.writestr('links.txt', "\n\n".join(links))
+    buffer.seek(0)
+    return buffer
+
+async def _download_items(bot, items: List, progress: Progress = None) -> tuple:
+    """Download package files, return (files, links, skipped items) for archive"""
+    files, links, skipped = [], [], []
+    for done, item in enumerate(items, 1):
+        if progress:
+            await progress(done - 1, len(items) + 1)
+        if item.tg_file_id:
+            try:
+                tg_file = await bot.get_file(item.tg_file_id)
+                if tg_file.file_size and tg_file.file_size > DOWNLOAD_LIMIT:
+                    raise ValueError("file is too big for Bot API download")
+                data = await tg_file.download_as_bytearray()
+            except Exception as e:
+                logger.error(f"Error downloading package item {item.id}: {e}")
+                skipped.append(item)
+                continue
+            ext = os.path.splitext(tg_file.file_path or '')[1] or ('.mp4' if item.type == InstructionType.VIDEO else '.pdf')
+            files.append((_safe_filename(item.title) + ext, data))
+        elif item.url:
+            links.append(f"{item.title}\n{item.url}")
+    return files, links, skipped
+
+async def send_package_zip(bot, chat_id: int, db, model: Model, kind: str, items: List,
+                           progress: Progress = None) -> int:
+    """Send model package (kind: 'instructions' or 'recipes') as one ZIP file.
+    Falls back to albums if archive can not be built. Files that could not be
+    downloaded are sent separately and the incomplete archive is not cached."""
+    from services.models_service import ModelsService
+
+    cache_attr = f'{kind}_zip_file_id'
+    lock = _zip_locks.setdefault((model.id, kind), asyncio.Lock())
+    async with lock:
+        db.refresh(model)
+        file_id = getattr(model, cache_attr)
+        if file_id:
+            try:
+                await bot.send_document(chat_id=chat_id, document=file_id, rate_limit_args=BULK)
+                metrics.incr('packages.zip_cached')
+                return len(items)
+            except BadRequest as e:
+                logger.warning(f"Cached {kind} package of model {model.id} is invalid: {e}")
+
+        files, links, skipped = await _download_items(bot, items, progress)
+        if not files:
+            return await send_package(bot, chat_id, items, progress)
+        buffer = await asyncio.to_thread(_build_zip, files, links)
+        if buffer.getbuffer().nbytes > UPLOAD_LIMIT:
+            logger.warning(f"{kind} package of model {model.id} is too big for upload, sending albums")
+            return await send_package(bot, chat_id, items, progress)
+
+        filename = f"{_safe_filename(model.name)}_{kind}.zip"
+        message = await bot.send_document(
+            chat_id=chat_id,
+            document=InputFile(buffer, filename=filename),
+            rate_limit_args=BULK
+        )
+        metrics.incr('packages.zip_built')
+        if skipped:
+            # Send missing files by file_id, keep the partial archive out of the cache
+            metrics.incr('packages.zip_partial')
+            return len(files) + len(links) + await send_package(bot, chat_id, skipped)
+        ModelsService(db).set_package_file_id(model.id, kind, message.document.file_id)
+        return len(files) + len(links)
@@ -0,0 +1,146 @@
+"""
+Token bucket storage for the outbound dispatcher.
+With several bot replicas on one token, all of them must draw from the same
+Telegram budget, so bucket state can live outside the process:
+
+- local:  in-process dict (single replica, tests)
+- sqlite: shared SQLite file, updates under BEGIN IMMEDIATE
+- redis:  Redis-compatible server, atomic Lua script (needs `redis` package)
+
+All backends implement take(key, rate, capacity) -> seconds to wait
+(0.0 means a token was taken).
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+class BucketBackend:
+    """Base class for bucket storages"""
+    async def take(self, key: str, rate: float, capacity: float) -> float:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+def _refill_and_take(tokens: float, updated: float, now: float, rate: float, capacity: float) -> Tuple[float, float]:
+    """Return (new tokens, wait seconds) for one take attempt"""
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+class LocalBucketBackend(BucketBackend):
+    """In-process buckets"""
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated)
+
+    def take_now(self, key: str, rate: float, capacity: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens, wait = _refill_and_take(tokens, updated, now, rate, capacity)
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._prune(now, rate)
+        return wait
+
+    async def take(self, key: str, rate: float, capacity: float) -> float:
+        return self.take_now(key, rate, capacity)
+
+    def _prune(self, now: float, rate: float):
+        """Drop buckets idle long enough to be full again"""
+        for key in [k for k, (_, updated) in self._buckets.items() if now - updated > 60]:
+            del self._buckets[key]
+
+class SQLiteBucketBackend(BucketBackend):
+    """Buckets in a SQLite file shared by replicas on one host/volume"""
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_buckets '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _take_sync(self, key: str, rate: float, capacity: float) -> float:
+        conn = self._connect()
+        try:
+            # Write lock up front: read-modify-write is atomic across processes
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, wait = _refill_and_take(tokens, updated, now, rate, capacity)
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                (key, tokens, now)
+            )
+            conn.execute('COMMIT')
+            return wait
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    async def take(self, key: str, rate: float, capacity: float) -> float:
+        return await asyncio.to_thread(self._take_sync, key, rate, capacity)
+
+_REDIS_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(data[1]) or capacity
+local updated = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+class RedisBucketBackend(BucketBackend):
+    """Buckets in Redis (or compatible server), one atomic script call per take"""
+    def __init__(self, url: str, prefix: str = 'ozon:rl:'):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package")
+        self.prefix = prefix
+        self._client = redis_asyncio.from_url(url)
+        self._script = self._client.register_script(_REDIS_TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, capacity: float) -> float:
+        result = await self._script(keys=[self.prefix + key], args=[rate, capacity])
+        return float(result)
+
+    async def close(self):
+        await self._client.close()
+
+def create_bucket_backend(kind: str, url: str = None) -> BucketBackend:
+    """Create backend by RATE_LIMIT_BACKEND value"""
+    kind = (kind or 'local').lower()
+    if kind == 'sqlite':
+        return SQLiteBucketBackend(url or 'rate_limits.db')
+    if kind == 'redis':
+        return RedisBucketBackend(url or 'redis://localhost:6379/0')
+    if kind != 'local':
+        logger.warning(f"Unknown rate limit backend '{kind}', using local")
+    return LocalBucketBackend()
@@ -0,0 +1,126 @@
+"""
+Search results cache keyed by normalized query and invalidated by catalog version
+"""
+
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Callable, List, Optional
+
+from config import SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_TOKEN_TTL
+from metrics import metrics
+
+# Lightweight model reference safe to keep between DB sessions
+ModelRef = namedtuple('ModelRef', ['id', 'name'])
+
+class CatalogVersion:
+    """Monotonic counter bumped on every catalog change"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+    
+    def bump(self):
+        with self._lock:
+            self.value += 1
+
+catalog_version = CatalogVersion()
+
+def normalize_query(query: str) -> str:
+    """Normalize search query: trim, collapse whitespace.
+    Case is kept: the result is both the cache key and the text sent to the
+    database, and SQLite folds only ASCII case in LIKE."""
+    return re.sub(r'\s+', ' ', (query or '').strip())
+
+class SearchCache:
+    """Bounded LRU cache with TTL for search results"""
+    def __init__(self, max_entries: int = 256, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # query -> (version, expires_at, refs)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, query: str) -> Optional[List[ModelRef]]:
+        """Get cached results for normalized query"""
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry:
+                version, expires_at, refs = entry
+                if version == catalog_version.value and expires_at > time.monotonic():
+                    self._entries.move_to_end(query)
+                    self.hits += 1
+                    metrics.incr('search_cache.hit')
+                    return refs
+                del self._entries[query]
+            self.misses += 1
+            metrics.incr('search_cache.miss')
+            return None
+    
+    def put(self, query: str, refs: List[ModelRef]):
+        """Store results for normalized query"""
+        with self._lock:
+            self._entries[query] = (catalog_version.value, time.monotonic() + self.ttl, refs)
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def get_or_load(self, query: str, loader: Callable[[], List[ModelRef]]) -> List[ModelRef]:
+        """Get cached results or load and cache them"""
+        refs = self.get(query)
+        if refs is None:
+            refs = loader()
+            self.put(query, refs)
+        return refs
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> dict:
+        """Get hit rate statistics"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+class ResultTokenStore:
+    """Short server-side tokens for search results, carried in pagination callback data"""
+    def __init__(self, max_entries: int = 1000, ttl: float = 900):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (expires_at, query, refs)
+        self._lock = threading.Lock()
+    
+    def create(self, query: str, refs: List[ModelRef]) -> str:
+        """Store search results and return token (hex, no '_' so it is safe in callback data)"""
+        token = secrets.token_hex(5)
+        with self._lock:
+            self._entries[token] = (time.monotonic() + self.ttl, query, refs)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return token
+    
+    def get(self, token: str) -> Optional[tuple]:
+        """Get (query, refs) for token or None if unknown or expired"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if not entry:
+                metrics.incr('search_token.miss')
+                return None
+            expires_at, query, refs = entry
+            if expires_at <= time.monotonic():
+                del self._entries[token]
+                metrics.incr('search_token.expired')
+                return None
+            metrics.incr('search_token.hit')
+            return query, refs
+
+search_cache = SearchCache(max_entries=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+metrics.register_provider('search_cache', search_cache.stats)
+search_tokens = ResultTokenStore(ttl=SEARCH_TOKEN_TTL)
@@ -0,0 +1,95 @@
+from sqlalchemy.orm import Session
+from models import Model, Category
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for materialized path range scans: sorts after digits and '/'
+PATH_UPPER_BOUND = '~'
+
+class CatalogService:
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def get_category_by_id(self, category_id: int) -> Optional[Category]:
+        """Get category by ID"""
+        return self.db.query(Category).filter(Category.id == category_id).first()
+    
+    def get_children(self, parent_id: Optional[int] = None) -> List[Category]:
+        """Get direct children of category (root categories if parent_id is None)"""
+        return self.db.query(Category).filter(Category.parent_id == parent_id).order_by(Category.name).all()
+    
+    def get_breadcrumbs(self, category: Category) -> List[Category]:
+        """Get categories from root to this one using the materialized path"""
+        ids = [int(part) for part in category.path.strip('/').split('/') if part]
+        if not ids:
+            return []
+        by_id = {c.id: c for c in self.db.query(Category).filter(Category.id.in_(ids)).all()}
+        return [by_id[i] for i in ids if i in by_id]
+    
+    def create_category(self, name: str, parent: Optional[Category] = None) -> Category:
+        """Create category under parent (without commit)"""
+        category = Category(
+            name=name,
+            parent_id=parent.id if parent else None,
+            depth=parent.depth + 1 if parent else 0
+        )
+        self.db.add(category)
+        self.db.flush()  # Need ID for the path
+        category.path = f"{parent.path if parent else '/'}{category.id}/"
+        return category
+    
+    def get_or_create_path(self, names: List[str]) -> Optional[Category]:
+        """Get or create chain of categories, e.g. ['Кухонные машины', 'LAC'].
+        Returns the leaf category."""
+        parent = None
+        for name in names:
+            name = name.strip()[:255]
+            if not name:
+                continue
+            category = self.db.query(Category).filter(
+                Category.parent_id == (parent.id if parent else None),
+                Category.name == name
+            ).first()
+            if not category:
+                category = self.create_category(name, parent)
+                logger.info(f"Created category: {name} (path: {category.path})")
+            parent = category
+        self.db.commit()
+        return parent
+    
+    def set_model_category(self, model_id: int, category_id: Optional[int]) -> bool:
+        """Move model to category"""
+        model = self.db.query(Model).filter(Model.id == model_id).first()
+        if not model:
+            return False
+        model.category_id = category_id
+        self.db.commit()
+        return True
+    
+    def _subtree_filter(self, category: Category):
+        """Index-friendly range filter over materialized paths of the subtree"""
+        return Category.path >= category.path, Category.path < category.path + PATH_UPPER_BOUND
+    
+    def get_category_models(self, category_id: int, page: int = 0, limit: int = 10) -> List[Model]:
+        """Get models attached directly to category"""
+        offset = page * limit
+        return self.db.query(Model).filter(Model.category_id == category_id).order_by(
+            Model.name
+        ).offset(offset).limit(limit).all()
+    
+    def get_category_models_count(self, category_id: int) -> int:
+        """Get count of models attached directly to category"""
+        return self.db.query(Model).filter(Model.category_id == category_id).count()
+    
+    def get_subtree_models(self, category: Category, page: int = 0, limit: int = 10) -> List[Model]:
+        """Get models of category and all its descendants"""
+        offset = page * limit
+        return self.db.query(Model).join(Category).filter(
+            *self._subtree_filter(category)
+        ).order_by(Model.name).offset(offset).limit(limit).all()
+    
+    def get_subtree_models_count(self, category: Category) -> int:
+        """Get count of models of category and all its descendants"""
+        return self.db.query(Model).join(Category).filter(*self._subtree_filter(category)).count()
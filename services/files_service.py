@@ -9,6 +9,11 @@ class FilesService:
     def __init__(self, db: Session):
         self.db = db
     
+    def _invalidate_packages(self, models: List[Model]):
+        """Reset cached ZIP packages of models (changes are committed by caller)"""
+        for model in models:
+            model.instructions_zip_file_id = None
+    
     def create_instruction(self, title: str, instruction_type: InstructionType, 
                           description: str = None, tg_file_id: str = None, 
                           url: str = None) -> Instruction:
@@ -44,6 +49,7 @@ class FilesService:
         for key, value in kwargs.items():
             if hasattr(instruction, key):
                 setattr(instruction, key, value)
+        self._invalidate_packages(instruction.models)
         
         self.db.commit()
         self.db.refresh(instruction)
@@ -56,6 +62,7 @@ class FilesService:
         if not instruction:
             return False
         
+        self._invalidate_packages(instruction.models)
         self.db.delete(instruction)
         self.db.commit()
         logger.info(f"Deleted instruction: {instruction.title} (ID: {instruction.id})")
@@ -85,6 +92,7 @@ class FilesService:
         for model in models:
             if instruction not in model.instructions:
                 model.instructions.append(instruction)
+                self._invalidate_packages([model])
         
         self.db.commit()
         logger.info(f"Bound instruction {instruction.title} to {len(models)} models")
@@ -100,6 +108,7 @@ class FilesService:
         
         if instruction in model.instructions:
             model.instructions.remove(instruction)
+            self._invalidate_packages([model])
             self.db.commit()
             logger.info(f"Unbound instruction {instruction.title} from model {model.name}")
             return True
@@ -10,6 +10,11 @@ class InstructionsService:
     def __init__(self, db: Session):
         self.db = db
     
+    def _invalidate_packages(self, models: List[Model]):
+        """Reset cached ZIP packages of models (changes are committed by caller)"""
+        for model in models:
+            model.instructions_zip_file_id = None
+    
     def get_instructions(self, page: int = 0, limit: int = 10) -> List[Instruction]:
         """Get paginated list of instructions"""
         offset = page * limit
@@ -49,6 +54,7 @@ class InstructionsService:
         for key, value in kwargs.items():
             if hasattr(instruction, key):
                 setattr(instruction, key, value)
+        self._invalidate_packages(instruction.models)
         
         self.db.commit()
         self.db.refresh(instruction)
@@ -61,6 +67,7 @@ class InstructionsService:
         if not instruction:
             return False
         
+        self._invalidate_packages(instruction.models)
         self.db.delete(instruction)
         self.db.commit()
         logger.info(f"Deleted instruction: {instruction.title} (ID: {instruction.id})")
@@ -87,6 +94,7 @@ class InstructionsService:
         new_models = [model for model in models if model not in instruction.models]
         if new_models:
             instruction.models.extend(new_models)
+            self._invalidate_packages(new_models)
             self.db.commit()
             logger.info(f"Bound instruction {instruction.title} to {len(new_models)} models")
             return True
@@ -102,6 +110,7 @@ class InstructionsService:
         if models_to_remove:
             for model in models_to_remove:
                 instruction.models.remove(model)
+            self._invalidate_packages(models_to_remove)
             self.db.commit()
             logger.info(f"Unbound instruction {instruction.title} from {len(models_to_remove)} models")
             return True
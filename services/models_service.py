@@ -1,11 +1,27 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
-from models import Model, Instruction, InstructionType
+from models import Model, ModelCode, Instruction, InstructionType
+from services.tags_service import TagsService
+from search_cache import ModelRef, catalog_version
 from typing import List, Optional, Dict, Any
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
+# Marketplace article numbers / SKUs: digits, latin letters and separators
+CODE_PATTERN = re.compile(r'^[0-9A-Z]{3,64}$')
+
+def normalize_code(code: str) -> Optional[str]:
+    """Normalize pasted article/SKU (strip spaces and separators, upper case).
+    Returns None if the text does not look like a product code."""
+    if not code:
+        return None
+    normalized = re.sub(r'[\s\-_./]', '', code).upper()
+    if not CODE_PATTERN.match(normalized):
+        return None
+    return normalized
+
 class ModelsService:
     def __init__(self, db: Session):
         self.db = db
@@ -25,6 +41,18 @@ class ModelsService:
         )
         return self.db.query(Model).filter(search_filter).order_by(Model.created_at.desc(), Model.id.desc()).offset(offset).limit(limit).all()
     
+    def search_model_refs(self, query: str, limit: int = 500) -> List[ModelRef]:
+        """Search models returning only (id, name) pairs, suitable for caching"""
+        search_filter = or_(
+            Model.name.ilike(f"%{query}%"),
+            Model.description.ilike(f"%{query}%"),
+            Model.tags.ilike(f"%{query}%")
+        )
+        rows = self.db.query(Model.id, Model.name).filter(search_filter).order_by(
+            Model.created_at.desc(), Model.id.desc()
+        ).limit(limit).all()
+        return [ModelRef(row.id, row.name) for row in rows]
+    
     def get_model_by_id(self, model_id: int) -> Optional[Model]:
         """Get model by ID"""
         return self.db.query(Model).filter(Model.id == model_id).first()
@@ -33,6 +61,49 @@ class ModelsService:
         """Get model by name"""
         return self.db.query(Model).filter(Model.name == name).first()
     
+    def get_model_by_code(self, code: str) -> Optional[Model]:
+        """Get model by marketplace article/SKU (single indexed lookup)"""
+        normalized = normalize_code(code)
+        if not normalized:
+            return None
+        return self.db.query(Model).join(ModelCode).filter(ModelCode.code == normalized).first()
+    
+    def get_model_codes(self, model_id: int) -> List[ModelCode]:
+        """Get all article/SKU codes of a model"""
+        return self.db.query(ModelCode).filter(ModelCode.model_id == model_id).order_by(ModelCode.id).all()
+    
+    def add_model_codes(self, model_id: int, codes: List[str]) -> List[ModelCode]:
+        """Add article/SKU codes to model, skipping invalid and already taken ones"""
+        normalized = []
+        for code in codes:
+            value = normalize_code(code)
+            if value and value not in normalized:
+                normalized.append(value)
+        if not normalized:
+            return []
+        
+        taken = {row.code for row in self.db.query(ModelCode.code).filter(ModelCode.code.in_(normalized)).all()}
+        added = [ModelCode(model_id=model_id, code=value) for value in normalized if value not in taken]
+        if taken:
+            logger.warning(f"Codes already bound to other models, skipped: {', '.join(sorted(taken))}")
+        if added:
+            self.db.add_all(added)
+            self.db.commit()
+            logger.info(f"Added {len(added)} codes to model {model_id}")
+        return added
+    
+    def remove_model_code(self, model_id: int, code: str) -> bool:
+        """Remove article/SKU code from model"""
+        normalized = normalize_code(code)
+        if not normalized:
+            return False
+        deleted = self.db.query(ModelCode).filter(
+            ModelCode.model_id == model_id,
+            ModelCode.code == normalized
+        ).delete()
+        self.db.commit()
+        return deleted > 0
+    
     def create_model(self, name: str, description: str = None, tags: str = None) -> Model:
         """Create new model"""
         model = Model(
@@ -41,8 +112,10 @@ class ModelsService:
             tags=tags
         )
         self.db.add(model)
+        TagsService(self.db).set_model_tags(model, tags, commit=False)
         self.db.commit()
         self.db.refresh(model)
+        catalog_version.bump()
         logger.info(f"Created model: {model.name} (ID: {model.id})")
         return model
     
@@ -55,9 +128,12 @@ class ModelsService:
         for key, value in kwargs.items():
             if hasattr(model, key):
                 setattr(model, key, value)
+        if 'tags' in kwargs:
+            TagsService(self.db).set_model_tags(model, kwargs['tags'], commit=False)
         
         self.db.commit()
         self.db.refresh(model)
+        catalog_version.bump()
         logger.info(f"Updated model: {model.name} (ID: {model.id})")
         return model
     
@@ -69,6 +145,7 @@ class ModelsService:
         
         self.db.delete(model)
         self.db.commit()
+        catalog_version.bump()
         logger.info(f"Deleted model: {model.name} (ID: {model.id})")
         return True
     
@@ -79,6 +156,17 @@ class ModelsService:
             return []
         return model.instructions
     
+    def set_package_file_id(self, model_id: int, kind: str, file_id: Optional[str]) -> bool:
+        """Store cached ZIP package file_id (kind: 'instructions' or 'recipes')"""
+        model = self.get_model_by_id(model_id)
+        if not model:
+            return False
+        
+        setattr(model, f'{kind}_zip_file_id', file_id)
+        self.db.commit()
+        logger.info(f"Set {kind} package file for model {model.name}")
+        return True
+    
     def add_instruction_to_model(self, model_id: int, instruction_id: int) -> bool:
         """Add instruction to model"""
         model = self.get_model_by_id(model_id)
@@ -89,6 +177,7 @@ class ModelsService:
         
         if instruction not in model.instructions:
             model.instructions.append(instruction)
+            model.instructions_zip_file_id = None
             self.db.commit()
             logger.info(f"Added instruction {instruction.title} to model {model.name}")
             return True
@@ -104,6 +193,7 @@ class ModelsService:
         
         if instruction in model.instructions:
             model.instructions.remove(instruction)
+            model.instructions_zip_file_id = None
             self.db.commit()
             logger.info(f"Removed instruction {instruction.title} from model {model.name}")
             return True
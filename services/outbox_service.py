@@ -0,0 +1,107 @@
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from models import OutboxMessage, OutboxStatus
+from config import ADMIN_CHAT_IDS, STAFF_FORUM_CHAT_ID
+from typing import List, Optional, Dict
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+class OutboxService:
+    """Durable notification queue. enqueue_* methods do not commit:
+    the row is committed together with the change it reports."""
+    def __init__(self, db: Session):
+        self.db = db
+
+    def enqueue_message(self, chat_id: int, text: str, parse_mode: str = None) -> OutboxMessage:
+        """Queue direct message to chat"""
+        message = OutboxMessage(chat_id=chat_id, text=text, parse_mode=parse_mode)
+        self.db.add(message)
+        return message
+
+    def enqueue_ticket_event(self, ticket_id: int, text: str, forum_only: bool = False) -> List[OutboxMessage]:
+        """Queue ticket event for staff forum topic, or one message per admin without
+        forum so each delivery is retried on its own.
+        forum_only events are skipped when no staff forum is configured."""
+        if STAFF_FORUM_CHAT_ID:
+            messages = [OutboxMessage(ticket_id=ticket_id, text=text, forum_only=forum_only)]
+        elif forum_only:
+            return []
+        else:
+            messages = [OutboxMessage(chat_id=admin_id, ticket_id=ticket_id, text=text) for admin_id in ADMIN_CHAT_IDS]
+        self.db.add_all(messages)
+        return messages
+
+    def _claimable(self, now: datetime):
+        return (
+            OutboxMessage.status == OutboxStatus.PENDING,
+            or_(OutboxMessage.lease_until.is_(None), OutboxMessage.lease_until < now)
+        )
+
+    def claim_due_messages(self, owner: str, lease: float = 300, limit: int = 50) -> List[OutboxMessage]:
+        """Claim pending messages ready for (re)delivery, oldest first.
+        The claim is one conditional UPDATE, so with several sender replicas each
+        message is delivered by one of them; claims of a crashed replica expire."""
+        now = datetime.utcnow()
+        due_ids = [row.id for row in self.db.query(OutboxMessage.id).filter(
+            OutboxMessage.next_attempt_at <= now, *self._claimable(now)
+        ).order_by(OutboxMessage.id.asc()).limit(limit).all()]
+        if not due_ids:
+            return []
+        self.db.query(OutboxMessage).filter(OutboxMessage.id.in_(due_ids), *self._claimable(now)).update(
+            {OutboxMessage.claimed_by: owner, OutboxMessage.lease_until: now + timedelta(seconds=lease)},
+            synchronize_session=False
+        )
+        self.db.commit()
+        return self.db.query(OutboxMessage).filter(
+            OutboxMessage.id.in_(due_ids), OutboxMessage.claimed_by == owner, OutboxMessage.lease_until > now
+        ).order_by(OutboxMessage.id.asc()).all()
+
+    @staticmethod
+    def _release(message: OutboxMessage):
+        message.claimed_by = None
+        message.lease_until = None
+
+    def mark_sent(self, message: OutboxMessage):
+        """Mark message delivered"""
+        message.status = OutboxStatus.SENT
+        message.sent_at = datetime.utcnow()
+        message.attempts += 1
+        self._release(message)
+        self.db.commit()
+
+    def mark_failed(self, message: OutboxMessage, error: str, retry_in: Optional[float]):
+        """Record failed attempt; retry_in=None moves message to dead letters"""
+        message.attempts += 1
+        message.last_error = error[:500]
+        if retry_in is None:
+            message.status = OutboxStatus.DEAD
+            logger.error(f"Outbox message {message.id} dead after {message.attempts} attempts: {error}")
+        else:
+            message.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_in)
+        self._release(message)
+        self.db.commit()
+
+    def defer(self, message: OutboxMessage, retry_in: float):
+        """Postpone message without counting an attempt (keeps order behind a failed one)"""
+        message.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_in)
+        self._release(message)
+        self.db.commit()
+
+    def get_status_counts(self) -> Dict[str, int]:
+        """Get number of messages per status"""
+        return {
+            status.value: self.db.query(OutboxMessage).filter(OutboxMessage.status == status).count()
+            for status in OutboxStatus
+        }
+
+    def cleanup_sent(self, days: int = 7) -> int:
+        """Delete delivered messages older than specified days"""
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        count = self.db.query(OutboxMessage).filter(
+            OutboxMessage.status == OutboxStatus.SENT,
+            OutboxMessage.sent_at < cutoff_date
+        ).delete(synchronize_session=False)
+        self.db.commit()
+        return count
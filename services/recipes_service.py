@@ -10,6 +10,11 @@ class RecipesService:
     def __init__(self, db: Session):
         self.db = db
     
+    def _invalidate_packages(self, models: List[Model]):
+        """Reset cached ZIP packages of models (changes are committed by caller)"""
+        for model in models:
+            model.recipes_zip_file_id = None
+    
     def get_recipes(self, page: int = 0, limit: int = 10) -> List[Recipe]:
         """Get paginated list of recipes"""
         offset = page * limit
@@ -49,6 +54,7 @@ class RecipesService:
         for key, value in kwargs.items():
             if hasattr(recipe, key):
                 setattr(recipe, key, value)
+        self._invalidate_packages(recipe.models)
         
         self.db.commit()
         self.db.refresh(recipe)
@@ -61,6 +67,7 @@ class RecipesService:
         if not recipe:
             return False
         
+        self._invalidate_packages(recipe.models)
         self.db.delete(recipe)
         self.db.commit()
         logger.info(f"Deleted recipe: {recipe.title} (ID: {recipe.id})")
@@ -87,6 +94,7 @@ class RecipesService:
         new_models = [model for model in models if model not in recipe.models]
         if new_models:
             recipe.models.extend(new_models)
+            self._invalidate_packages(new_models)
             self.db.commit()
             logger.info(f"Bound recipe {recipe.title} to {len(new_models)} models")
             return True
@@ -102,6 +110,7 @@ class RecipesService:
         if models_to_remove:
             for model in models_to_remove:
                 recipe.models.remove(model)
+            self._invalidate_packages(models_to_remove)
             self.db.commit()
             logger.info(f"Unbound recipe {recipe.title} from {len(models_to_remove)} models")
             return True
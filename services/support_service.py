@@ -40,8 +40,8 @@ class SupportService:
             Ticket.status.in_([TicketStatus.OPEN, TicketStatus.IN_PROGRESS])
         ).order_by(Ticket.created_at.desc()).limit(limit).all()
     
-    def update_ticket_status(self, ticket_id: int, status: TicketStatus) -> Optional[Ticket]:
-        """Update ticket status"""
+    def update_ticket_status(self, ticket_id: int, status: TicketStatus, commit: bool = True) -> Optional[Ticket]:
+        """Update ticket status (commit=False to add outbox notifications in the same transaction)"""
         ticket = self.get_ticket_by_id(ticket_id)
         if not ticket:
             return None
@@ -51,15 +51,29 @@ class SupportService:
         if status == TicketStatus.CLOSED:
             ticket.closed_at = datetime.utcnow()
         
-        self.db.commit()
-        self.db.refresh(ticket)
+        if commit:
+            self.db.commit()
+            self.db.refresh(ticket)
+        else:
+            self.db.flush()
         logger.info(f"Updated ticket {ticket_id} status to {status.value}")
         return ticket
     
+    def set_ticket_thread(self, ticket_id: int, thread_id: Optional[int]) -> Optional[Ticket]:
+        """Store staff forum topic (message_thread_id) for ticket"""
+        ticket = self.get_ticket_by_id(ticket_id)
+        if not ticket:
+            return None
+        
+        ticket.thread_id = thread_id
+        self.db.commit()
+        logger.info(f"Set forum thread {thread_id} for ticket {ticket_id}")
+        return ticket
+    
     def add_message_to_ticket(self, ticket_id: int, from_role: MessageRole, 
                              text: str = None, tg_file_id: str = None, 
-                             file_type: FileType = None) -> Optional[TicketMessage]:
-        """Add message to ticket"""
+                             file_type: FileType = None, commit: bool = True) -> Optional[TicketMessage]:
+        """Add message to ticket (commit=False to add outbox notifications in the same transaction)"""
         ticket = self.get_ticket_by_id(ticket_id)
         if not ticket:
             return None
@@ -72,12 +86,13 @@ class SupportService:
             file_type=file_type
         )
         self.db.add(message)
-        self.db.commit()
-        self.db.refresh(message)
-        
         # Update ticket timestamp
         ticket.updated_at = datetime.utcnow()
-        self.db.commit()
+        if commit:
+            self.db.commit()
+            self.db.refresh(message)
+        else:
+            self.db.flush()
         
         logger.info(f"Added message to ticket {ticket_id} from {from_role.value}")
         return message
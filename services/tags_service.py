@@ -0,0 +1,73 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from models import Model, Tag, model_tag
+from typing import List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+def parse_tags(tags: Optional[str]) -> List[str]:
+    """Parse CSV tags string into a list of unique lower-case tag names"""
+    if not tags:
+        return []
+    names = []
+    for part in tags.split(','):
+        name = part.strip().lower()[:100]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+class TagsService:
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def get_tag_by_id(self, tag_id: int) -> Optional[Tag]:
+        """Get tag by ID"""
+        return self.db.query(Tag).filter(Tag.id == tag_id).first()
+    
+    def get_or_create_tags(self, names: List[str]) -> List[Tag]:
+        """Get tags by name, creating missing ones (without commit)"""
+        if not names:
+            return []
+        existing = {tag.name: tag for tag in self.db.query(Tag).filter(Tag.name.in_(names)).all()}
+        tags = []
+        for name in names:
+            tag = existing.get(name)
+            if not tag:
+                tag = Tag(name=name)
+                self.db.add(tag)
+                existing[name] = tag
+            tags.append(tag)
+        return tags
+    
+    def set_model_tags(self, model: Model, tags: Optional[str], commit: bool = True) -> List[Tag]:
+        """Replace model tags with the ones from CSV string"""
+        model.tag_items = self.get_or_create_tags(parse_tags(tags))
+        if commit:
+            self.db.commit()
+        return model.tag_items
+    
+    def get_tags_with_counts(self, page: int = 0, limit: int = 10) -> List[Tuple[Tag, int]]:
+        """Get paginated list of tags with model counts, most used first"""
+        offset = page * limit
+        count = func.count(model_tag.c.model_id).label('models_count')
+        return self.db.query(Tag, count).join(
+            model_tag, model_tag.c.tag_id == Tag.id
+        ).group_by(Tag.id).order_by(count.desc(), Tag.name).offset(offset).limit(limit).all()
+    
+    def get_tags_count(self) -> int:
+        """Get count of tags that have at least one model"""
+        return self.db.query(func.count(func.distinct(model_tag.c.tag_id))).scalar() or 0
+    
+    def get_models_by_tag(self, tag_id: int, page: int = 0, limit: int = 10) -> List[Model]:
+        """Get paginated list of models with tag"""
+        offset = page * limit
+        return self.db.query(Model).join(
+            model_tag, model_tag.c.model_id == Model.id
+        ).filter(model_tag.c.tag_id == tag_id).order_by(
+            Model.created_at.desc(), Model.id.desc()
+        ).offset(offset).limit(limit).all()
+    
+    def get_models_by_tag_count(self, tag_id: int) -> int:
+        """Get count of models with tag"""
+        return self.db.query(func.count(model_tag.c.model_id)).filter(model_tag.c.tag_id == tag_id).scalar() or 0
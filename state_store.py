@@ -0,0 +1,332 @@
+"""
+Conversation state store: drop-in replacement of the process-global
+user_states dict that survives restarts and is shared by several workers.
+
+- memory: in-process dict (single worker, tests)
+- sqlite: SQLite file shared by workers on one host/volume
+- redis:  Redis-compatible server (needs `redis` package)
+
+Entries expire after ttl seconds without changes. States are stored as
+compact JSON ["state", {data}].
+
+StateStore is a MutableMapping over a local cache:
+- prefetch_update (TypeHandler before all other handlers) loads the state
+  of the update's user once, so handlers never wait for the backend
+- writes (including in-place changes of state.data) are written behind in
+  batches every flush_interval seconds and on stop()
+Iteration and len() only see states cached by this worker.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from collections.abc import MutableMapping
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class UserState:
+    def __init__(self, state: str, data: dict = None):
+        self.state = state
+        self.data = data or {}
+
+def encode_state(value: UserState) -> str:
+    return json.dumps([value.state, value.data], separators=(',', ':'), ensure_ascii=False, default=str)
+
+def decode_state(payload: str) -> UserState:
+    state, data = json.loads(payload)
+    return UserState(state, data)
+
+class StateBackend:
+    """Base class for state storages. Calls are blocking, the store runs them in a thread."""
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def write(self, sets: Dict[str, str], deletes: List[str], ttl: float):
+        raise NotImplementedError
+
+    def cleanup(self) -> int:
+        return 0
+
+    def close(self):
+        pass
+
+class MemoryStateBackend(StateBackend):
+    """In-process storage, local stand-in for tests"""
+    def __init__(self):
+        self._items: Dict[str, Tuple[str, float]] = {}  # key -> (payload, expires_at)
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[1] <= time.time():
+            del self._items[key]
+            return None
+        return item[0]
+
+    def write(self, sets: Dict[str, str], deletes: List[str], ttl: float):
+        expires_at = time.time() + ttl
+        for key, payload in sets.items():
+            self._items[key] = (payload, expires_at)
+        for key in deletes:
+            self._items.pop(key, None)
+
+    def cleanup(self) -> int:
+        now = time.time()
+        expired = [key for key, (_, expires_at) in self._items.items() if expires_at <= now]
+        for key in expired:
+            del self._items[key]
+        return len(expired)
+
+class SQLiteStateBackend(StateBackend):
+    """States in a SQLite file shared by workers on one host/volume"""
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS conversation_states '
+                '(key TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT payload FROM conversation_states WHERE key = ? AND expires_at > ?',
+                (key, time.time())
+            ).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def write(self, sets: Dict[str, str], deletes: List[str], ttl: float):
+        expires_at = time.time() + ttl
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO conversation_states (key, payload, expires_at) VALUES (?, ?, ?)',
+                    [(key, payload, expires_at) for key, payload in sets.items()]
+                )
+                conn.executemany('DELETE FROM conversation_states WHERE key = ?', [(key,) for key in deletes])
+        finally:
+            conn.close()
+
+    def cleanup(self) -> int:
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute('DELETE FROM conversation_states WHERE expires_at <= ?', (time.time(),)).rowcount
+        finally:
+            conn.close()
+
+class RedisStateBackend(StateBackend):
+    """States in Redis (or compatible server), expiry by Redis itself"""
+    def __init__(self, url: str, prefix: str = 'ozon:state:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("STATE_BACKEND=redis requires the 'redis' package")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        payload = self._client.get(self.prefix + key)
+        return payload.decode('utf-8') if payload is not None else None
+
+    def write(self, sets: Dict[str, str], deletes: List[str], ttl: float):
+        pipe = self._client.pipeline(transaction=False)
+        for key, payload in sets.items():
+            pipe.set(self.prefix + key, payload, ex=max(1, int(ttl)))
+        if deletes:
+            pipe.delete(*[self.prefix + key for key in deletes])
+        pipe.execute()
+
+    def close(self):
+        self._client.close()
+
+def create_state_backend(kind: str, url: str = None) -> StateBackend:
+    """Create backend by STATE_BACKEND value"""
+    kind = (kind or 'memory').lower()
+    if kind == 'sqlite':
+        return SQLiteStateBackend(url or 'states.db')
+    if kind == 'redis':
+        return RedisStateBackend(url or 'redis://localhost:6379/0')
+    if kind != 'memory':
+        logger.warning(f"Unknown state backend '{kind}', using memory")
+    return MemoryStateBackend()
+
+_MISSING = object()
+
+class StateStore(MutableMapping):
+    def __init__(self, backend: StateBackend, ttl: float = 86400, flush_interval: float = 1.0,
+                 max_cached: int = 10000):
+        self.backend = backend
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_cached = max_cached
+        self._cache = OrderedDict()  # key -> UserState or None (known absent)
+        self._stored: Dict[Any, Optional[str]] = {}  # key -> payload last read/written
+        self._dirty = set()
+        self._writing = set()  # keys of the batch being written right now
+        self._task: Optional[asyncio.Task] = None
+
+    # Mapping interface used by handlers
+    def _cached(self, key):
+        value = self._cache.get(key, _MISSING)
+        if value is _MISSING:
+            # Not prefetched (e.g. state of another user): blocking read
+            payload = self.backend.get(str(key))
+            value = decode_state(payload) if payload is not None else None
+            self._remember(key, value, payload)
+            metrics.incr('state.sync_reads')
+        else:
+            self._cache.move_to_end(key)
+        return value
+
+    def __getitem__(self, key) -> UserState:
+        value = self._cached(key)
+        if value is None:
+            raise KeyError(key)
+        # Handlers change state.data in place: compare with stored copy on flush
+        self._dirty.add(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return self._cached(key) is not None
+
+    def __setitem__(self, key, value: UserState):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        self._dirty.add(key)
+        self._evict()
+
+    def __delitem__(self, key):
+        if self._cached(key) is None:
+            raise KeyError(key)
+        self._cache[key] = None
+        self._dirty.add(key)
+
+    def __iter__(self) -> Iterator:
+        return iter([key for key, value in self._cache.items() if value is not None])
+
+    def __len__(self) -> int:
+        return sum(1 for value in self._cache.values() if value is not None)
+
+    def _remember(self, key, value: Optional[UserState], payload: Optional[str]):
+        self._cache[key] = value
+        self._stored[key] = payload
+        self._evict()
+
+    def _evict(self):
+        # Only entries without pending writes can be dropped
+        while len(self._cache) > self.max_cached:
+            for key in self._cache:
+                if not self._pending(key):
+                    del self._cache[key]
+                    self._stored.pop(key, None)
+                    break
+            else:
+                return
+
+    # Loading and write-behind
+    def _pending(self, key) -> bool:
+        """Local state of key is newer than the backend's (unsaved or being written)"""
+        return key in self._dirty or key in self._writing
+
+    async def prefetch(self, key):
+        """Reload state of key from backend unless there are unsaved local changes"""
+        if self._pending(key):
+            return
+        try:
+            payload = await asyncio.to_thread(self.backend.get, str(key))
+        except Exception as e:
+            logger.error(f"Failed to load state of {key}: {e}")
+            return
+        if not self._pending(key):
+            self._remember(key, decode_state(payload) if payload is not None else None, payload)
+
+    async def prefetch_update(self, update: object, context=None):
+        """TypeHandler callback: load state of the update's user"""
+        user = getattr(update, 'effective_user', None)
+        if user:
+            await self.prefetch(user.id)
+
+    def _collect(self) -> Tuple[Dict[str, str], List[str], Dict[Any, Optional[str]]]:
+        sets, deletes, written = {}, [], {}
+        for key in self._dirty:
+            value = self._cache.get(key)
+            payload = encode_state(value) if value is not None else None
+            if payload == self._stored.get(key):
+                continue
+            if payload is None:
+                deletes.append(str(key))
+            else:
+                sets[str(key)] = payload
+            written[key] = payload
+        return sets, deletes, written
+
+    async def flush(self) -> int:
+        """Write changed states in one batch, return number of written keys"""
+        if not self._dirty:
+            return 0
+        sets, deletes, written = self._collect()
+        keys = set(self._dirty)
+        self._dirty.clear()
+        if not written:
+            return 0
+        # Until the write returns the backend still has old payloads: prefetch must not read them
+        self._writing |= keys
+        try:
+            await asyncio.to_thread(self.backend.write, sets, deletes, self.ttl)
+        except Exception as e:
+            logger.error(f"Failed to write {len(written)} states: {e}")
+            self._dirty |= keys
+            metrics.incr('state.write_errors')
+            return 0
+        finally:
+            self._writing -= keys
+        self._stored.update(written)
+        metrics.incr('state.writes', len(written))
+        return len(written)
+
+    async def _run(self):
+        last_cleanup = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.monotonic() - last_cleanup > 3600:
+                last_cleanup = time.monotonic()
+                try:
+                    await asyncio.to_thread(self.backend.cleanup)
+                except Exception as e:
+                    logger.error(f"State cleanup failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self.backend.close()
+
+    def stats(self) -> dict:
+        return {'cached': len(self._cache), 'pending': len(self._dirty)}
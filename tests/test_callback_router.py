@@ -0,0 +1,36 @@
+"""Tests for CallbackRouter"""
+
+import asyncio
+
+import pytest
+
+from callback_router import CallbackRouter, HandlerTimeout
+
+async def slow_handler(*args, **params):
+    await asyncio.sleep(1)
+
+def test_params_are_parsed():
+    router = CallbackRouter()
+    route = router.add('admin_ticket_close_{ticket_id:int}', slow_handler)
+    assert router.match('admin_ticket_close_12') == (route, {'ticket_id': 12})
+    assert router.match('admin_ticket_close_x') == (None, {})
+
+@pytest.mark.parametrize('navigation', [True, False])
+def test_timeout_carries_route(navigation):
+    router = CallbackRouter()
+    route = router.add('models_page_{page:int}', slow_handler, navigation=navigation, timeout=0.01)
+    with pytest.raises(HandlerTimeout) as info:
+        asyncio.run(router.dispatch('models_page_2'))
+    assert info.value.route is route
+    assert info.value.navigation is navigation
+
+def test_default_timeout_applies_to_navigation_only():
+    async def handler(*args, **params):
+        await asyncio.sleep(0.05)
+
+    router = CallbackRouter(default_timeout=0.01)
+    router.add('models_page_{page:int}', handler, navigation=True)
+    router.add('admin_ticket_close_{ticket_id:int}', handler)
+    with pytest.raises(HandlerTimeout):
+        asyncio.run(router.dispatch('models_page_2'))
+    assert asyncio.run(router.dispatch('admin_ticket_close_3')) is True
@@ -0,0 +1,22 @@
+"""Tests for OutboundDispatcher pacing"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('telegram')
+
+from outbound import OutboundDispatcher
+
+def test_bulk_waits_while_interactive_request_waits():
+    dispatcher = OutboundDispatcher(global_rate=100, view_cache=None)
+
+    async def run():
+        dispatcher._interactive_waiting = 1
+        bulk = asyncio.create_task(dispatcher._take_global('bulk'))
+        await asyncio.sleep(0.15)
+        assert not bulk.done()
+        dispatcher._interactive_waiting = 0
+        await asyncio.wait_for(bulk, 1)
+
+    asyncio.run(run())
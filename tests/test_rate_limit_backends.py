@@ -0,0 +1,42 @@
+"""Tests for token bucket backends"""
+
+import asyncio
+
+import pytest
+
+from rate_limit_backends import LocalBucketBackend, SQLiteBucketBackend, create_bucket_backend
+
+@pytest.fixture(params=['local', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteBucketBackend(str(tmp_path / 'rate_limits.db'))
+    return LocalBucketBackend()
+
+def take(backend, key='chat', rate=1.0, capacity=3):
+    return asyncio.run(backend.take(key, rate, capacity))
+
+def test_burst_then_wait(backend):
+    assert [take(backend) for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = take(backend)
+    assert 0 < wait <= 1.0
+
+def test_keys_are_independent(backend):
+    for _ in range(3):
+        take(backend, 'a')
+    assert take(backend, 'a') > 0
+    assert take(backend, 'b') == 0.0
+
+def test_tokens_refill(backend):
+    for _ in range(3):
+        take(backend, rate=100)
+    asyncio.run(asyncio.sleep(0.05))
+    assert take(backend, rate=100) == 0.0
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    path = str(tmp_path / 'rate_limits.db')
+    first, second = SQLiteBucketBackend(path), SQLiteBucketBackend(path)
+    assert take(first, capacity=1) == 0.0
+    assert take(second, capacity=1) > 0
+
+def test_unknown_backend_falls_back_to_local():
+    assert isinstance(create_bucket_backend('memcached'), LocalBucketBackend)
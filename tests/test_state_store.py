@@ -0,0 +1,41 @@
+"""Tests for StateStore"""
+
+import asyncio
+import time
+
+from state_store import MemoryStateBackend, StateStore, UserState
+
+class SlowBackend(MemoryStateBackend):
+    """Write becomes visible only after a delay, like a slow shared database"""
+    def write(self, sets, deletes, ttl):
+        time.sleep(0.05)
+        super().write(sets, deletes, ttl)
+
+def test_prefetch_during_flush_keeps_newer_state():
+    store = StateStore(SlowBackend())
+
+    async def scenario():
+        store[1] = UserState('STEP_1')
+        await store.flush()
+        store[1] = UserState('STEP_2')
+        flush = asyncio.create_task(store.flush())
+        await asyncio.sleep(0.01)
+        # The backend still holds STEP_1 while STEP_2 is being written
+        await store.prefetch(1)
+        assert store[1].state == 'STEP_2'
+        await flush
+
+    asyncio.run(scenario())
+
+def test_flush_writes_changed_data_only():
+    store = StateStore(MemoryStateBackend())
+
+    async def scenario():
+        store[1] = UserState('SEARCH', {'page': 1})
+        assert await store.flush() == 1
+        store[1]
+        assert await store.flush() == 0
+        store[1].data['page'] = 2
+        assert await store.flush() == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,29 @@
+"""Tests for UpdateDeduplicator"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('telegram')
+pytest.importorskip('sqlalchemy')
+
+from update_dedup import UpdateDeduplicator
+
+def test_second_copy_is_duplicate():
+    dedup = UpdateDeduplicator()
+
+    async def run():
+        return [await dedup.is_duplicate(update_id) for update_id in (1, 2, 1)]
+
+    assert asyncio.run(run()) == [False, False, True]
+    assert dedup.stats() == {'tracked': 2, 'suppressed': 1}
+
+def test_cleanup_task_needs_persistence():
+    dedup = UpdateDeduplicator()
+
+    async def run():
+        dedup.start()
+        assert dedup._task is None
+        await dedup.stop()
+
+    asyncio.run(run())
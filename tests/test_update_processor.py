@@ -0,0 +1,91 @@
+"""Tests for PerUserUpdateProcessor"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('telegram')
+
+from update_processor import PerUserUpdateProcessor
+
+def test_new_processor_has_no_waiting_updates():
+    processor = PerUserUpdateProcessor(4)
+    assert processor.waiting == 0
+    assert processor.user_wait_stats() == {}
+
+def test_process_update_runs_coroutine():
+    processor = PerUserUpdateProcessor(4)
+    done = []
+
+    async def handler():
+        done.append(True)
+
+    asyncio.run(processor.process_update(object(), handler()))
+    assert done == [True]
+    assert processor.waiting == 0
+
+def test_updates_behind_own_user_lock_do_not_count_as_slot_waiters():
+    processor = PerUserUpdateProcessor(4)
+    processor.lock_keys = lambda update: [('user', 1)]
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler():
+            await release.wait()
+
+        tasks = [asyncio.create_task(processor.process_update(object(), handler())) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        # One update runs, four wait for the same user's lock
+        assert processor.waiting == 4
+        assert processor.slot_waiting == 0
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+def test_cancelled_navigation_click_is_answered():
+    processor = PerUserUpdateProcessor(4, coalesce_key=lambda update: ('chat', 1))
+    answered = []
+
+    class Query:
+        def __init__(self, name):
+            self.name = name
+
+        async def answer(self):
+            answered.append(self.name)
+
+    class Click:
+        def __init__(self, name):
+            self.callback_query = Query(name)
+
+    async def scenario():
+        async def slow():
+            await asyncio.sleep(1)
+
+        async def fast():
+            pass
+
+        first = asyncio.create_task(processor.process_update(Click('old'), slow()))
+        await asyncio.sleep(0.01)
+        await processor.process_update(Click('new'), fast())
+        await first
+
+    asyncio.run(scenario())
+    assert answered == ['old']
+
+def test_concurrency_is_limited_by_own_slots():
+    processor = PerUserUpdateProcessor(2)
+    running, peak = [0], [0]
+
+    async def handler():
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+
+    async def scenario():
+        await asyncio.gather(*(processor.process_update(object(), handler()) for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert peak[0] == 2
@@ -0,0 +1,33 @@
+"""Tests for ViewCache"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('telegram')
+
+from view_cache import ViewCache, render_hashes
+
+EDIT = {'chat_id': 1, 'message_id': 2, 'text': 'menu'}
+
+def test_unchanged_edit_is_skipped():
+    cache = ViewCache()
+    cache.put((1, 2), *render_hashes(EDIT))
+    sent = []
+
+    async def send(endpoint, args):
+        sent.append(endpoint)
+
+    assert asyncio.run(cache.handle('editMessageText', ('editMessageText', EDIT), EDIT, send)) is True
+    assert sent == []
+
+def test_cancelled_edit_forgets_view():
+    cache = ViewCache()
+    cache.put((1, 2), *render_hashes({'chat_id': 1, 'message_id': 2, 'text': 'old'}))
+
+    async def send(endpoint, args):
+        raise asyncio.CancelledError
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cache.handle('editMessageText', ('editMessageText', EDIT), EDIT, send))
+    assert cache.get((1, 2)) is None
@@ -0,0 +1,28 @@
+"""Tests for WebhookServer request handling"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('telegram')
+
+from webhook_server import WebhookServer
+
+def request(server, raw: bytes) -> tuple:
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await server._handle_request(reader)
+    return asyncio.run(run())
+
+def test_metrics_need_configured_token():
+    server = WebhookServer(None, 0, webhook_path=None)
+    assert request(server, b'GET /metrics HTTP/1.1\r\n\r\n')[0] == 403
+
+def test_metrics_with_token():
+    server = WebhookServer(None, 0, webhook_path=None, metrics_token='secret')
+    assert request(server, b'GET /metrics HTTP/1.1\r\n\r\n')[0] == 403
+    assert request(server, b'GET /metrics?token=wrong HTTP/1.1\r\n\r\n')[0] == 403
+    assert request(server, b'GET /metrics?token=secret HTTP/1.1\r\n\r\n')[0] == 200
+    assert request(server, b'GET /metrics HTTP/1.1\r\nAuthorization: Bearer secret\r\n\r\n')[0] == 200
@@ -29,6 +29,22 @@ TEXTS = {
         'download_recipes_package': "⬇️ Скачать все рецепты",
         'recipes_package_sent': "Комплект рецептов отправлен.",
         
+        # Background tasks
+        'task_queued': "⏳ {title}: в очереди...",
+        'task_running': "⏳ {title}: отправляем...",
+        'task_progress': "⏳ {title}: {done}/{total}",
+        'task_done': "✅ {title}: готово.",
+        'task_cancelled': "❌ {title}: отменено.",
+        'task_failed': "⚠️ {title}: ошибка при отправке.",
+        'task_cancel': "❌ Отменить",
+        'task_already_running': "Уже отправляется, дождитесь завершения.",
+        'task_busy': "Сервер занят, попробуйте позже.",
+        'task_not_found': "Задача уже завершена.",
+        'too_many_requests': "Слишком много запросов, подождите немного.",
+        'server_busy': "Бот сейчас перегружен, попробуйте через минуту.",
+        'package_title': "Комплект инструкций «{name}»",
+        'recipes_package_title': "Комплект рецептов «{name}»",
+        
         # Support
         'support': "❓ Задать вопрос",
         'support_question': "Опишите ваш вопрос или прикрепите фото/видео. Мы поможем!\n\n❗️ Пожалуйста, напишите подробно.",
@@ -45,6 +61,21 @@ TEXTS = {
         'search_prompt': "Введите название модели для поиска:",
         'search_results': "Результаты поиска для '{query}':",
         'no_search_results': "По вашему запросу ничего не найдено.",
+        'search_expired': "Результаты поиска устарели. Введите запрос ещё раз:",
+        
+        # Catalog
+        'browse_catalog': "🗂 Каталог",
+        'catalog_root': "Выберите раздел каталога:",
+        'catalog_node': "🗂 {path}",
+        'catalog_subtree': "🗂 {path}\n\nВсе модели раздела ({count}):",
+        'catalog_all_models': "📋 Все модели раздела",
+        'model_category_prompt': "Введите раздел каталога через / (например: Кухонные машины / LAC) или /skip для пропуска:",
+        
+        # Tags
+        'browse_tags': "🏷️ По тегам",
+        'tags_list': "Выберите тег:",
+        'tag_models': "Модели с тегом <b>{tag}</b> ({count}):",
+        'no_tags': "Теги пока не добавлены.",
         
         # Navigation
         'back': "⬅️ Назад",
@@ -59,6 +90,7 @@ TEXTS = {
         'admin_recipes': "🍽️ Рецепты",
         'admin_tickets': "🎫 Обращения",
         'admin_settings': "⚙️ Настройки",
+        'admin_metrics': "📈 Метрики",
         
         # Admin - Models
         'add_model': "➕ Добавить модель",
@@ -67,6 +99,7 @@ TEXTS = {
         'model_name_prompt': "Введите название модели:",
         'model_description_prompt': "Введите описание модели (или /skip для пропуска):",
         'model_tags_prompt': "Введите теги через запятую (или /skip для пропуска):",
+        'model_codes_prompt': "Введите артикулы/SKU маркетплейса через запятую (или /skip для пропуска):",
         'model_created': "Модель '{name}' создана!",
         'model_updated': "Модель '{name}' обновлена!",
         'model_deleted': "Модель '{name}' удалена!",
@@ -123,6 +156,10 @@ TEXTS = {
         
         # Errors
         'error_occurred': "Произошла ошибка. Пожалуйста, попробуйте позже.",
+        'request_timeout': "⏳ Запрос выполнялся слишком долго. Попробуйте ещё раз.",
+        'request_timeout_check': "⏳ Запрос выполнялся слишком долго. Действие могло быть выполнено — проверьте результат, прежде чем повторять.",
+        'retry': "🔄 Повторить",
+        'to_main_menu': "🏠 Главное меню",
         'access_denied': "У вас нет прав для выполнения этой команды.",
         'invalid_input': "Неверный ввод. Попробуйте еще раз.",
         'file_too_large': "Файл слишком большой. Максимальный размер: {size}MB",
@@ -159,6 +196,22 @@ TEXTS = {
         'download_package': "⬇️ Download Package",
         'package_sent': "Instruction package sent.",
         
+        # Background tasks
+        'task_queued': "⏳ {title}: queued...",
+        'task_running': "⏳ {title}: sending...",
+        'task_progress': "⏳ {title}: {done}/{total}",
+        'task_done': "✅ {title}: done.",
+        'task_cancelled': "❌ {title}: cancelled.",
+        'task_failed': "⚠️ {title}: sending failed.",
+        'task_cancel': "❌ Cancel",
+        'task_already_running': "Already sending, please wait until it finishes.",
+        'task_busy': "Server is busy, please try again later.",
+        'task_not_found': "Task has already finished.",
+        'too_many_requests': "Too many requests, please wait a moment.",
+        'server_busy': "The bot is overloaded right now, please try again in a minute.",
+        'package_title': "Instruction package \"{name}\"",
+        'recipes_package_title': "Recipe package \"{name}\"",
+        
         # Support
         'support': "❓ Ask Question",
         'support_question': "Describe your question or attach photo/video. We'll help!\n\n❗️ Please be detailed.",
@@ -175,6 +228,21 @@ TEXTS = {
         'search_prompt': "Enter model name to search:",
         'search_results': "Search results for '{query}':",
         'no_search_results': "Nothing found for your query.",
+        'search_expired': "Search results have expired. Please enter your query again:",
+        
+        # Catalog
+        'browse_catalog': "🗂 Catalog",
+        'catalog_root': "Choose a catalog section:",
+        'catalog_node': "🗂 {path}",
+        'catalog_subtree': "🗂 {path}\n\nAll models in section ({count}):",
+        'catalog_all_models': "📋 All models in section",
+        'model_category_prompt': "Enter catalog section separated by / (e.g. Kitchen machines / LAC) or /skip to skip:",
+        
+        # Tags
+        'browse_tags': "🏷️ By Tags",
+        'tags_list': "Choose a tag:",
+        'tag_models': "Models tagged <b>{tag}</b> ({count}):",
+        'no_tags': "No tags yet.",
         
         # Navigation
         'back': "⬅️ Back",
@@ -188,6 +256,7 @@ TEXTS = {
         'admin_instructions': "📄 Instructions",
         'admin_tickets': "🎫 Tickets",
         'admin_settings': "⚙️ Settings",
+        'admin_metrics': "📈 Metrics",
         
         # Admin - Models
         'add_model': "➕ Add Model",
@@ -196,6 +265,7 @@ TEXTS = {
         'model_name_prompt': "Enter model name:",
         'model_description_prompt': "Enter model description (or /skip to skip):",
         'model_tags_prompt': "Enter tags separated by commas (or /skip to skip):",
+        'model_codes_prompt': "Enter marketplace article numbers/SKUs separated by commas (or /skip to skip):",
         'model_created': "Model '{name}' created!",
         'model_updated': "Model '{name}' updated!",
         'model_deleted': "Model '{name}' deleted!",
@@ -233,6 +303,10 @@ TEXTS = {
         
         # Errors
         'error_occurred': "An error occurred. Please try again later.",
+        'request_timeout': "⏳ The request took too long. Please try again.",
+        'request_timeout_check': "⏳ The request took too long. The action may have been completed, please check the result before repeating it.",
+        'retry': "🔄 Retry",
+        'to_main_menu': "🏠 Main menu",
         'access_denied': "You don't have permission to perform this action.",
         'invalid_input': "Invalid input. Please try again.",
         'file_too_large': "File too large. Maximum size: {size}MB",
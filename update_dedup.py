@@ -0,0 +1,128 @@
+"""
+De-duplication of Telegram updates by update_id.
+Webhook redeliveries and polling restarts can bring the same update twice;
+a replay would create a second ticket or send a second admin reply.
+Processed ids are kept for a time window in a bounded in-memory map, and
+optionally in the processed_updates table so restarts do not forget them.
+Database writes run in a thread, and old rows are pruned by a background
+task every cleanup_interval seconds (start()/stop()).
+Registered as TypeHandler in group -1: duplicates stop before any handler.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from metrics import metrics
+from models import ProcessedUpdate, get_session
+
+logger = logging.getLogger(__name__)
+
+class UpdateDeduplicator:
+    def __init__(self, window: float = 3600, max_entries: int = 50000, persist: bool = False,
+                 cleanup_interval: float = 600):
+        self.window = window
+        self.max_entries = max_entries
+        self.persist = persist
+        self.cleanup_interval = cleanup_interval
+        self._seen = OrderedDict()  # update_id -> monotonic time
+        self.suppressed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def _expire(self, now: float):
+        while self._seen:
+            update_id, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.window and len(self._seen) <= self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def _persist_seen(self, update_id: int) -> bool:
+        """Record update_id in database, return True if it was already there"""
+        db = get_session()
+        try:
+            db.add(ProcessedUpdate(update_id=update_id))
+            db.commit()
+            return False
+        except IntegrityError:
+            db.rollback()
+            return True
+        finally:
+            db.close()
+
+    def seen(self, update_id: int) -> bool:
+        """True if update_id was already processed by this worker (does not record it)"""
+        seen_at = self._seen.get(update_id)
+        return seen_at is not None and time.monotonic() - seen_at <= self.window
+
+    async def is_duplicate(self, update_id: int) -> bool:
+        """Check update_id and remember it as processed"""
+        now = time.monotonic()
+        self._expire(now)
+        # Remembered before the database write, so a concurrent copy is caught in memory
+        duplicate = update_id in self._seen
+        self._seen[update_id] = now
+        if not duplicate and self.persist:
+            try:
+                duplicate = await asyncio.to_thread(self._persist_seen, update_id)
+            except Exception as e:
+                # Never drop updates because of the journal
+                logger.error(f"Failed to record update {update_id}: {e}")
+        if duplicate:
+            self.suppressed += 1
+            metrics.incr('updates.duplicates')
+        return duplicate
+
+    def cleanup(self) -> int:
+        """Delete persisted ids older than window"""
+        if not self.persist:
+            return 0
+        db = get_session()
+        try:
+            cutoff_date = datetime.utcnow() - timedelta(seconds=self.window)
+            count = db.query(ProcessedUpdate).filter(
+                ProcessedUpdate.created_at < cutoff_date
+            ).delete(synchronize_session=False)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            try:
+                count = await asyncio.to_thread(self.cleanup)
+                if count:
+                    logger.info(f"Deleted {count} processed update ids")
+            except Exception as e:
+                logger.error(f"Processed updates cleanup failed: {e}")
+            await asyncio.sleep(self.cleanup_interval)
+
+    def start(self):
+        """Start periodic cleanup of persisted ids (first run at once)"""
+        if self.persist and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {'tracked': len(self._seen), 'suppressed': self.suppressed}
+
+    async def check_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """TypeHandler callback (group -1): stop duplicate updates"""
+        if isinstance(update, Update) and await self.is_duplicate(update.update_id):
+            logger.warning(f"Duplicate update {update.update_id} suppressed")
+            raise ApplicationHandlerStop
@@ -0,0 +1,219 @@
+"""
+Concurrent update processing with per-user ordering.
+Updates of different users run concurrently (up to max_concurrent_updates),
+updates of one user and of one chat run strictly one after another, so
+user_states and the admin wizards never see interleaved steps.
+
+Latest-wins coalescing: coalesce_key(update) returns a key (e.g. chat and
+message of a navigation button) or None. A newer update with the same key
+cancels the older one if it is running and makes it skip if it still waits,
+so rapid "next page" taps cost one query and one edit. Callback queries of
+cancelled and skipped updates are answered, so no button keeps spinning.
+
+With an admission controller set, shed updates are dropped before they
+wait for locks or concurrency slots, and admin updates do not wait for a
+concurrency slot at all (see admission).
+
+All of this lives in do_process_update, the extension point of
+BaseUpdateProcessor; process_update of the base class is left alone.
+Its semaphore only caps updates in flight (max_pending): concurrency is
+limited by the processor's own semaphore, taken after the per-user locks,
+so updates waiting for their turn do not occupy concurrency slots.
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class _KeyedLock:
+    """Lock that is dropped from registry when nobody holds or waits for it"""
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int, top_waits: int = 10,
+                 coalesce_key: Optional[Callable[[object], Optional[tuple]]] = None,
+                 max_pending: int = 10000):
+        super().__init__(max(max_pending, max_concurrent_updates))
+        self.concurrency = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.top_waits = top_waits
+        self.coalesce_key = coalesce_key
+        self._generations: Dict[tuple, int] = {}  # coalesce key -> newest generation
+        self._running: Dict[tuple, asyncio.Task] = {}
+        self.admission = None  # AdmissionController, set after application is built
+        self._locks: Dict[tuple, _KeyedLock] = {}
+        self._waiting = 0
+        self._slot_waiting = 0
+        self._user_waits: Dict[int, List[float]] = {}  # user_id -> [count, total, max]
+
+    @property
+    def waiting(self) -> int:
+        """Updates waiting for their user lock or a concurrency slot"""
+        return self._waiting
+
+    @property
+    def slot_waiting(self) -> int:
+        """Updates waiting for a concurrency slot. Updates queued behind their own
+        user's lock are not counted: one user flooding buttons only delays themselves."""
+        return self._slot_waiting
+
+    async def initialize(self) -> None:
+        metrics.register_provider('update_wait_by_user', self.user_wait_stats)
+
+    async def shutdown(self) -> None:
+        pass
+
+    @staticmethod
+    def lock_keys(update: object) -> List[tuple]:
+        """Serialization keys: user first, then chat (fixed order, no deadlocks)"""
+        if not isinstance(update, Update):
+            return []
+        keys = []
+        if update.effective_user:
+            keys.append(('user', update.effective_user.id))
+        if update.effective_chat and (not update.effective_user or update.effective_chat.id != update.effective_user.id):
+            keys.append(('chat', update.effective_chat.id))
+        return keys
+
+    def _acquire_entry(self, key: tuple) -> _KeyedLock:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _KeyedLock()
+        entry.users += 1
+        return entry
+
+    def _release_entry(self, key: tuple, entry: _KeyedLock):
+        entry.users -= 1
+        if entry.users == 0:
+            del self._locks[key]
+
+    def _record_wait(self, user_id: Optional[int], seconds: float):
+        metrics.observe('updates.queue_wait', seconds)
+        if user_id is None:
+            return
+        stats = self._user_waits.setdefault(user_id, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+        if len(self._user_waits) > 1000:
+            # Keep only users with the longest waits
+            keep = heapq.nlargest(self.top_waits * 10, self._user_waits.items(), key=lambda item: item[1][2])
+            self._user_waits = dict(keep)
+
+    def user_wait_stats(self) -> dict:
+        """Users with longest queue waits"""
+        top = heapq.nlargest(self.top_waits, self._user_waits.items(), key=lambda item: item[1][2])
+        return {
+            str(user_id): {'count': count, 'avg': total / count if count else 0.0, 'max': max_value}
+            for user_id, (count, total, max_value) in top
+        }
+
+    def _supersede(self, key: Optional[tuple]) -> Optional[int]:
+        """Register newest update for key, cancel the running older one"""
+        if key is None:
+            return None
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+        running = self._running.get(key)
+        if running and not running.done():
+            running.cancel()
+            metrics.incr('updates.coalesced_cancelled')
+        return generation
+
+    @staticmethod
+    async def _answer(update: object):
+        """Superseded update's callback query still needs an answer"""
+        query = getattr(update, 'callback_query', None)
+        if query:
+            try:
+                await query.answer()
+            except TelegramError:
+                # Already answered by the handler before it was cancelled
+                pass
+
+    async def _skip(self, update: object, coroutine: Awaitable[Any]):
+        """Drop superseded update"""
+        coroutine.close()
+        metrics.incr('updates.coalesced_skipped')
+        await self._answer(update)
+
+    async def _run_latest(self, key: Optional[tuple], generation: Optional[int],
+                          update: object, coroutine: Awaitable[Any]):
+        if key is None:
+            await coroutine
+            return
+        if self._generations.get(key) != generation:
+            await self._skip(update, coroutine)
+            return
+        task = asyncio.ensure_future(coroutine)
+        self._running[key] = task
+        try:
+            await task
+        except asyncio.CancelledError:
+            # Cancelled by a newer update with the same key, not by shutdown
+            if not task.cancelled() or asyncio.current_task().cancelling():
+                raise
+            await self._answer(update)
+        finally:
+            if self._running.get(key) is task:
+                del self._running[key]
+            if self._generations.get(key) == generation:
+                del self._generations[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Per-user locks are taken before a concurrency slot, so updates waiting
+        # for their turn do not occupy slots
+        if self.admission and not self.admission.admit(update):
+            coroutine.close()
+            await self.admission.reject(update)
+            return
+        # Admins are few: their updates skip the slot queue behind customer clicks
+        priority = bool(self.admission and self.admission.is_priority(update))
+        coalesce_key = self.coalesce_key(update) if self.coalesce_key else None
+        generation = self._supersede(coalesce_key)
+        keys = self.lock_keys(update)
+        entries = [self._acquire_entry(key) for key in keys]
+        acquired = []
+        started = time.monotonic()
+        self._set_waiting(+1)
+        try:
+            try:
+                for entry in entries:
+                    await entry.lock.acquire()
+                    acquired.append(entry)
+                if not priority:
+                    self._slot_waiting += 1
+                    try:
+                        await self._slots.acquire()
+                    finally:
+                        self._slot_waiting -= 1
+            finally:
+                self._set_waiting(-1)
+            try:
+                user_id = keys[0][1] if keys and keys[0][0] == 'user' else None
+                self._record_wait(user_id, time.monotonic() - started)
+                await self._run_latest(coalesce_key, generation, update, coroutine)
+            finally:
+                if not priority:
+                    self._slots.release()
+        finally:
+            for entry in acquired:
+                entry.lock.release()
+            for key, entry in zip(keys, entries):
+                self._release_entry(key, entry)
+
+    def _set_waiting(self, delta: int):
+        self._waiting += delta
+        metrics.set_gauge('updates.waiting', self._waiting)
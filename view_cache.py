@@ -0,0 +1,136 @@
+"""
+Rendered-view cache for message edits.
+Remembers hash of the last text and markup rendered into each message
+(bounded LRU), so the outbound dispatcher can:
+- skip editMessageText that would not change anything
+- send editMessageReplyMarkup when only buttons changed
+- treat "message is not modified" from Telegram as success
+Skipped edits return True, like edits of inline messages do.
+The cache is per process: with several replicas route updates of a user to
+one replica or pass view_cache=None to the dispatcher.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from telegram.error import BadRequest
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+VIEW_ENDPOINTS = {'sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'deleteMessage'}
+_ADDRESS_KEYS = ('chat_id', 'message_id', 'inline_message_id')
+# Parameters that affect how message text looks
+_TEXT_KEYS = ('text', 'parse_mode', 'entities', 'link_preview_options', 'disable_web_page_preview')
+
+def _serialize(value: Any) -> Any:
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [_serialize(item) for item in value]
+    return value
+
+def _digest(value: Any) -> str:
+    raw = json.dumps(_serialize(value), sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=12).hexdigest()
+
+def view_key(data: dict) -> Optional[tuple]:
+    """Message address from request data"""
+    if data.get('inline_message_id'):
+        return ('inline', data['inline_message_id'])
+    if data.get('chat_id') is not None and data.get('message_id') is not None:
+        return (data['chat_id'], data['message_id'])
+    return None
+
+def render_hashes(data: dict) -> Tuple[str, str]:
+    """(text hash, markup hash) of send/edit request"""
+    content = {k: data.get(k) for k in _TEXT_KEYS}
+    return _digest(content), _digest(data.get('reply_markup'))
+
+def is_not_modified(error: Exception) -> bool:
+    return isinstance(error, BadRequest) and 'message is not modified' in str(error).lower()
+
+class ViewCache:
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (text hash, markup hash)
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, text_hash: Optional[str], markup_hash: str):
+        with self._lock:
+            self._entries[key] = (text_hash, markup_hash)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {'entries': len(self._entries), 'max_entries': self.max_entries}
+
+    async def handle(self, endpoint: str, args: tuple, data: dict,
+                     send: Callable[[str, tuple], Awaitable[Any]]):
+        """Process view request. send(endpoint, args) performs the actual API call;
+        args is (endpoint, data) as passed by the bot to its rate limiter."""
+        if endpoint == 'sendMessage':
+            result = await send(endpoint, args)
+            if isinstance(result, dict) and 'message_id' in result:
+                self.put((data.get('chat_id'), result['message_id']), *render_hashes(data))
+            return result
+
+        key = view_key(data)
+        if key is None:
+            return await send(endpoint, args)
+        if endpoint == 'deleteMessage':
+            self.forget(key)
+            return await send(endpoint, args)
+
+        text_hash, markup_hash = render_hashes(data)
+        cached = self.get(key)
+        if endpoint == 'editMessageReplyMarkup':
+            text_hash = cached[0] if cached else None
+            if cached and cached[1] == markup_hash:
+                metrics.incr('view_cache.skipped')
+                return True
+        elif cached == (text_hash, markup_hash):
+            metrics.incr('view_cache.skipped')
+            return True
+        elif cached and cached[0] == text_hash and len(args) == 2 and args[0] == endpoint:
+            # Only buttons changed: lighter request
+            endpoint = 'editMessageReplyMarkup'
+            markup_data = {k: v for k, v in data.items() if k in _ADDRESS_KEYS or k == 'reply_markup'}
+            args = (endpoint, markup_data)
+            metrics.incr('view_cache.markup_only')
+
+        try:
+            result = await send(endpoint, args)
+        except BadRequest as e:
+            if not is_not_modified(e):
+                self.forget(key)
+                raise
+            metrics.incr('view_cache.not_modified')
+            result = True
+        except BaseException:
+            # Cancelled, timed out or network error: the edit may or may not
+            # have been applied, so the cached view can not be trusted
+            self.forget(key)
+            raise
+        self.put(key, text_hash, markup_hash)
+        return result
+
+view_cache = ViewCache()
+metrics.register_provider('view_cache', view_cache.stats)
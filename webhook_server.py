@@ -0,0 +1,130 @@
+"""
+Minimal asyncio HTTP server for webhook, health and metrics on one port.
+- POST <webhook path>: checks X-Telegram-Bot-Api-Secret-Token, parses update,
+  puts it into the application's bounded update_queue and answers 200 at once.
+  A full queue answers 503 so Telegram redelivers later (backpressure).
+- GET /health, GET /: liveness
+- GET /metrics: metrics.format_text(), only with the metrics token
+  (Authorization: Bearer <token> or ?token=<token>); without a configured
+  token metrics are not served, as they contain per-user data
+Handler latency never blocks the HTTP side: updates are processed by the
+application from the queue.
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+from typing import Optional
+from urllib.parse import parse_qs
+
+from telegram import Update
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1024 * 1024
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+class WebhookServer:
+    def __init__(self, application, port: int, host: str = '0.0.0.0',
+                 webhook_path: Optional[str] = '/webhook', secret_token: Optional[str] = None,
+                 metrics_token: Optional[str] = None):
+        """webhook_path=None serves only health and metrics (polling mode)"""
+        self.application = application
+        self.port = port
+        self.host = host
+        self.webhook_path = webhook_path
+        self.secret_token = secret_token
+        self.metrics_token = metrics_token
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"HTTP server started on port {self.port}"
+                    + (f", webhook at {self.webhook_path}" if self.webhook_path else ""))
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            logger.info("HTTP server stopped")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, body = await asyncio.wait_for(self._handle_request(reader), timeout=10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            status, body = 400, b''
+        except Exception as e:
+            logger.error(f"HTTP server error: {e}")
+            status, body = 400, b''
+        try:
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: text/plain; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader: asyncio.StreamReader) -> tuple:
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        method, target, _ = request_line.split(' ', 2)
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        path, _, query = target.partition('?')
+
+        if method == 'GET' and path in ('/health', '/'):
+            return 200, b'OK'
+        if method == 'GET' and path == '/metrics':
+            if not self._metrics_allowed(headers, query):
+                metrics.incr('metrics.forbidden')
+                return 403, b''
+            return 200, metrics.format_text().encode('utf-8')
+        if not self.webhook_path or path != self.webhook_path:
+            return 404, b''
+        if method != 'POST':
+            return 405, b''
+
+        if self.secret_token and not hmac.compare_digest(
+            headers.get('x-telegram-bot-api-secret-token', ''), self.secret_token
+        ):
+            metrics.incr('webhook.forbidden')
+            return 403, b''
+        length = int(headers.get('content-length', '0'))
+        if length > MAX_BODY_SIZE:
+            return 413, b''
+        body = await reader.readexactly(length)
+        return self._enqueue(json.loads(body))
+
+    def _metrics_allowed(self, headers: dict, query: str) -> bool:
+        if not self.metrics_token:
+            return False
+        auth = headers.get('authorization', '')
+        token = auth[7:] if auth.startswith('Bearer ') else parse_qs(query).get('token', [''])[0]
+        return hmac.compare_digest(token.encode('utf-8'), self.metrics_token.encode('utf-8'))
+
+    def _enqueue(self, data: dict) -> tuple:
+        update = Update.de_json(data, self.application.bot)
+        queue = self.application.update_queue
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram retries non-2xx responses later
+            metrics.incr('webhook.queue_full')
+            return 503, b''
+        metrics.incr('webhook.accepted')
+        metrics.set_gauge('webhook.queue_depth', queue.qsize())
+        return 200, b''